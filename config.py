@@ -43,6 +43,19 @@ HELP_URL = BASE_HELP_URL + 'qgis_geocoder_v1.3.pdf'
 
 # path to config file location
 DEFAULT_FILE = os.path.join(expanduser("~"), "bkg_geocoder.cfg")
+# path to the persisted cache of reverse geocoding replies
+REVERSE_CACHE_FILE = os.path.join(expanduser("~"),
+                                  "bkg_geocoder_reverse_cache.json")
+# path to the persisted capabilities of the geocoding services
+CAPABILITY_CACHE_FILE = os.path.join(expanduser("~"),
+                                     "bkg_geocoder_capabilities.json")
+# path to the recorded requests to the service and their responses (rotated
+# files are numbered, e.g. "bkg_geocoder_traffic.jsonl.1")
+TRAFFIC_FILE = os.path.join(expanduser("~"), "bkg_geocoder_traffic.jsonl")
+# path to the directory the metrics of the geocoding runs are exported to
+METRICS_PATH = os.path.join(expanduser("~"), "bkg_geocoder_metriken")
+# path to the directory the profiles of the geocoding runs are written to
+PROFILE_PATH = os.path.join(expanduser("~"), "bkg_geocoder_profile")
 DEFAULT_STYLE = os.path.join(
     STYLE_PATH, 'BKG_Layerstil_nach_Trefferbewertung.qml')
 
@@ -87,7 +100,59 @@ class Config(object):
         'rs': '',
         'output_style': DEFAULT_STYLE,
         'result_fields': [],
-        'load_background': True
+        'load_background': True,
+        # edge length of the grid cells of the reverse cache in meters
+        'reverse_cache_grid': 1,
+        'reverse_cache_size': 10000,
+        'reverse_cache_persist': False,
+        # results of the session near dragged features shown before the
+        # service replies (max. number and distance in meters)
+        'local_candidates_count': 5,
+        'local_candidates_distance': 100,
+        # time in ms the mouse has to rest while dragging a feature to
+        # preview the reverse geocoding results, 0 to disable the preview
+        'reverse_preview_delay': 300,
+        # derive request timeouts from the observed latencies of the service
+        # (opt-in, fixed timeouts otherwise)
+        'adaptive_timeout': False,
+        # send duplicates of slow interactive requests (optionally to an
+        # alternative service url), opt-in as it adds traffic to the service
+        'hedge_interactive': False,
+        'hedge_url': '',
+        # additional services the requests are spread across (together with
+        # the service given by api key/url), list of dicts with "key" or
+        # "url" and optionally "max_concurrent" (max. parallel requests)
+        'endpoints': [],
+        'endpoint_max_concurrent': 4,
+        # seconds between the probes of the health of the services
+        'endpoint_probe_interval': 300,
+        # send a simplified spatial filter (max. number of vertices) and
+        # filter the results by the exact area locally
+        'spatial_filter_simplify': True,
+        'spatial_filter_max_vertices': 500,
+        # max. number of candidates requested and kept per feature in
+        # geocoding runs and when reverse geocoding interactively,
+        # 0 for the limit of the service
+        'bulk_result_count': 0,
+        'reverse_result_count': 0,
+        # record all requests to the service and their responses into
+        # TRAFFIC_FILE (max. size per file in MB, number of rotated files)
+        'record_traffic': False,
+        'record_traffic_max_size': 50,
+        'record_traffic_backups': 5,
+        # serve the requests from a recording (path to the JSONL file) instead
+        # of the service, optionally delayed by the recorded latencies
+        'replay_traffic': '',
+        'replay_traffic_realtime': False,
+        # export the metrics of every geocoding run as json and csv into
+        # METRICS_PATH
+        'export_metrics': False,
+        # profile the geocoding runs into PROFILE_PATH, mode "timers" (times
+        # of the phases only), "sampling" (stacks sampled every
+        # profiling_interval ms) or "cprofile"
+        'profiling': False,
+        'profiling_mode': 'timers',
+        'profiling_interval': 5
     }
 
     _config = {}
@@ -25,13 +25,20 @@ __date__ = '16/03/2020'
 __copyright__ = 'Copyright 2020, Bundesamt für Kartographie und Geodäsie'
 
 from typing import List, Tuple, Union
+import threading
+import time
 import re
 from qgis.PyQt.QtCore import QUrlQuery, QUrl
+from qgis.core import QgsGeometry, QgsPoint
 from html.parser import HTMLParser
 from json.decoder import JSONDecodeError
 
 from .geocoder import Geocoder
-from bkggeocoder.interface.utils import Request, Reply, ResField
+from .cache import ReverseCache
+from .metrics import Metrics
+from .profiling import profiled
+from bkggeocoder.interface.utils import (Request, Reply, ResField,
+                                        DetachedReply)
 
 requests = Request()
 
@@ -146,6 +153,237 @@ class CRSParser(HTMLParser):
         self.codes = []
 
 
+class Endpoint:
+    '''
+    member of an endpoint pool, a service of the BKG geocoding API with its
+    own credentials, concurrency budget and health state
+
+    Attributes
+    ----------
+    url : str
+        complete service-url including the "geosearch" term
+    max_concurrent : int
+        maximum number of requests sent to the service at the same time
+    healthy : bool
+        whether the service was reachable on the last probe and did not fail
+        too often in a row since
+    failures : int
+        number of consecutive failed requests to the service
+    active : int
+        number of requests currently sent to the service
+    n_requests : int
+        total number of requests sent to the service
+    last_probe : float
+        time of the last capability probe (time.monotonic), None if the
+        service was not probed yet
+    '''
+    def __init__(self, key: str = '', url: str = '', max_concurrent: int = 4):
+        '''
+        Parameters
+        ----------
+        key : str, optional
+            key provided by BKG (no url needed, url will be built with that)
+        url : str, optional
+            complete service-url provided by BKG (no seperate key needed),
+            higher priority than the key if both are given
+        max_concurrent : int, optional
+            maximum number of requests sent to the service at the same time,
+            defaults to 4
+        '''
+        if not key and not url:
+            raise ValueError('at least one keyword out of "key" and "url" has '
+                             'to be passed')
+        url = url or URL.format(key=key)
+        if 'geosearch' not in url:
+            url += '/geosearch'
+        self.url = url
+        self.max_concurrent = max(1, max_concurrent)
+        self.healthy = True
+        self.failures = 0
+        self.active = 0
+        self.n_requests = 0
+        self.last_probe = None
+        self._probing = False
+
+
+class EndpointPool:
+    '''
+    pool of services of the BKG geocoding API, requests are spread across
+    the healthy members. The health of the members is derived from the
+    success of the requests and from periodic probes of their capabilities
+    (OpenSearch description)
+
+    Attributes
+    ----------
+    endpoints : list
+        the members of the pool
+    probe_interval : float
+        seconds between the capability probes of a member, None if the
+        members are not probed periodically
+    max_failures : int
+        number of consecutive failed requests after which a member is
+        considered to be unhealthy, single slow outliers shouldn't take a
+        member out of rotation
+    failover_status : tuple
+        status codes of replies indicating that the member itself is not
+        usable (credentials, quota, overload), the requests are retried on
+        other members
+    fatal_status : tuple
+        status codes marking a member as unhealthy right away (invalid
+        credentials won't become valid by retrying)
+    '''
+    max_failures = 3
+    failover_status = (401, 403, 429, 500, 502, 503, 504)
+    fatal_status = (401, 403)
+
+    def __init__(self, endpoints: List[Endpoint],
+                 probe_interval: float = 300):
+        '''
+        Parameters
+        ----------
+        endpoints : list
+            the members of the pool
+        probe_interval : float, optional
+            seconds between the capability probes of a member, None to not
+            probe the members periodically (only on calling probe()),
+            defaults to 5 minutes
+        '''
+        if not endpoints:
+            raise ValueError('at least one endpoint has to be passed')
+        self.endpoints = endpoints
+        self.probe_interval = probe_interval
+        self._cond = threading.Condition()
+        # thread running the last started background probes
+        self._prober = None
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def n_healthy(self) -> int:
+        '''
+        number of members considered to be healthy
+        '''
+        return len([e for e in self.endpoints if e.healthy])
+
+    def probe(self, endpoints: List[Endpoint] = None):
+        '''
+        request the capabilities of the members to determine their health,
+        blocks until all probes are done
+
+        Parameters
+        ----------
+        endpoints : list, optional
+            the members to probe, defaults to all members
+        '''
+        endpoints = endpoints or self.endpoints
+        for endpoint in endpoints:
+            success, msg, codes = BKGGeocoder.get_crs(url=endpoint.url)
+            with self._cond:
+                endpoint.healthy = success
+                if success:
+                    endpoint.failures = 0
+                endpoint.last_probe = time.monotonic()
+                self._cond.notify_all()
+
+    def _probe_due(self):
+        '''
+        probe members whose last probe is older than the interval in a
+        background thread, returns immediately
+        '''
+        if self.probe_interval is None:
+            return
+        now = time.monotonic()
+        with self._cond:
+            due = [e for e in self.endpoints if not e._probing and
+                   (e.last_probe is None or
+                    now - e.last_probe >= self.probe_interval)]
+            if not due:
+                return
+            for endpoint in due:
+                endpoint._probing = True
+            prober = self._prober = threading.Thread(
+                target=self._run_probes, args=(due, ), daemon=True)
+        prober.start()
+
+    def _run_probes(self, endpoints: List[Endpoint]):
+        try:
+            self.probe(endpoints)
+        finally:
+            with self._cond:
+                for endpoint in endpoints:
+                    endpoint._probing = False
+
+    def acquire(self, aborted: threading.Event = None) -> Endpoint:
+        '''
+        reserve a slot of the concurrency budget of the least busy healthy
+        member, blocks until a slot is free. If no member is healthy, all
+        members are considered. Members due for a probe are probed in the
+        background, their current health is used meanwhile. Release the
+        member after the request is done. Thread-safe.
+
+        Parameters
+        ----------
+        aborted : threading.Event, optional
+            stop waiting for a free slot when set
+
+        Returns
+        ----------
+        Endpoint
+            the member to send the request to
+
+        Raises
+        ----------
+        InterruptedError
+            waiting for a free slot was aborted
+        '''
+        self._probe_due()
+        with self._cond:
+            while True:
+                candidates = ([e for e in self.endpoints if e.healthy]
+                              or self.endpoints)
+                free = [e for e in candidates if e.active < e.max_concurrent]
+                if free:
+                    endpoint = min(free, key=lambda e: (
+                        e.active / e.max_concurrent, e.n_requests))
+                    endpoint.active += 1
+                    endpoint.n_requests += 1
+                    return endpoint
+                if aborted is not None and aborted.is_set():
+                    raise InterruptedError('Anfrage abgebrochen')
+                self._cond.wait(0.1)
+
+    def release(self, endpoint: Endpoint, healthy: bool = True,
+                fatal: bool = False):
+        '''
+        free the slot reserved with acquire(), thread-safe
+
+        Parameters
+        ----------
+        endpoint : Endpoint
+            the acquired member
+        healthy : bool, optional
+            False if the request to the member failed, after max_failures
+            failed requests in a row it won't receive requests until a probe
+            succeeds again, defaults to True
+        fatal : bool, optional
+            the member failed in a way it won't recover from by retrying, it
+            won't receive requests until a probe succeeds again, defaults to
+            False
+        '''
+        with self._cond:
+            endpoint.active = max(0, endpoint.active - 1)
+            if fatal:
+                endpoint.healthy = False
+            elif healthy:
+                endpoint.failures = 0
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.healthy = False
+            self._cond.notify_all()
+
+
 class BKGGeocoder(Geocoder):
     '''
     Geocoder using the BKG API. The geocoder requires either a key or a
@@ -196,6 +434,15 @@ class BKGGeocoder(Geocoder):
     special_characters = ['+', '&&', '||', '!', '(', ')', '{', '}',
                           '[', ']', '^', '"', '~', '*', '?', ':']
     fuzzy_distance = 0.5
+    # seconds to wait before the first retry after a connection error,
+    # doubled with every further retry
+    retry_delay = 0.5
+    # number of results the service returns if no count is requested
+    default_count = 10
+    # factor the requested number of results is multiplied by when sending a
+    # simplified area, the best results inside of the exact area are then
+    # among the returned ones even if the simplified area adds better ones
+    area_overfetch = 5
 
     @staticmethod
     def split_code_city(value: str, kwargs: dict) -> dict:
@@ -241,7 +488,11 @@ class BKGGeocoder(Geocoder):
 
     def __init__(self, key: str = '', url: str = '', crs: str = 'EPSG:4326',
                  logic_link = 'AND', rs: str = '', fuzzy: bool = False,
-                 area_wkt: str = None):
+                 area_wkt: str = None, reverse_cache: ReverseCache = None,
+                 adaptive_timeout: bool = False, hedge: bool = False,
+                 hedge_url: str = '', pool: EndpointPool = None,
+                 simplify_area: bool = False, area_max_vertices: int = 500,
+                 count: int = None, metrics: Metrics = None):
         '''
         Parameters
         ----------
@@ -266,6 +517,41 @@ class BKGGeocoder(Geocoder):
         fuzzy : bool, optional
             fuzzy search, the terms don't have to match exactly if set to True,
             defaults to not using fuzzy search
+        reverse_cache : ReverseCache, optional
+            cache to look up replies of reverse geocoding requests in before
+            querying the service, defaults to no caching
+        adaptive_timeout : bool, optional
+            derive the timeouts of the requests from the observed latencies
+            of the service, timed out requests are retried, defaults to a
+            fixed timeout
+        hedge : bool, optional
+            send a duplicate request if the service takes unusually long to
+            respond and take the reply coming in first, recommended for
+            interactive use only, defaults to not hedging requests
+        hedge_url : str, optional
+            complete url of an alternative service the duplicate requests are
+            sent to, defaults to sending them to the same service
+        pool : EndpointPool, optional
+            pool of services the requests are spread across, the service
+            given by key or url is not queried if set (except for the
+            supported crs), defaults to querying the given service only
+        simplify_area : bool, optional
+            send a simplified geometry enclosing the area instead of the area
+            itself and filter the results by the exact area locally, reduces
+            the size of the requests, defaults to sending the exact area
+        area_max_vertices : int, optional
+            maximum number of vertices of the simplified area, the bounding
+            box of the area is sent if it can't be simplified that far,
+            defaults to 500 vertices
+        count : int, optional
+            maximum number of results per request, defaults to the limit of
+            the service (default_count). If the area is simplified, more
+            results are requested (area_overfetch) and the count is applied
+            to the results inside of the exact area, the best ones of the
+            simplified area might be outside of the exact one
+        metrics : Metrics, optional
+            registry the requests, retries, cache hits and repeated queries
+            are reported to, defaults to no reporting
         '''
         if not key and not url:
             raise ValueError('at least one keyword out of "key" and "url" has '
@@ -278,6 +564,29 @@ class BKGGeocoder(Geocoder):
         self.fuzzy = fuzzy
         self.rs = rs
         self.area_wkt = area_wkt
+        # exact area, prepared for the local filter on first query
+        self._area = QgsGeometry.fromWkt(area_wkt) \
+            if area_wkt and simplify_area else None
+        self._area_engine = None
+        self.area_max_vertices = area_max_vertices
+        self.count = count
+        self.reverse_cache = reverse_cache
+        self.pool = pool
+        self.metrics = metrics
+        # own request wrapper, so that only requests of this geocoder are
+        # aborted when aborting
+        alternatives = {}
+        if hedge_url:
+            if 'geosearch' not in hedge_url:
+                hedge_url += '/geosearch'
+            alternatives[url] = hedge_url
+            if pool:
+                for endpoint in pool.endpoints:
+                    alternatives[endpoint.url] = hedge_url
+        self.requests = Request(adaptive_timeout=adaptive_timeout,
+                                hedge=hedge, alternatives=alternatives,
+                                metrics=metrics)
+        self._aborted = threading.Event()
         super().__init__(url=url, crs=crs)
 
     @staticmethod
@@ -299,9 +608,9 @@ class BKGGeocoder(Geocoder):
         return url
 
     @staticmethod
-    def get_crs(url: str = '', key: str = '') -> Tuple[bool, str, List[tuple]]:
+    def capabilities_url(url: str = '', key: str = '') -> str:
         '''
-        request the supported coordinate reference sytems
+        url of the capabilities (OpenSearch description) of the service
 
         Parameters
         ----------
@@ -313,31 +622,70 @@ class BKGGeocoder(Geocoder):
 
         Returns
         ----------
-        tuple
-            tuple of success, error message and list of available crs as tuples
-            (code, pretty name)
+        str
+            url of the capabilities
         '''
         url = url or URL.format(key=key)
         # in case users typed in url with the 'geosearch' term in it
         url = url.replace('geosearch', '')
-        url += '/index.xml'
+        return url + '/index.xml'
+
+    @staticmethod
+    def parse_crs(reply: Reply) -> Tuple[bool, str, List[tuple]]:
+        '''
+        parse the supported coordinate reference systems from the reply to
+        a capability request
+
+        Parameters
+        ----------
+        reply : Reply
+            the reply of the request to the capabilities url
+
+        Returns
+        ----------
+        tuple
+            tuple of success, error message and list of available crs as tuples
+            (code, pretty name)
+        '''
         default = [('EPSG:25832', 'ETRS89 / UTM zone 32N')]
         con_msg = ('Der Dienst ist zur Zeit nicht erreichbar bzw. '
                    'die angegebene URL ist nicht gültig.')
-        try:
-            res = requests.get(url)
-        except ConnectionError:
-            return False, con_msg, default
-        if res.status_code == None:
+        if reply.status_code == None:
             return False, con_msg, default
-        if res.status_code != 200:
+        if reply.status_code != 200:
             msg = ('Der eingegebene Schlüssel bzw. '
                    'die angegebene URL ist nicht gültig')
             return False, msg, default
         parser = CRSParser()
-        parser.feed(res.content.decode("utf-8"))
+        parser.feed(reply.content.decode("utf-8"))
         return True, '', parser.codes
 
+    @staticmethod
+    def get_crs(url: str = '', key: str = '') -> Tuple[bool, str, List[tuple]]:
+        '''
+        request the supported coordinate reference sytems
+
+        Parameters
+        ----------
+        key : str, optional
+            key provided by BKG (no url needed, url will be built with that)
+        url : str, optional
+            complete service-url provided by BKG (no seperate key needed),
+            higher priority than the key if both are given
+
+        Returns
+        ----------
+        tuple
+            tuple of success, error message and list of available crs as tuples
+            (code, pretty name)
+        '''
+        url = BKGGeocoder.capabilities_url(url=url, key=key)
+        try:
+            res = requests.get(url)
+        except ConnectionError:
+            return BKGGeocoder.parse_crs(DetachedReply(url, None, b''))
+        return BKGGeocoder.parse_crs(res)
+
     def _escape_special_chars(self, text) -> str:
         '''
         escapes control characters in given string
@@ -383,6 +731,7 @@ class BKGGeocoder(Geocoder):
         query += logic.join((f'{k}:({v})' for k, v in p_kwargs.items() if v))
         return query
 
+    @profiled('query')
     def query(self, *args: object, max_retries: int = 2, **kwargs: object
               ) -> Reply:
         '''
@@ -414,42 +763,213 @@ class BKGGeocoder(Geocoder):
         ValueError
             request got through but parameters were malformed,
             may still work for different features
+        InterruptedError
+            request was aborted
         '''
         self.params = {}
-        retries = 0
         if self.rs:
             self.params['filter'] = f'rs:{self.rs}'
         self.params['srsname'] = self.crs
+        # results outside of the exact area are dropped locally, over-fetch
+        # and apply the count after filtering them then
+        if self._area is not None:
+            self.params['count'] = ((self.count or self.default_count) *
+                                    self.area_overfetch)
+        elif self.count:
+            self.params['count'] = self.count
         query = self._build_params(*args, **kwargs)
         if not query:
             raise ValueError('keine Suchparameter gefunden')
         self.params['query'] = query
         do_post = self.area_wkt is not None
+        if self._area is not None and self._area_engine is None:
+            self._prepare_area()
         if self.area_wkt:
             self.params['geometry'] = self.area_wkt
+        # requests a deduplication of the queries would have saved
+        if self.metrics is not None and self.metrics.seen(
+                (query, self.params.get('filter'), self.area_wkt)):
+            self.metrics.count('duplicate_queries')
+        self.reply = self._request(self.params, post=do_post,
+                                   max_retries=max_retries)
+        self.raise_on_error(self.reply)
+        if self._area_engine is not None:
+            self.reply = self._filter_area(
+                self.reply, count=self.count or self.default_count)
+        return self.reply
+
+    @staticmethod
+    def simplify(geometry: QgsGeometry,
+                 max_vertices: int = 500) -> QgsGeometry:
+        '''
+        simplified polygon enclosing the given geometry
+
+        Parameters
+        ----------
+        geometry : QgsGeometry
+            the (multi-)polygon to simplify
+        max_vertices : int, optional
+            maximum number of vertices of the simplified polygon, defaults to
+            500 vertices
+
+        Returns
+        ----------
+        QgsGeometry
+            polygon containing the given geometry with at most max_vertices
+            vertices, the bounding box if it can't be simplified that far
+        '''
+        if geometry.constGet().nCoordinates() <= max_vertices:
+            return geometry
+        bbox = geometry.boundingBox()
+        # buffering by more than the tolerance before simplifying keeps the
+        # simplified polygon enclosing the original one
+        tolerance = max(bbox.width(), bbox.height()) / 1000
+        for i in range(8):
+            simplified = geometry.buffer(2 * tolerance, 2).simplify(tolerance)
+            if (not simplified.isNull() and
+                    simplified.constGet().nCoordinates() <= max_vertices):
+                return simplified
+            tolerance *= 2
+        return QgsGeometry.fromRect(bbox)
+
+    def _prepare_area(self):
+        '''
+        prepare the exact area for the local filter and replace the area sent
+        to the service with a simplified one
+        '''
+        self.area_wkt = self.simplify(
+            self._area, max_vertices=self.area_max_vertices).asWkt()
+        engine = QgsGeometry.createGeometryEngine(self._area.constGet())
+        engine.prepareGeometry()
+        self._area_engine = engine
+
+    def _filter_area(self, reply: Reply, count: int = None) -> Reply:
+        '''
+        remove the results outside of the exact area from the reply and keep
+        only the first "count" results of the remaining ones (if given)
+        '''
+        res_json = reply.json()
+        features = res_json.get('features', [])
+        inside = [f for f in features if self._area_engine.intersects(
+            QgsPoint(*f['geometry']['coordinates'][:2]))]
+        if count:
+            inside = inside[:count]
+        if len(inside) == len(features):
+            return reply
+        # the parsed json is shared with the original reply, don't modify it
+        return DetachedReply(reply.url, reply.status_code,
+                             headers=reply.headers,
+                             parsed=dict(res_json, features=inside))
+
+    def _request(self, params: dict, post: bool = False,
+                 max_retries: int = 2) -> Reply:
+        '''
+        send a request to the service (or to a member of the pool if set),
+        retries after connection errors. Members of the pool not reachable or
+        replying with a status indicating that they are not usable
+        (EndpointPool.failover_status) are reported as failed and the retries
+        go to the other members, the last reply is returned if all retries
+        got such a status
+        '''
+        if self.pool is not None:
+            max_retries = max(max_retries, len(self.pool) - 1)
+        retries = 0
         while True:
+            # aborted before the request could be sent
+            if self._aborted.is_set():
+                raise InterruptedError('Anfrage abgebrochen')
+            endpoint = None
+            url = self.url
+            if self.pool is not None:
+                endpoint = self.pool.acquire(aborted=self._aborted)
+                url = endpoint.url
             try:
-                if not do_post:
-                    self.reply = requests.get(self.url, params=self.params)
+                if not post:
+                    reply = self.requests.get(url, params=params)
                 else:
                     content_type = 'application/x-www-form-urlencoded'
                     data = QUrlQuery()
-                    for k, v in self.params.items():
-                        data.addQueryItem(k, v)
-                    self.reply = requests.post(
-                        self.url, data=data.query().encode('utf-8'),
+                    for k, v in params.items():
+                        data.addQueryItem(k, str(v))
+                    reply = self.requests.post(
+                        url, data=data.query().encode('utf-8'),
                         content_type=content_type
                     )
+                # unreachable member, try the other ones
+                if endpoint and reply.status_code is None:
+                    raise ConnectionError(f'{url} nicht erreichbar')
             except ConnectionError:
+                if endpoint:
+                    self.pool.release(endpoint, healthy=False)
                 if retries >= max_retries:
                     raise RuntimeError(
                         f'Anfrage nach {retries + 1} gescheiterten '
                         'Verbindungsversuchen abgebrochen.')
+                self._backoff(retries)
                 retries += 1
                 continue
-            break
-        self.raise_on_error(self.reply)
-        return self.reply
+            except BaseException:
+                if endpoint:
+                    self.pool.release(endpoint)
+                raise
+            if not endpoint:
+                return reply
+            # member is not usable (credentials, quota, overload), let the
+            # other members answer
+            status = reply.status_code
+            if status in self.pool.failover_status:
+                self.pool.release(endpoint, healthy=False,
+                                  fatal=status in self.pool.fatal_status)
+                if retries >= max_retries:
+                    return reply
+                self._backoff(retries)
+                retries += 1
+                continue
+            self.pool.release(endpoint)
+            return reply
+
+    def _backoff(self, retries: int):
+        '''
+        wait before retrying a failed request, returns early when aborted (no
+        need to wait if there are healthy members in the pool to switch to)
+        '''
+        delay = 0 if self.pool and self.pool.n_healthy \
+            else self.retry_delay * 2 ** retries
+        if self._aborted.wait(delay):
+            raise InterruptedError('Anfrage abgebrochen')
+        if self.metrics is not None:
+            self.metrics.count('retries')
+
+    def running(self) -> int:
+        '''
+        override, number of requests of this geocoder currently in flight
+        '''
+        return self.requests.running
+
+    def warm_up(self):
+        '''
+        override, open connections to the service (resp. the members of the
+        pool) in the calling thread
+        '''
+        urls = [e.url for e in self.pool.endpoints] if self.pool \
+            else [self.url]
+        for url in urls:
+            self.requests.warm_up(url)
+
+    def abort(self):
+        '''
+        override, abort the running requests and waits for retries,
+        following requests are aborted until resume() is called, thread-safe
+        '''
+        self._aborted.set()
+        self.requests.abort()
+
+    def resume(self):
+        '''
+        override, allow requests again after abort()
+        '''
+        self._aborted.clear()
+        self.requests.resume()
 
     def raise_on_error(self, reply: Reply):
         '''
@@ -495,9 +1015,12 @@ class BKGGeocoder(Geocoder):
         if reply.status_code != 200:
             raise ValueError(f'{reply.status_code} - unbekannter Fehler')
 
+    @profiled('reverse')
     def reverse(self, x: float, y: float) -> Reply:
         '''
-        query
+        query the service for addresses near given point, replies for points
+        in the same grid cell as previously requested ones are taken from
+        the reverse cache (if set)
 
         Parameters
         ----------
@@ -520,14 +1043,36 @@ class BKGGeocoder(Geocoder):
             no access to service/url
         ValueError
             malformed request parameters
+        ConnectionError
+            the service (resp. no member of the pool) could not be reached
+            in time
+        InterruptedError
+            request was aborted
         '''
+        if self.reverse_cache is not None:
+            cached = self.reverse_cache.get(x, y, self.crs)
+            if self.metrics is not None:
+                self.metrics.count('cache_hits' if cached is not None
+                                   else 'cache_misses')
+            if cached is not None:
+                self.reply = cached
+                return self.reply
         params = {
             'lat': y,
             'lon': x,
             'srsname': self.crs
         }
-        self.reply = requests.get(self.url, params=params)
+        if self.count:
+            params['count'] = self.count
+        # reverse requests are not retried, keep raising the connection
+        # error of the request like a plain request would
+        try:
+            self.reply = self._request(params, max_retries=0)
+        except RuntimeError as e:
+            raise ConnectionError(str(e)) from e
         self.raise_on_error(self.reply)
+        if self.reverse_cache is not None:
+            self.reverse_cache.put(x, y, self.crs, self.reply)
         return self.reply
 
 
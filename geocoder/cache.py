@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+'''
+***************************************************************************
+    cache.py
+    ---------------------
+    Date                 : October 2026
+    Author               : Christoph Franke
+    Copyright            : (C) 2026 by Bundesamt für Kartographie und Geodäsie
+    Email                : franke at ggr-planung dot de
+***************************************************************************
+*                                                                         *
+*   This program is free software: you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+caches for replies of geocoding services
+'''
+
+__author__ = 'Christoph Franke'
+__date__ = '19/10/2026'
+__copyright__ = 'Copyright 2026, Bundesamt für Kartographie und Geodäsie'
+
+from collections import OrderedDict
+from typing import Tuple, List
+from qgis.core import (QgsCoordinateReferenceSystem, QgsSpatialIndex,
+                       QgsPointXY, QgsRectangle, QgsMessageLog, Qgis)
+import threading
+import json
+import copy
+import os
+
+from bkggeocoder.interface.utils import Reply, DetachedReply
+
+# approximate length of one degree at the equator in meters
+METERS_PER_DEGREE = 111320
+
+
+def _log_save_error(file_path: str, error: OSError):
+    QgsMessageLog.logMessage(
+        f'Cache konnte nicht nach {file_path} gespeichert werden: {error}',
+        'BKG Geocoder', level=Qgis.Warning)
+
+
+def _log_load_error(file_path: str, error: Exception):
+    QgsMessageLog.logMessage(
+        f'Cache konnte nicht aus {file_path} geladen werden: {error}',
+        'BKG Geocoder', level=Qgis.Warning)
+
+
+class ReverseCache:
+    '''
+    least recently used cache for replies of reverse geocoding requests.
+    the requested coordinates are snapped to a grid, so requests for nearby
+    points share the same cache entry
+
+    Attributes
+    ----------
+    grid : float
+        edge length of the grid cells in meters
+    max_size : int
+        maximum number of cached replies, least recently used ones are
+        discarded when exceeded
+    file_path : str
+        path to the file the cache is persisted in, None if not persisted
+    '''
+    def __init__(self, grid: float = 1, max_size: int = 10000,
+                 file_path: str = None):
+        '''
+        Parameters
+        ----------
+        grid : float, optional
+            edge length of the grid cells in meters, is converted to degrees
+            for geographic coordinate reference systems, defaults to 1 m
+        max_size : int, optional
+            maximum number of cached replies, defaults to 10000
+        file_path : str, optional
+            path to a json file to load the cache from and to save it to,
+            defaults to not persisting the cache
+        '''
+        self.grid = grid
+        self.max_size = max_size
+        self.file_path = file_path
+        self._entries = OrderedDict()
+        # grid cell sizes in the units of the crs, crs codes as keys
+        self._cell_sizes = {}
+        # reverse geocoding is done in worker threads
+        self._lock = threading.Lock()
+
+    def _cell_size(self, crs: str) -> float:
+        '''edge length of the grid cells in the units of the given crs'''
+        size = self._cell_sizes.get(crs)
+        if size is None:
+            size = self.grid
+            if QgsCoordinateReferenceSystem(crs).isGeographic():
+                size /= METERS_PER_DEGREE
+            self._cell_sizes[crs] = size
+        return size
+
+    def key(self, x: float, y: float, crs: str) -> Tuple[str, int, int]:
+        '''
+        key of the grid cell the given coordinates are in
+
+        Parameters
+        ----------
+        x : float
+            x coordinate (longitude)
+        y : float
+            y coordinate (latitude)
+        crs : str
+            code of projection of the coordinates
+
+        Returns
+        ----------
+        tuple
+            crs code and indices of the grid cell
+        '''
+        size = self._cell_size(crs)
+        return (crs, round(x / size), round(y / size))
+
+    def get(self, x: float, y: float, crs: str) -> DetachedReply:
+        '''
+        look up a cached reply for the given coordinates
+
+        Parameters
+        ----------
+        x : float
+            x coordinate (longitude)
+        y : float
+            y coordinate (latitude)
+        crs : str
+            code of projection of the coordinates
+
+        Returns
+        ----------
+        DetachedReply
+            the cached reply, None if there is no reply cached for the grid
+            cell the coordinates are in
+        '''
+        key = self.key(x, y, crs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        url, status_code, content = entry
+        return DetachedReply(url, status_code, content)
+
+    def put(self, x: float, y: float, crs: str, reply: Reply):
+        '''
+        cache the reply to a reverse geocoding request
+
+        Parameters
+        ----------
+        x : float
+            requested x coordinate (longitude)
+        y : float
+            requested y coordinate (latitude)
+        crs : str
+            code of projection of the coordinates
+        reply : Reply
+            the reply of the geocoding service
+        '''
+        key = self.key(x, y, crs)
+        entry = (reply.url, reply.status_code, bytes(reply.content))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        remove all cached replies
+        '''
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        '''
+        load the cached replies from the set file, entries loaded from file
+        are considered to be used less recently than the ones already cached.
+        Nothing is loaded if the file is unreadable or malformed (logged as a
+        warning)
+        '''
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r') as f:
+                stored = json.load(f)
+            entries = OrderedDict()
+            for crs, ix, iy, url, status_code, content in stored:
+                entries[(crs, ix, iy)] = (url, status_code,
+                                          content.encode('utf-8'))
+        except (OSError, TypeError, ValueError, AttributeError) as e:
+            _log_load_error(self.file_path, e)
+            return
+        with self._lock:
+            entries.update(self._entries)
+            self._entries = entries
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        '''
+        write the cached replies to the set file, the cache is not stored if
+        the file can't be written (logged as a warning)
+        '''
+        if not self.file_path:
+            return
+        with self._lock:
+            stored = [[crs, ix, iy, url, status_code, content.decode('utf-8')]
+                      for (crs, ix, iy), (url, status_code, content)
+                      in self._entries.items()]
+        try:
+            with open(self.file_path, 'w') as f:
+                json.dump(stored, f)
+        except OSError as e:
+            _log_save_error(self.file_path, e)
+
+
+class CandidateIndex:
+    '''
+    spatial index of all candidates (geojson point features) returned by a
+    geocoding service, used to look up known addresses near a point without
+    querying the service
+
+    Attributes
+    ----------
+    max_distance : float
+        maximum distance in meters between a point and the candidates found
+        near it
+    '''
+    def __init__(self, max_distance: float = 100):
+        '''
+        Parameters
+        ----------
+        max_distance : float, optional
+            maximum distance in meters between a point and the candidates found
+            near it, is converted to degrees for geographic coordinate
+            reference systems, defaults to 100 m
+        '''
+        self.max_distance = max_distance
+        # spatial indices and indexed candidates, crs codes as keys
+        self._indices = {}
+        self._candidates = {}
+        # ids of already indexed candidates, (crs, text, x, y) as keys
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def add(self, candidates: List[dict], crs: str):
+        '''
+        add copies of the candidates to the index, candidates already
+        indexed are skipped
+
+        Parameters
+        ----------
+        candidates : list
+            geojson point features with "text" in their properties
+        crs : str
+            code of projection of the geometries of the candidates
+        '''
+        with self._lock:
+            index = self._indices.get(crs)
+            if index is None:
+                index = self._indices[crs] = QgsSpatialIndex()
+                self._candidates[crs] = []
+            indexed = self._candidates[crs]
+            for candidate in candidates:
+                x, y = candidate['geometry']['coordinates'][:2]
+                key = (crs, candidate['properties'].get('text'), x, y)
+                if key in self._ids:
+                    continue
+                fid = len(indexed)
+                self._ids[key] = fid
+                # the candidates may be part of the parsed json of a reply
+                # which is shared with other consumers
+                indexed.append(copy.deepcopy(candidate))
+                point = QgsPointXY(x, y)
+                index.addFeature(fid, QgsRectangle(point, point))
+
+    def nearest(self, point: QgsPointXY, crs: str, n: int = 10) -> List[dict]:
+        '''
+        look up the indexed candidates nearest to given point
+
+        Parameters
+        ----------
+        point : QgsPointXY
+            the point to look for candidates around
+        crs : str
+            code of projection of the point
+        n : int, optional
+            maximum number of candidates returned, defaults to 10
+
+        Returns
+        ----------
+        list
+            copies of the candidates within the maximum distance to the point
+            in order of distance, empty list if none were found
+        '''
+        max_distance = self.max_distance
+        if QgsCoordinateReferenceSystem(crs).isGeographic():
+            max_distance /= METERS_PER_DEGREE
+        with self._lock:
+            index = self._indices.get(crs)
+            if index is None:
+                return []
+            indexed = self._candidates[crs]
+            found = [indexed[fid] for fid in index.nearestNeighbor(point, n)]
+        found = [c for c in found
+                 if self._distance(point, c) <= max_distance]
+        return copy.deepcopy(found)
+
+    @staticmethod
+    def _distance(point: QgsPointXY, candidate: dict) -> float:
+        '''distance between point and candidate in units of their crs'''
+        x, y = candidate['geometry']['coordinates'][:2]
+        return point.distance(x, y)
+
+    @staticmethod
+    def merge(point: QgsPointXY, *candidate_lists: List[dict]) -> List[dict]:
+        '''
+        merge lists of candidates, duplicate addresses are removed (the first
+        occurrence is kept)
+
+        Parameters
+        ----------
+        point : QgsPointXY
+            the point the merged candidates are sorted by distance to
+        *candidate_lists
+            lists of geojson point features with "text" in their properties
+
+        Returns
+        ----------
+        list
+            unique candidates in order of distance to the point
+        '''
+        merged = {}
+        for candidates in candidate_lists:
+            for candidate in candidates:
+                text = candidate['properties'].get('text')
+                if text not in merged:
+                    merged[text] = candidate
+        return sorted(merged.values(),
+                      key=lambda c: CandidateIndex._distance(point, c))
+
+    def clear(self):
+        '''
+        remove all indexed candidates
+        '''
+        with self._lock:
+            self._indices.clear()
+            self._candidates.clear()
+            self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class CapabilityCache:
+    '''
+    persistent cache of the capabilities (supported coordinate reference
+    systems) of geocoding services, entries can be revalidated with the
+    ETag and Last-Modified headers of the replies they were created from
+
+    Attributes
+    ----------
+    file_path : str
+        path to the file the cache is persisted in, None if not persisted
+    '''
+    def __init__(self, file_path: str = None):
+        '''
+        Parameters
+        ----------
+        file_path : str, optional
+            path to a json file to load the cache from and to save it to on
+            every change, defaults to not persisting the cache
+        '''
+        self.file_path = file_path
+        # urls of the capabilities as keys, dicts as values
+        self._entries = {}
+
+    def get(self, url: str) -> dict:
+        '''
+        look up the cached capabilities of a service
+
+        Parameters
+        ----------
+        url : str
+            url of the capabilities of the service
+
+        Returns
+        ----------
+        dict
+            "success", "message" and "codes" (list of tuples of code and
+            pretty name of the supported crs) of the capability request,
+            "etag" and "last_modified" of its reply, None if not cached
+        '''
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        entry = dict(entry)
+        entry['codes'] = [tuple(c) for c in entry['codes']]
+        return entry
+
+    def put(self, url: str, success: bool, message: str,
+            codes: List[tuple], etag: str = '', last_modified: str = ''):
+        '''
+        cache the capabilities of a service
+
+        Parameters
+        ----------
+        url : str
+            url of the capabilities of the service
+        success : bool
+            whether the service could be accessed
+        message : str
+            error message if not successful
+        codes : list
+            supported crs as tuples of code and pretty name
+        etag : str, optional
+            ETag header of the reply
+        last_modified : str, optional
+            Last-Modified header of the reply
+        '''
+        self._entries[url] = {
+            'success': success, 'message': message,
+            'codes': [list(c) for c in codes],
+            'etag': etag, 'last_modified': last_modified
+        }
+        self.save()
+
+    def validation_headers(self, url: str) -> dict:
+        '''
+        headers of a conditional request revalidating the cached capabilities
+
+        Parameters
+        ----------
+        url : str
+            url of the capabilities of the service
+
+        Returns
+        ----------
+        dict
+            "If-None-Match" and "If-Modified-Since" headers (if known),
+            empty if the capabilities are not cached
+        '''
+        entry = self._entries.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def load(self):
+        '''
+        load the cached capabilities from the set file, nothing is loaded if
+        the file is unreadable or malformed (logged as a warning)
+        '''
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r') as f:
+                stored = dict(json.load(f))
+        except (OSError, TypeError, ValueError) as e:
+            _log_load_error(self.file_path, e)
+            return
+        self._entries.update(stored)
+
+    def save(self):
+        '''
+        write the cached capabilities to the set file
+        '''
+        if not self.file_path:
+            return
+        try:
+            with open(self.file_path, 'w') as f:
+                json.dump(self._entries, f)
+        except OSError as e:
+            _log_save_error(self.file_path, e)
@@ -21,13 +21,19 @@ generic geocoding interface
 __author__ = 'Christoph Franke'
 __date__ = '16/03/2020'
 
-from qgis.PyQt.QtCore import pyqtSignal, QObject, QThread
-from qgis.core import QgsFeature, QgsFeatureIterator, QgsVectorLayer
+from qgis.PyQt.QtCore import pyqtSignal, QObject, QThread, QTimer
+from qgis.core import (QgsFeature, QgsFeatureIterator, QgsVectorLayer,
+                       QgsGeometry)
 from typing import Union, List, Tuple
+from collections import deque
 from bkggeocoder.interface.utils import Reply
+from .metrics import Metrics
+from .profiling import profiled
 import re
 import math
 import copy
+import time
+import threading
 
 def check_val(value, p2k):
     for pattern, key in p2k.items():
@@ -336,6 +342,37 @@ class Geocoder:
         '''
         raise NotImplementedError
 
+    def abort(self):
+        '''
+        abort the running requests, the aborted calls of query or reverse
+        raise an InterruptedError, so do all following calls until resume()
+        is called, to be implemented by derived classes supporting the
+        abortion of requests
+        '''
+        pass
+
+    def resume(self):
+        '''
+        allow requests again after abort(), to be called by the owner of the
+        geocoder (e.g. a worker starting to work), to be implemented by
+        derived classes supporting the abortion of requests
+        '''
+        pass
+
+    def warm_up(self):
+        '''
+        connect to the service in advance in the calling thread, to be
+        implemented by derived classes
+        '''
+        pass
+
+    def running(self) -> int:
+        '''
+        number of requests currently in flight, to be implemented by derived
+        classes
+        '''
+        return 0
+
 class Worker(QThread):
     '''
     abstract worker
@@ -352,6 +389,8 @@ class Worker(QThread):
         emitted when a message is send, message
     progress : pyqtSignal
         emitted on progress, progress in percent
+    stats : pyqtSignal
+        emitted periodically while working, statistics of the progress
     '''
 
     # available signals to be used in the concrete worker
@@ -360,6 +399,7 @@ class Worker(QThread):
     error = pyqtSignal(str)
     message = pyqtSignal(str)
     progress = pyqtSignal(int)
+    stats = pyqtSignal(dict)
 
     def __init__(self, parent: QObject = None):
         '''
@@ -413,15 +453,21 @@ class Geocoding(Worker):
         emitted when a message is send, message
     progress : pyqtSignal
         emitted on progress, progress in percent
+    stats : pyqtSignal
+        emitted every stats_interval milliseconds while running and once when
+        finished, statistics of the progress (see collect_stats)
     feature_done : pyqtSignal
         emitted when feature is done,
         (processed feature, Reply of geocoding API)
     '''
 
     feature_done = pyqtSignal(QgsFeature, Reply)
+    # time span in seconds the moving average of the rate is taken over
+    stats_window = 60
 
     def __init__(self, geocoder: Geocoder, field_map: FieldMap,
                  features: Union[QgsFeatureIterator, List[QgsFeature]] = None,
+                 metrics: Metrics = None, stats_interval: int = 1000,
                  parent: QObject = None):
         '''
         Parameters
@@ -433,6 +479,13 @@ class Geocoding(Worker):
         features : QgsFeatureIterator or list of QgsFeatures, optional
             features to be geocoded, defaults to all features in layer of
             field_map
+        metrics : Metrics, optional
+            registry the geocoder reports to, the request rate and the cache
+            hit rate are taken from it, defaults to no request and cache
+            statistics
+        stats_interval : int, optional
+            interval of the stats signal in milliseconds while running,
+            defaults to one second, 0 to emit the stats only when finished
         parent : QObject, optional
             parent object of thread, defaults to no parent (global)
         '''
@@ -441,7 +494,90 @@ class Geocoding(Worker):
         self.field_map = field_map
         features = features or field_map.layer.getFeatures()
         self.features = [f for f in features]
+        self._init_stats(metrics, stats_interval)
+
+    def _init_stats(self, metrics: Metrics, stats_interval: int):
+        self.metrics = metrics
+        self.stats_interval = stats_interval
+        self._done = 0
+        self._started = None
+        self._requests_start = 0
+        # (time, number of done features) over the window of the average
+        self._samples = deque()
+        # the timer lives in the thread the worker was created in
+        self._stats_timer = QTimer(self)
+        self._stats_timer.timeout.connect(
+            lambda: self.stats.emit(self.collect_stats()))
+        self.finished.connect(self._stats_finished)
+
+    def start(self, *args, **kwargs):
+        '''
+        override, start the thread and the periodic stats
+        '''
+        self._started = time.monotonic()
+        self._samples.clear()
+        self._done = 0
+        if self.metrics is not None:
+            self._requests_start = self.metrics.value('requests')
+        if self.stats_interval:
+            self._stats_timer.start(self.stats_interval)
+        super().start(*args, **kwargs)
+
+    def _stats_finished(self, success: bool = True):
+        self._stats_timer.stop()
+        self.stats.emit(self.collect_stats())
+
+    def collect_stats(self) -> dict:
+        '''
+        statistics of the progress at the time of calling, the moving average
+        of the rate is based on the calls of this function within the last
+        stats_window seconds
 
+        Returns
+        ----------
+        dict
+            "done" and "total" number of features, "elapsed" seconds,
+            "features_per_s" since start, "features_per_s_avg" (moving
+            average), "requests_per_s", "concurrency" (requests in flight),
+            "cache_hit_rate" (0-1), "eta" (remaining seconds based on the
+            moving average), rates and eta are None if not available (yet)
+        '''
+        now = time.monotonic()
+        done = self._done
+        total = len(self.features)
+        elapsed = now - self._started if self._started else 0
+        self._samples.append((now, done))
+        while now - self._samples[0][0] > self.stats_window:
+            self._samples.popleft()
+        first_time, first_done = self._samples[0]
+        if len(self._samples) > 1 and now > first_time:
+            avg = (done - first_done) / (now - first_time)
+        else:
+            # no earlier sample within the window, average since start
+            avg = done / elapsed if elapsed else None
+        requests_per_s = cache_hit_rate = None
+        if self.metrics is not None:
+            if elapsed:
+                requests = (self.metrics.value('requests') -
+                            self._requests_start)
+                requests_per_s = requests / elapsed
+            hits = self.metrics.value('cache_hits')
+            lookups = hits + self.metrics.value('cache_misses')
+            if lookups:
+                cache_hit_rate = hits / lookups
+        return {
+            'done': done,
+            'total': total,
+            'elapsed': elapsed,
+            'features_per_s': done / elapsed if elapsed else None,
+            'features_per_s_avg': avg,
+            'requests_per_s': requests_per_s,
+            'concurrency': self.geocoder.running() if self.geocoder else 0,
+            'cache_hit_rate': cache_hit_rate,
+            'eta': (total - done) / avg if avg else None,
+        }
+
+    @profiled('work')
     def work(self):
         '''
         process the geocoding of features
@@ -451,6 +587,7 @@ class Geocoding(Worker):
             return False
         success = True
         count = len(self.features)
+        self.geocoder.resume()
         for i, feature in enumerate(self.features):
             self.geocoder.reply = None
             if self.is_killed:
@@ -461,12 +598,18 @@ class Geocoding(Worker):
                 self.process(feature)
             except ValueError as e:
                 self.warning.emit(f'Feature {feature.id()} -> {e}')
+            # request was aborted because the worker was killed
+            except InterruptedError:
+                success = False
+                self.warning.emit('Anfrage abgebrochen')
+                break
             except RuntimeError as e:
                 raise e
             finally:
                 if self.geocoder.reply:
                     self.message.emit(f'Feature {feature.id()} '
                                       f'{self.geocoder.reply.url}')
+                self._done = i + 1
                 progress = math.floor(100 * (i + 1) / count)
                 self.progress.emit(progress)
         return success
@@ -487,6 +630,14 @@ class Geocoding(Worker):
         self.feature_done.emit(feature, res)
         self.message.emit(message)
 
+    def kill(self):
+        '''
+        override, abort geocoding including the running request
+        '''
+        super().kill()
+        if self.geocoder:
+            self.geocoder.abort()
+
 
 class ReverseGeocoding(Geocoding):
     '''
@@ -503,6 +654,9 @@ class ReverseGeocoding(Geocoding):
         emitted when a message is send, message
     progress : pyqtSignal
         emitted on progress, progress in percent
+    stats : pyqtSignal
+        emitted every stats_interval milliseconds while running and once when
+        finished, statistics of the progress (see collect_stats)
     feature_done : pyqtSignal
         emitted when feature is done,
         (processed feature, Reply of geocoding API)
@@ -510,6 +664,7 @@ class ReverseGeocoding(Geocoding):
 
     def __init__(self, geocoder: Geocoder,
                  features: Union[QgsFeatureIterator, List[QgsFeature]],
+                 metrics: Metrics = None, stats_interval: int = 1000,
                  parent: QObject=None):
         '''
         Parameters
@@ -518,12 +673,20 @@ class ReverseGeocoding(Geocoding):
             the geocoder used to reverse geocode the features
         features : QgsFeatureIterator or list of QgsFeatures
             features to be reverse geocoded
+        metrics : Metrics, optional
+            registry the geocoder reports to, the request rate and the cache
+            hit rate are taken from it, defaults to no request and cache
+            statistics
+        stats_interval : int, optional
+            interval of the stats signal in milliseconds while running,
+            defaults to one second, 0 to emit the stats only when finished
         parent : QObject, optional
             parent object of thread, defaults to no parent (global)
         '''
         Worker.__init__(self, parent=parent)
         self.geocoder = geocoder
         self.features = [f for f in features]
+        self._init_stats(metrics, stats_interval)
 
     def process(self, feature: QgsFeature):
         '''
@@ -538,4 +701,145 @@ class ReverseGeocoding(Geocoding):
         message = (f'Feature {feature.id()} done')
         res = self.geocoder.reverse(pnt.x(), pnt.y())
         self.feature_done.emit(feature, res)
-        self.message.emit(message)
\ No newline at end of file
+        self.message.emit(message)
+
+class LiveReverseGeocoding(Worker):
+    '''
+    long-lived worker reverse geocoding single features on demand until it is
+    killed. Only the most recently requested feature is processed, running
+    requests are aborted when superseded by a new one
+
+    Attributes
+    ----------
+    finished : pyqtSignal
+        emitted when the worker was killed, success True/False
+    warning : pyqtSignal
+        emitted on error while reverse geocoding a feature, error message
+    error : pyqtSignal
+        emitted on critical error while working, error message
+    message : pyqtSignal
+        emitted when a message is send, message
+    feature_done : pyqtSignal
+        emitted when the most recently requested feature is done,
+        (processed feature, Reply of geocoding API)
+    '''
+
+    feature_done = pyqtSignal(QgsFeature, Reply)
+
+    def __init__(self, geocoder: Geocoder, parent: QObject = None):
+        '''
+        Parameters
+        ----------
+        geocoder : Geocoder
+            the geocoder used to reverse geocode the features
+        parent : QObject, optional
+            parent object of thread, defaults to no parent (global)
+        '''
+        super().__init__(parent=parent)
+        self.geocoder = geocoder
+        self._pending = None
+        self._condition = threading.Condition()
+
+    def request(self, feature: QgsFeature):
+        '''
+        reverse geocode the given feature, supersedes previously requested
+        features
+
+        Parameters
+        ----------
+        feature : QgsFeature
+            the feature with point geometry to find addresses for
+        '''
+        with self._condition:
+            self._pending = feature
+            # results of the running request would be stale anyway, aborted
+            # while locked, so that the worker can't resume before
+            self.geocoder.abort()
+            self._condition.notify()
+
+    def work(self):
+        '''
+        process requested features until the worker is killed
+        '''
+        # connections are bound to the network manager of the thread, connect
+        # while waiting for the first feature to be requested
+        self.geocoder.warm_up()
+        while True:
+            with self._condition:
+                while self._pending is None and not self.is_killed:
+                    self._condition.wait()
+                if self.is_killed:
+                    break
+                feature = self._pending
+                self._pending = None
+                # the abortion of the superseded request is done
+                self.geocoder.resume()
+            pnt = feature.geometry().asPoint()
+            try:
+                res = self.geocoder.reverse(pnt.x(), pnt.y())
+            # superseded by a newer request
+            except InterruptedError:
+                continue
+            # a failed request (e.g. a timeout while dragging) must not end
+            # the long-lived worker, the next request might succeed again
+            except (ValueError, RuntimeError, OSError) as e:
+                self.warning.emit(f'Feature {feature.id()} -> {e}')
+                continue
+            # discard results if a newer request came in in the meantime
+            if self._pending is not None:
+                continue
+            self.feature_done.emit(feature, res)
+            self.message.emit(f'Feature {feature.id()} done')
+        return True
+
+    def kill(self):
+        '''
+        override, stop working after aborting the running request
+        '''
+        super().kill()
+        self.geocoder.abort()
+        with self._condition:
+            self._condition.notify()
+
+
+class GeometryUnion(Worker):
+    '''
+    unite geometries in the background (cascaded union of all geometries at
+    once instead of uniting them one by one)
+
+    Attributes
+    ----------
+    finished : pyqtSignal
+        emitted when the geometries are united, success True/False
+    error : pyqtSignal
+        emitted on error while uniting, error message
+    union : QgsGeometry
+        the united geometry, None until finished successfully
+    '''
+
+    def __init__(self, geometries: List[QgsGeometry], parent: QObject = None):
+        '''
+        Parameters
+        ----------
+        geometries : list
+            the geometries to unite
+        parent : QObject, optional
+            parent object of thread, defaults to no parent (global)
+        '''
+        super().__init__(parent=parent)
+        self.geometries = geometries
+        self.union = None
+
+    def work(self):
+        '''
+        unite the geometries
+        '''
+        if not self.geometries:
+            raise ValueError('keine Geometrien zum Vereinigen gefunden')
+        union = QgsGeometry.unaryUnion(self.geometries)
+        if union.isNull():
+            raise RuntimeError('Die Geometrien konnten nicht vereinigt werden.')
+        if self.is_killed:
+            return False
+        self.union = union
+        return True
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+'''
+***************************************************************************
+    metrics.py
+    ---------------------
+    Date                 : October 2026
+    Author               : Christoph Franke
+    Copyright            : (C) 2026 by Bundesamt für Kartographie und Geodäsie
+    Email                : franke at ggr-planung dot de
+***************************************************************************
+*                                                                         *
+*   This program is free software: you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+metrics of geocoding runs
+'''
+
+__author__ = 'Christoph Franke'
+__date__ = '19/10/2026'
+__copyright__ = 'Copyright 2026, Bundesamt für Kartographie und Geodäsie'
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from collections import Counter, OrderedDict
+import threading
+import datetime
+import bisect
+import json
+import csv
+import os
+
+# upper bounds of the buckets of the histograms in milliseconds
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+           20000, 60000]
+
+
+class Histogram:
+    '''
+    distribution of durations in fixed buckets (not thread-safe, locked by
+    the registry)
+    '''
+    def __init__(self):
+        # last bucket holds everything above the highest bound
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        '''
+        add a duration in milliseconds
+        '''
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        '''
+        estimated percentile (upper bound of the bucket it falls into, the
+        maximum for the last bucket), None if empty
+        '''
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        cumulated = 0
+        for i, n in enumerate(self.buckets):
+            cumulated += n
+            if cumulated >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) \
+                    else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': {str(b): n for b, n in
+                        zip(BUCKETS + ['inf'], self.buckets)},
+        }
+
+
+class Metrics(QObject):
+    '''
+    registry of the counters and histograms of a run, thread-safe
+
+    Counters used by the geocoding stack:
+        requests, retries, bytes_out, bytes_in (payload as decoded by Qt),
+        status_<code> (status_error if no status), cache_hits, cache_misses,
+        duplicate_queries (queries already sent among the most recent ones of
+        the run, the requests a deduplication would save), features
+
+    Histograms (milliseconds):
+        network (requests incl. waiting for the reply), parse (parsing of
+        replies), write (applying results to the output layer)
+
+    Attributes
+    ----------
+    updated : pyqtSignal
+        emitted on publish(), snapshot of the metrics
+    started : datetime
+        time the metrics were (re)set
+    '''
+    updated = pyqtSignal(dict)
+
+    def __init__(self, parent: QObject = None, seen_window: int = 10000):
+        '''
+        Parameters
+        ----------
+        parent : QObject, optional
+            parent object
+        seen_window : int, optional
+            number of most recent keys remembered by seen(), defaults to
+            10000 keys
+        '''
+        super().__init__(parent=parent)
+        self._lock = threading.Lock()
+        self.seen_window = seen_window
+        self.reset()
+
+    def reset(self):
+        '''
+        reset all counters and histograms
+        '''
+        with self._lock:
+            self._counters = Counter()
+            self._histograms = {}
+            self._seen = OrderedDict()
+            self.started = datetime.datetime.now()
+
+    def count(self, name: str, n: int = 1):
+        '''
+        increase a counter
+
+        Parameters
+        ----------
+        name : str
+            name of the counter
+        n : int, optional
+            increment, defaults to 1
+        '''
+        with self._lock:
+            self._counters[name] += n
+
+    def value(self, name: str) -> int:
+        '''
+        current value of a counter, 0 if never increased
+        '''
+        with self._lock:
+            return self._counters[name]
+
+    def observe(self, name: str, value: float):
+        '''
+        add a duration to a histogram
+
+        Parameters
+        ----------
+        name : str
+            name of the histogram
+        value : float
+            duration in milliseconds
+        '''
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(value)
+
+    def seen(self, key: object) -> bool:
+        '''
+        remember given (hashable) key, True if it is among the most recent
+        keys seen in this run (seen_window, least recently seen keys are
+        forgotten)
+        '''
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            if len(self._seen) > self.seen_window:
+                self._seen.popitem(last=False)
+            return False
+
+    def snapshot(self) -> dict:
+        '''
+        current state of the metrics
+
+        Returns
+        ----------
+        dict
+            "started", "seconds" (since start), "counters" and "histograms"
+        '''
+        with self._lock:
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'seconds': (datetime.datetime.now() -
+                            self.started).total_seconds(),
+                'counters': dict(self._counters),
+                'histograms': {k: h.to_dict()
+                               for k, h in self._histograms.items()},
+            }
+
+    def publish(self) -> dict:
+        '''
+        emit a snapshot of the metrics with the updated signal
+
+        Returns
+        ----------
+        dict
+            the emitted snapshot
+        '''
+        snapshot = self.snapshot()
+        self.updated.emit(snapshot)
+        return snapshot
+
+    def export(self, file_path: str, snapshot: dict = None):
+        '''
+        write the metrics to a json or (by file extension) csv file, the csv
+        file contains one row per counter resp. histogram statistic
+
+        Parameters
+        ----------
+        file_path : str
+            path of the file to write
+        snapshot : dict, optional
+            snapshot to write, defaults to the current state
+        '''
+        snapshot = snapshot or self.snapshot()
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.splitext(file_path)[1].lower() != '.csv':
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, indent=2)
+            return
+        with open(file_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['metrik', 'statistik', 'wert'])
+            writer.writerow(['started', '', snapshot['started']])
+            writer.writerow(['seconds', '', snapshot['seconds']])
+            for name, value in sorted(snapshot['counters'].items()):
+                writer.writerow([name, 'count', value])
+            for name, histogram in sorted(snapshot['histograms'].items()):
+                for stat, value in histogram.items():
+                    if stat == 'buckets':
+                        for bound, n in value.items():
+                            writer.writerow([name, f'le_{bound}', n])
+                    else:
+                        writer.writerow([name, stat, value])
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+'''
+***************************************************************************
+    profiling.py
+    ---------------------
+    Date                 : October 2026
+    Author               : Christoph Franke
+    Copyright            : (C) 2026 by Bundesamt für Kartographie und Geodäsie
+    Email                : franke at ggr-planung dot de
+***************************************************************************
+*                                                                         *
+*   This program is free software: you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+profiling of geocoding runs
+
+functions decorated with profiled() are timed as phases while a profiler is
+active, the results are written as "collapsed stacks" (one line per stack,
+frames separated by semicolons followed by a count) which can be turned into
+flamegraphs e.g. with flamegraph.pl or speedscope
+'''
+
+__author__ = 'Christoph Franke'
+__date__ = '19/10/2026'
+__copyright__ = 'Copyright 2026, Bundesamt für Kartographie und Geodäsie'
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import threading
+import functools
+import datetime
+import cProfile
+import pstats
+import time
+import json
+import sys
+import os
+
+# available profiling modes
+MODES = ('timers', 'sampling', 'cprofile')
+
+
+def profiled(name: str):
+    '''
+    decorator timing the decorated function as a phase with given name while
+    a profiler is active (Profiler.active), calls it unchanged otherwise
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = Profiler.active
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _frame_name(code) -> str:
+    return (f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+            f'{code.co_firstlineno})')
+
+
+def _collapse_pstats(stats: pstats.Stats) -> Counter:
+    '''
+    collapsed stacks from the call graph of a cProfile, the own time of the
+    functions (in microseconds) is split up between their callers in
+    proportion to the time spent in the calls (cProfile keeps no full stacks)
+    '''
+    callees = defaultdict(list)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+    collapsed = Counter()
+
+    def name(func):
+        file_path, line, function = func
+        return f'{function} ({os.path.basename(file_path)}:{line})'
+
+    def visit(func, path, fraction):
+        cc, nc, tt, ct, callers = stats.stats[func]
+        path = path + [name(func)]
+        own = int(tt * fraction * 1000000)
+        if own:
+            collapsed[';'.join(path)] += own
+        for callee, edge_time in callees.get(func, []):
+            total = stats.stats[callee][3]
+            # skip recursions and calls without measurable time
+            if not total or name(callee) in path:
+                continue
+            visit(callee, path, fraction * edge_time / total)
+
+    for root in roots:
+        visit(root, [], 1)
+    return collapsed
+
+
+class Profiler:
+    '''
+    times the phases (functions decorated with profiled()) of a run per
+    thread and optionally profiles the code run within the phases with a
+    sampling profiler or cProfile
+
+    Attributes
+    ----------
+    active : Profiler
+        class attribute, the profiler the decorated functions report to,
+        None if not profiling
+    '''
+    active = None
+
+    def __init__(self, mode: str = 'timers', interval: float = 5):
+        '''
+        Parameters
+        ----------
+        mode : str, optional
+            "timers" to only time the phases, "sampling" to additionally
+            sample the stacks of the threads while they are in a phase,
+            "cprofile" to additionally profile the phases with cProfile,
+            defaults to timers
+        interval : float, optional
+            interval of the sampling in milliseconds, defaults to 5 ms
+        '''
+        if mode not in MODES:
+            raise ValueError(f'Unbekannter Profiling-Modus "{mode}"')
+        self.mode = mode
+        self.interval = interval
+        self.started = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # stacks of the phases of the threads by thread ident
+        self._stacks = {}
+        self._thread_names = {}
+        # name of phase as keys, [count, total, max] in seconds as values
+        self._phases = {}
+        # own times of the phase stacks in seconds
+        self._folded = Counter()
+        self._samples = Counter()
+        # cProfiles of the threads by thread ident
+        self._profiles = {}
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        '''
+        start profiling, the profiler becomes the active one
+        '''
+        self.started = datetime.datetime.now()
+        self._stop.clear()
+        if self.mode == 'sampling':
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        Profiler.active = self
+
+    def stop(self):
+        '''
+        stop profiling, phases still running are not recorded anymore
+        '''
+        if Profiler.active is self:
+            Profiler.active = None
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+            self._sampler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            thread = threading.current_thread()
+            with self._lock:
+                self._stacks[thread.ident] = stack
+                self._thread_names[thread.ident] = thread.name
+        return stack
+
+    def _profile(self) -> cProfile.Profile:
+        '''
+        the cProfile of the calling thread, it is reused for all of the
+        top-level phases of the thread
+        '''
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles[threading.get_ident()] = profile
+        return profile
+
+    @contextmanager
+    def phase(self, name: str):
+        '''
+        time the code run within the context as a phase with given name,
+        phases can be nested
+        '''
+        stack = self._stack()
+        profile = None
+        # profiling only the code run within the top-level phases
+        if self.mode == 'cprofile' and not stack:
+            profile = self._profile()
+            try:
+                profile.enable()
+            # another profiler is active (only one at a time since python
+            # 3.12), the phase is only timed then
+            except ValueError:
+                profile = None
+        # name of phase and the time spent in nested phases
+        entry = [name, 0]
+        stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if profile:
+                profile.disable()
+            path = ';'.join([threading.current_thread().name] +
+                            [e[0] for e in stack] + [name])
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                phase = self._phases.setdefault(name, [0, 0, 0])
+                phase[0] += 1
+                phase[1] += elapsed
+                phase[2] = max(phase[2], elapsed)
+                self._folded[path] += elapsed - entry[1]
+
+    def _sample(self):
+        '''
+        record the stacks of the threads currently in a phase until stopped
+        '''
+        while not self._stop.wait(self.interval / 1000):
+            frames = sys._current_frames()
+            with self._lock:
+                stacks = [(ident, self._thread_names[ident])
+                          for ident, stack in self._stacks.items() if stack]
+            for ident, thread_name in stacks:
+                frame = frames.get(ident)
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if not names:
+                    continue
+                path = ';'.join([thread_name] + names[::-1])
+                with self._lock:
+                    self._samples[path] += 1
+
+    def summary(self) -> dict:
+        '''
+        timers of the phases
+
+        Returns
+        ----------
+        dict
+            names of the phases as keys and dicts with "count", "total_ms",
+            "mean_ms" and "max_ms" as values
+        '''
+        with self._lock:
+            return {
+                name: {
+                    'count': count,
+                    'total_ms': total * 1000,
+                    'mean_ms': total * 1000 / count,
+                    'max_ms': maximum * 1000,
+                } for name, (count, total, maximum) in self._phases.items()
+            }
+
+    def save(self, file_path: str) -> list:
+        '''
+        write the results, the summary of the timers to "<file_path>.json",
+        the own times of the phase stacks in microseconds as collapsed stacks
+        to "<file_path>_phasen.folded" and depending on the mode the samples
+        to "<file_path>_samples.folded" resp. the profile to
+        "<file_path>.prof" (pstats) and as collapsed stacks in microseconds
+        to "<file_path>_cprofile.folded"
+
+        Parameters
+        ----------
+        file_path : str
+            path of the files to write without extension
+
+        Returns
+        ----------
+        list
+            paths of the written files
+        '''
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        written = []
+
+        def write_folded(path, counter):
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(counter.items()):
+                    if count:
+                        f.write(f'{stack} {count}\n')
+            written.append(path)
+
+        summary = {
+            'mode': self.mode,
+            'started': self.started.isoformat(timespec='seconds')
+            if self.started else None,
+            'phases': self.summary(),
+        }
+        with open(f'{file_path}.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        written.append(f'{file_path}.json')
+        with self._lock:
+            folded = Counter({k: int(v * 1000000)
+                              for k, v in self._folded.items()})
+            samples = Counter(self._samples)
+            profiles = list(self._profiles.values())
+        write_folded(f'{file_path}_phasen.folded', folded)
+        if self.mode == 'sampling':
+            write_folded(f'{file_path}_samples.folded', samples)
+        if self.mode == 'cprofile' and profiles:
+            stats = pstats.Stats(*profiles)
+            stats.dump_stats(f'{file_path}.prof')
+            written.append(f'{file_path}.prof')
+            write_folded(f'{file_path}_cprofile.folded',
+                         _collapse_pstats(stats))
+        return written
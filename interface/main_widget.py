@@ -40,19 +40,29 @@ from qgis.core import (QgsPointXY, QgsGeometry, QgsMapLayerProxyModel,
                        QgsTextBufferSettings, QgsVectorLayerSimpleLabeling,
                        QgsCoordinateReferenceSystem)
 from qgis.PyQt.QtWidgets import (QComboBox, QCheckBox, QMessageBox,
-                                 QDockWidget, QWidget, QFileDialog)
-from qgis.PyQt.QtGui import QTextCursor
+                                 QDockWidget, QWidget, QFileDialog, QToolTip)
+from qgis.PyQt.QtGui import QTextCursor, QCursor
 
 from .dialogs import ReverseResultsDialog, InspectResultsDialog, Dialog
 from .map_tools import FeaturePicker, FeatureDragger
 from .utils import (clone_layer, TopPlusOpen, get_geometries, LayerWrapper,
-                    clear_layout, ResField)
+                    clear_layout, ResField, Reply, Request, TrafficRecorder,
+                    ReplayTransport)
 from bkggeocoder.geocoder.bkg_geocoder import (BKGGeocoder, RS_PRESETS,
-                                               BKG_RESULT_FIELDS)
-from bkggeocoder.geocoder.geocoder import Geocoding, FieldMap, ReverseGeocoding
+                                               BKG_RESULT_FIELDS, Endpoint,
+                                               EndpointPool)
+from bkggeocoder.geocoder.geocoder import (Geocoding, FieldMap,
+                                           LiveReverseGeocoding, GeometryUnion)
+from bkggeocoder.geocoder.cache import (ReverseCache, CandidateIndex,
+                                        CapabilityCache)
+from bkggeocoder.geocoder.metrics import Metrics
+from bkggeocoder.geocoder.profiling import Profiler, profiled
 from bkggeocoder.config import (Config, STYLE_PATH, UI_PATH, HELP_URL,
-                                VERSION, DEFAULT_STYLE)
+                                VERSION, DEFAULT_STYLE, REVERSE_CACHE_FILE,
+                                CAPABILITY_CACHE_FILE, TRAFFIC_FILE,
+                                METRICS_PATH, PROFILE_PATH)
 import datetime
+import time
 
 config = Config()
 
@@ -97,6 +107,46 @@ class MainWidget(QDockWidget):
         # cache label fields, layer-ids as keys, field name as values
         self.label_cache = {}
         self.field_map = None
+        # cache replies of reverse geocoding requests for nearby points
+        self.reverse_cache = ReverseCache(
+            grid=config.reverse_cache_grid, max_size=config.reverse_cache_size,
+            file_path=REVERSE_CACHE_FILE if config.reverse_cache_persist
+            else None)
+        self.reverse_cache.load()
+        # spatial index of all results returned by the service in this session
+        self.candidate_index = CandidateIndex(
+            max_distance=config.local_candidates_distance)
+        # capabilities of the services (supported crs) from previous sessions
+        self.capability_cache = CapabilityCache(
+            file_path=CAPABILITY_CACHE_FILE)
+        self.capability_cache.load()
+        self._capability_request = None
+        # record the traffic with the service or serve it from a recording,
+        # api keys (also as part of the service url) are not recorded
+        secrets = [config.api_key]
+        if 'gdz_geokodierung__' in config.api_url:
+            secrets.append(config.api_url.split(
+                'gdz_geokodierung__')[1].split('/')[0])
+        Request.recorder = TrafficRecorder(
+            TRAFFIC_FILE, max_bytes=config.record_traffic_max_size * 1024 ** 2,
+            backups=config.record_traffic_backups, redact=secrets) \
+            if config.record_traffic else None
+        Request.replay = ReplayTransport(
+            config.replay_traffic, realtime=config.replay_traffic_realtime,
+            redact=secrets) if config.replay_traffic else None
+        # pool of services the requests are spread across, kept for the
+        # session to keep track of the health of the services
+        self.endpoint_pool = None
+        self._pool_settings = None
+        # united areas of spatial filters as wkt,
+        # (layer-id, selected feature-ids, crs) as keys
+        self.area_cache = {}
+        # ids of the layers whose changes invalidate the cached areas
+        self._area_watched = set()
+        # metrics of the current (resp. last) geocoding run
+        self.metrics = Metrics(parent=self)
+        # profiler of the current geocoding run if profiling is activated
+        self.profiler = None
 
         add_fields = [
             ResField('n_results', 'int2', alias='Anzahl der Ergebnisse',
@@ -115,6 +165,10 @@ class MainWidget(QDockWidget):
         self.inspect_dialog = None
         self.reverse_dialog = None
         self.geocoding = None
+        # long-lived worker for reverse geocoding dragged features
+        self.reverse_worker = None
+        self._reverse_settings = None
+        self._reverse_request = None
 
         self.iface = utils.iface
         self.canvas = self.iface.mapCanvas()
@@ -184,8 +238,15 @@ class MainWidget(QDockWidget):
             self.inspect_picker_button, canvas=self.canvas)
         self.inspect_picker.feature_picked.connect(self.inspect_results)
         self.reverse_picker = FeatureDragger(
-            self.reverse_picker_button, canvas=self.canvas)
+            self.reverse_picker_button, canvas=self.canvas,
+            pause_delay=config.reverse_preview_delay)
         self.reverse_picker.feature_dragged.connect(self.inspect_neighbours)
+        self.reverse_picker.drag_paused.connect(self.preview_neighbours)
+        self.reverse_picker.drag_resumed.connect(self.abort_preview)
+        # connect to the service already while the user picks a feature
+        self.reverse_picker_button.clicked.connect(
+            lambda checked: self.start_reverse_worker()
+            if checked and self.output else None)
 
         self.reverse_picker_button.setEnabled(False)
         self.inspect_picker_button.setEnabled(False)
@@ -405,17 +466,66 @@ class MainWidget(QDockWidget):
 
     def setup_crs(self):
         '''
-        request service-url for available crs and populate crs-combobox with
-        retrieved values
+        populate crs-combobox with the crs available at the service-url,
+        the cached capabilities of the service are applied immediately (if
+        cached), the service is requested in the background to revalidate
+        them
+        '''
+        url = config.api_url if config.use_api_url else None
+        index_url = BKGGeocoder.capabilities_url(key=config.api_key, url=url)
+        cached = self.capability_cache.get(index_url)
+        if cached:
+            self.apply_crs(cached['success'], cached['message'],
+                           cached['codes'])
+        else:
+            self.valid_bkg_key = False
+            self.toggle_start_button()
+
+        # only the reply to the latest settings is of interest
+        if self._capability_request:
+            self._capability_request.abort()
+        request = Request(synchronous=False)
+        self._capability_request = request
+
+        def done(reply: Reply):
+            self._capability_request = None
+            # cached capabilities are still valid
+            if cached and reply.status_code == 304:
+                return
+            # service currently not reachable, stick to the cached ones
+            if cached and reply.status_code is None:
+                return
+            success, msg, available_crs = BKGGeocoder.parse_crs(reply)
+            if reply.status_code is not None:
+                self.capability_cache.put(
+                    index_url, success, msg, available_crs,
+                    etag=reply.raw_header('ETag'),
+                    last_modified=reply.raw_header('Last-Modified'))
+            if (not cached or (success, msg, available_crs) !=
+                    (cached['success'], cached['message'], cached['codes'])):
+                self.apply_crs(success, msg, available_crs)
+
+        request.finished.connect(done)
+        headers = self.capability_cache.validation_headers(index_url) \
+            if cached else None
+        request.get(index_url, headers=headers)
+
+    def apply_crs(self, success: bool, msg: str, available_crs: List[tuple]):
+        '''
+        populate crs-combobox with given crs and show whether the service is
+        accessible
+
+        Parameters
+        ----------
+        success : bool
+            whether the service is accessible with the current key/url
+        msg : str
+            the error message shown if not accessible
+        available_crs : list
+            available crs as tuples (code, pretty name)
         '''
-        self.uuid_group.setEnabled(False)
-        self.request_start_button.setEnabled(False)
         current_crs = self.output_projection_combo.currentData()
         self.output_projection_combo.clear()
-        # fill crs combo
-        url = config.api_url if config.use_api_url else None
-        success, msg, available_crs = BKGGeocoder.get_crs(key=config.api_key,
-                                                          url=url)
         self.key_error_label.setText(msg)
         self.key_error_label.setVisible(not success)
         self.valid_bkg_key = success
@@ -425,7 +535,6 @@ class MainWidget(QDockWidget):
         if current_crs:
             idx = self.output_projection_combo.findData(current_crs)
             self.output_projection_combo.setCurrentIndex(idx)
-        self.uuid_group.setEnabled(True)
 
     def inspect_results(self, feature_id: int):
         '''
@@ -506,8 +615,6 @@ class MainWidget(QDockWidget):
             self._dragged_feature = dragged_feature
 
         crs = layer.crs().authid()
-        url = config.api_url if config.use_api_url else None
-
         output_crs = layer.crs()
         # point geometry originates from clicking on canvas ->
         # transform into crs of feature
@@ -523,21 +630,22 @@ class MainWidget(QDockWidget):
 
         # request feature again, otherwise geometry remains be unchanged
         dragged_feature = layer.getFeature(feature_id)
-        bkg_geocoder = BKGGeocoder(key=config.api_key, crs=crs, url=url,
-                                   logic_link=config.logic_link)
-        rev_geocoding = ReverseGeocoding(bkg_geocoder, [dragged_feature],
-                                         parent=self)
         def error(msg, level):
             self.log(msg, debug_only=True, level=level)
             QMessageBox.information(self, 'Fehler', msg)
-        rev_geocoding.error.connect(lambda msg: error(msg, Qgis.Critical))
-        rev_geocoding.warning.connect(lambda msg: error(msg, Qgis.Warning))
-        rev_geocoding.message.connect(
-            lambda msg: self.log(msg, debug_only=True))
 
-        def done(feature, r):
-            '''open dialog / set results when reverse geocoding is done'''
-            results = r.json()['features']
+        # known results near the point are shown before the service replies
+        local_results = self.candidate_index.nearest(
+            current_geom.asPoint(), crs, n=config.local_candidates_count)
+        dialog_closed = False
+
+        def show_results(feature, results):
+            '''open dialog / update results in opened dialog'''
+            nonlocal dialog_closed
+            # reply came in after user already closed the dialog opened with
+            # the local results
+            if dialog_closed:
+                return
             # only one opened dialog at a time
             if not self.reverse_dialog:
                 review_fields = [f for f in self.field_map.fields()
@@ -558,7 +666,10 @@ class MainWidget(QDockWidget):
                     # (no result is selected -> geometry of dragged point is
                     # kept)
                     if result:
-                        result['properties']['score'] = 1
+                        # the result may be part of the parsed json of the
+                        # reply or of the candidate index, don't modify it
+                        result = dict(result, properties=dict(
+                            result['properties'], score=1))
                         self.set_bkg_result(
                             feature, result, i=-1, set_edited=True,
                             geom_only=self.reverse_dialog.geom_only
@@ -579,6 +690,7 @@ class MainWidget(QDockWidget):
                 self.canvas.refresh()
                 self.reverse_dialog = None
                 self.reverse_picker.reset()
+                dialog_closed = True
             else:
                 # workaround for updating the feature position inside
                 # the dialog
@@ -586,9 +698,197 @@ class MainWidget(QDockWidget):
                 # update the result options in the dialog
                 self.reverse_dialog.update_results(results)
 
+        def done(feature, r):
+            '''merge local results with the reply of the reverse geocoding'''
+            results = r.json()['features']
+            self.candidate_index.add(results, crs)
+            results = CandidateIndex.merge(
+                current_geom.asPoint(), results, local_results)
+            show_results(feature, results)
+
         # do the actual reverse geocoding
-        rev_geocoding.feature_done.connect(done)
-        rev_geocoding.start()
+        self.request_reverse(dragged_feature, done, error)
+        if local_results:
+            show_results(dragged_feature, local_results)
+
+    def preview_neighbours(self, feature_id: int, point: QgsPointXY):
+        '''
+        reverse geocode given point while the feature with given id is still
+        being dragged, show the found addresses in the opened reverse dialog
+        or as a tooltip
+
+        Parameters
+        ----------
+        feature_id : int
+            id of the dragged feature
+        point : QgsPointXY
+            the current position of the dragged feature
+        '''
+        layer = self.output.layer if self.output else None
+        if not layer:
+            return
+        crs = layer.crs().authid()
+        transform = QgsCoordinateTransform(
+            self.canvas.mapSettings().destinationCrs(),
+            layer.crs(),
+            QgsProject.instance()
+        )
+        current_geom = QgsGeometry.fromPointXY(transform.transform(point))
+        # the feature itself is only moved when it is released
+        feature = layer.getFeature(feature_id)
+        feature.setGeometry(current_geom)
+
+        def done(feature, r):
+            results = r.json()['features']
+            self.candidate_index.add(results, crs)
+            local_results = self.candidate_index.nearest(
+                current_geom.asPoint(), crs, n=config.local_candidates_count)
+            results = CandidateIndex.merge(
+                current_geom.asPoint(), results, local_results)
+            if self.reverse_dialog:
+                self.reverse_dialog.feature.setGeometry(current_geom)
+                self.reverse_dialog.update_results(results)
+            elif results:
+                text = '<br>'.join(r['properties']['text'] for r in results)
+                QToolTip.showText(QCursor.pos(), text, self.canvas)
+
+        def error(msg, level):
+            self.log(msg, debug_only=True, level=level)
+
+        self.request_reverse(feature, done, error)
+
+    def abort_preview(self):
+        '''
+        abort the running reverse geocoding of the dragged feature
+        '''
+        QToolTip.hideText()
+        if self.reverse_worker:
+            self.reverse_worker.geocoder.abort()
+
+    def request_reverse(self, feature: QgsFeature, on_done: object,
+                        on_error: object):
+        '''
+        reverse geocode given feature with the long-lived reverse geocoding
+        worker, supersedes previous requests
+
+        Parameters
+        ----------
+        feature : QgsFeature
+            the feature with point geometry (in crs of current output layer)
+            to find addresses for
+        on_done : function
+            called with the feature and the reply when the request is done
+        on_error : function
+            called with the error message and the message level on error
+        '''
+        self.start_reverse_worker()
+        self._reverse_request = feature, on_done, on_error
+        self.reverse_worker.request(feature)
+
+    def start_reverse_worker(self):
+        '''
+        start the long-lived reverse geocoding worker if not running yet,
+        restart it if the settings changed
+        '''
+        crs = self.output.layer.crs().authid()
+        url = config.api_url if config.use_api_url else None
+        pool = self.get_endpoint_pool()
+        settings = (config.api_key, url, config.logic_link, crs,
+                    config.hedge_interactive, config.hedge_url, pool,
+                    config.reverse_result_count)
+        # (re)start worker if there is none (running) yet or the settings
+        # changed
+        if (not self.reverse_worker or not self.reverse_worker.isRunning()
+                or settings != self._reverse_settings):
+            self.stop_reverse_worker()
+            bkg_geocoder = BKGGeocoder(
+                key=config.api_key, crs=crs, url=url,
+                logic_link=config.logic_link, reverse_cache=self.reverse_cache,
+                adaptive_timeout=config.adaptive_timeout,
+                hedge=config.hedge_interactive, hedge_url=config.hedge_url,
+                pool=pool, count=config.reverse_result_count)
+            self.reverse_worker = LiveReverseGeocoding(bkg_geocoder,
+                                                       parent=self)
+            self._reverse_settings = settings
+            self.reverse_worker.feature_done.connect(self._reverse_done)
+            self.reverse_worker.warning.connect(
+                lambda msg: self._reverse_error(msg, Qgis.Warning))
+            self.reverse_worker.error.connect(
+                lambda msg: self._reverse_error(msg, Qgis.Critical))
+            self.reverse_worker.message.connect(
+                lambda msg: self.log(msg, debug_only=True))
+            self.reverse_worker.start()
+
+    def get_endpoint_pool(self) -> EndpointPool:
+        '''
+        pool of the service given by api key/url and the additional services
+        set in the config, the pool is reused as long as the services don't
+        change
+
+        Returns
+        ----------
+        EndpointPool
+            the pool, None if there are no additional services
+        '''
+        if not config.endpoints:
+            self.endpoint_pool = self._pool_settings = None
+            return None
+        url = config.api_url if config.use_api_url else None
+        settings = (config.api_key, url, repr(config.endpoints),
+                    config.endpoint_max_concurrent,
+                    config.endpoint_probe_interval)
+        if self.endpoint_pool and settings == self._pool_settings:
+            return self.endpoint_pool
+        max_concurrent = config.endpoint_max_concurrent
+        endpoints = [Endpoint(key=config.api_key, url=url,
+                              max_concurrent=max_concurrent)]
+        for e in config.endpoints:
+            try:
+                endpoints.append(Endpoint(
+                    key=e.get('key', ''), url=e.get('url', ''),
+                    max_concurrent=e.get('max_concurrent', max_concurrent)))
+            except (ValueError, AttributeError):
+                self.log(f'Ungültiger Dienst in der Konfiguration: {e}',
+                         level=Qgis.Warning)
+        self.endpoint_pool = EndpointPool(
+            endpoints, probe_interval=config.endpoint_probe_interval)
+        self._pool_settings = settings
+        return self.endpoint_pool
+
+    def _reverse_done(self, feature: QgsFeature, reply: Reply):
+        '''
+        pass reply of reverse geocoding to the callback of the latest request
+        '''
+        if not self._reverse_request:
+            return
+        requested, on_done, on_error = self._reverse_request
+        # reply was queued before a newer request was made
+        if (feature.id() != requested.id() or
+            feature.geometry().asPoint() != requested.geometry().asPoint()):
+            return
+        self._reverse_request = None
+        on_done(feature, reply)
+
+    def _reverse_error(self, msg: str, level: int):
+        '''
+        pass error of reverse geocoding to the callback of the latest request
+        '''
+        if not self._reverse_request:
+            return
+        requested, on_done, on_error = self._reverse_request
+        self._reverse_request = None
+        on_error(msg, level)
+
+    def stop_reverse_worker(self):
+        '''
+        kill the long-lived reverse geocoding worker
+        '''
+        if not self.reverse_worker:
+            return
+        self.reverse_worker.kill()
+        self.reverse_worker.wait()
+        self.reverse_worker = None
+        self._reverse_request = None
 
     def show_attribute_table(self):
         '''
@@ -686,6 +986,8 @@ class MainWidget(QDockWidget):
         '''
         self.reverse_picker.set_active(False)
         self.inspect_picker.set_active(False)
+        self.reverse_cache.save()
+        self.stop_reverse_worker()
         self.iface.removeDockWidget(self)
         self.closingWidget.emit()
         event.accept()
@@ -897,6 +1199,7 @@ class MainWidget(QDockWidget):
         if not layer:
             return
         self.progress_bar.setStyleSheet('')
+        self.stats_label.setText('')
         self.reverse_picker_button.setEnabled(False)
         self.inspect_picker_button.setEnabled(False)
         self.export_csv_button.setEnabled(False)
@@ -970,44 +1273,136 @@ class MainWidget(QDockWidget):
         layer.setReadOnly(True)
         self.output.layer.setReadOnly(True)
 
-        area_wkt = None
-        if self.use_spatial_filter_check.isChecked():
-            spatial_layer = self.spatial_filter_combo.currentLayer()
-            if spatial_layer:
-                selected_only = self.spatial_selected_only_check.isChecked()
-                geometries = get_geometries(
-                    spatial_layer, selected=selected_only,
-                    crs=config.projection)
-                union = None
-                for geom in geometries:
-                    union = geom if not union else union.combine(geom)
-                area_wkt = union.asWkt()
+        self.inspect_picker.set_layer(self.output.layer)
+        self.reverse_picker.set_layer(self.output.layer)
+
+        self.tab_widget.setCurrentIndex(2)
 
-        url = config.api_url if config.use_api_url else None
+        # add active result fields if they are not already part of the layer
+        add_fields = [f[0].to_qgs_field() for f in self.result_fields.values()
+                      if f[1] and f[0].idx(layer) < 0]
+        self.output.layer.dataProvider().addAttributes(add_fields)
+        self.output.layer.updateFields()
+        self.apply_output_style()
+
+        self.request_start_button.setVisible(False)
+        self.request_stop_button.setVisible(True)
+        self.log(f'<br>Starte Geokodierung <b>{layer.name()}</b>')
+        self.start_time = datetime.datetime.now()
+        self.timer.start(1000)
+
+        if config.load_background:
+            self.add_background()
 
-        bkg_geocoder = BKGGeocoder(key=config.api_key, crs=config.projection,
-                                   url=url, logic_link=config.logic_link, rs=rs,
-                                   area_wkt=area_wkt, fuzzy=config.fuzzy)
+        spatial_layer = self.spatial_filter_combo.currentLayer() \
+            if self.use_spatial_filter_check.isChecked() else None
+        if not spatial_layer:
+            self.start_geocoding(features, rs=rs)
+            return
+        selected_only = self.spatial_selected_only_check.isChecked()
+        selected_ids = tuple(sorted(spatial_layer.selectedFeatureIds())) \
+            if selected_only else None
+        key = (spatial_layer.id(), selected_ids, config.projection)
+        area_wkt = self.area_cache.get(key)
+        if area_wkt is not None:
+            self.start_geocoding(features, rs=rs, area_wkt=area_wkt)
+            return
+
+        geometries = get_geometries(spatial_layer, selected=selected_only,
+                                    crs=config.projection)
+        self.log('Vereinige die Geometrien des räumlichen Filters...')
+        union = GeometryUnion(geometries, parent=self)
+
+        def union_done(success):
+            self.geocoding = None
+            if not success or union.is_killed:
+                self.geocoding_done(False)
+                return
+            area_wkt = union.union.asWkt()
+            # changed geometries invalidate the cached areas of the layer
+            if key[0] not in self._area_watched:
+                self._area_watched.add(key[0])
+                spatial_layer.dataChanged.connect(
+                    lambda: self.clear_area_cache(key[0]))
+            self.area_cache[key] = area_wkt
+            self.start_geocoding(features, rs=rs, area_wkt=area_wkt)
+
+        union.error.connect(lambda msg: self.log(msg, level=Qgis.Critical))
+        union.finished.connect(union_done)
+        # the stop button kills the union as well
+        self.geocoding = union
+        union.start()
+
+    def clear_area_cache(self, layer_id: str):
+        '''
+        remove the cached united areas of the spatial filter layer with given
+        id
+        '''
+        for k in [k for k in self.area_cache if k[0] == layer_id]:
+            self.area_cache.pop(k)
+
+    def start_geocoding(self, features: List[QgsFeature], rs: str = None,
+                        area_wkt: str = None):
+        '''
+        start the geocoding worker with current settings
+
+        Parameters
+        ----------
+        features : list
+            the features of the output layer to geocode
+        rs : str, optional
+            "Regionalschlüssel" to restrict the results to, defaults to no
+            restriction
+        area_wkt : str, optional
+            wkt of the area to restrict the results to, defaults to no
+            restriction
+        '''
+        url = config.api_url if config.use_api_url else None
+        self.metrics.reset()
+        if config.profiling:
+            try:
+                self.profiler = Profiler(mode=config.profiling_mode,
+                                         interval=config.profiling_interval)
+                self.profiler.start()
+            except ValueError as e:
+                self.log(str(e), level=Qgis.Warning)
+
+        bkg_geocoder = BKGGeocoder(
+            key=config.api_key, crs=config.projection, url=url,
+            logic_link=config.logic_link, rs=rs, area_wkt=area_wkt,
+            fuzzy=config.fuzzy, adaptive_timeout=config.adaptive_timeout,
+            pool=self.get_endpoint_pool(),
+            simplify_area=config.spatial_filter_simplify,
+            area_max_vertices=config.spatial_filter_max_vertices,
+            count=config.bulk_result_count, metrics=self.metrics)
         self.geocoding = Geocoding(bkg_geocoder, self.field_map,
-                                   features=features, parent=self)
+                                   features=features, metrics=self.metrics,
+                                   parent=self)
 
         self.geocoding.message.connect(
             lambda msg: self.log(msg, debug_only=True))
 
+        @profiled('feature_done')
         def feature_done(f, r):
             label = f.attribute(self.label_field_name) \
                 if (self.label_field_name) else f'Feature {f.id()}'
+            start = time.perf_counter()
             results = r.json()['features']
+            self.metrics.observe('parse', (time.perf_counter() - start) * 1000)
+            self.metrics.count('features')
             message = (f'{label} -> <b>{len(results)} </b> Ergebnis(se)')
             if len(results) > 0:
                 self.success_count += 1
             self.log(
                 message, level=Qgis.Info if len(results) > 0 else Qgis.Warning)
             self.output.layer.setReadOnly(False)
+            start = time.perf_counter()
             self.store_bkg_results(f, results)
+            self.metrics.observe('write', (time.perf_counter() - start) * 1000)
             self.output.layer.setReadOnly(True)
 
         self.geocoding.progress.connect(self.progress_bar.setValue)
+        self.geocoding.stats.connect(self.update_stats)
         self.geocoding.feature_done.connect(feature_done)
         self.geocoding.error.connect(
             lambda msg: self.log(msg, level=Qgis.Critical))
@@ -1015,26 +1410,6 @@ class MainWidget(QDockWidget):
             lambda msg: self.log(msg, level=Qgis.Warning))
         self.geocoding.finished.connect(self.geocoding_done)
 
-        self.inspect_picker.set_layer(self.output.layer)
-        self.reverse_picker.set_layer(self.output.layer)
-
-        self.tab_widget.setCurrentIndex(2)
-
-        # add active result fields if they are not already part of the layer
-        add_fields = [f[0].to_qgs_field() for f in self.result_fields.values()
-                      if f[1] and f[0].idx(layer) < 0]
-        self.output.layer.dataProvider().addAttributes(add_fields)
-        self.output.layer.updateFields()
-        self.apply_output_style()
-
-        self.request_start_button.setVisible(False)
-        self.request_stop_button.setVisible(True)
-        self.log(f'<br>Starte Geokodierung <b>{layer.name()}</b>')
-        self.start_time = datetime.datetime.now()
-        self.timer.start(1000)
-
-        if config.load_background:
-            self.add_background()
         self.geocoding.start()
 
     def update_timer(self):
@@ -1047,6 +1422,77 @@ class MainWidget(QDockWidget):
         timer_text = '{:02d}:{:02d}:{:02d}'.format(h, m, s)
         self.elapsed_time_label.setText(timer_text)
 
+    def update_stats(self, stats: dict):
+        '''
+        show the throughput and the estimated remaining time of the running
+        geocoding
+
+        Parameters
+        ----------
+        stats : dict
+            statistics of the progress as emitted by the geocoding
+        '''
+        parts = [f'{stats["done"]}/{stats["total"]} Features']
+        if stats['features_per_s_avg'] is not None:
+            parts.append(f'{stats["features_per_s_avg"]:.1f} Features/s')
+        if stats['requests_per_s'] is not None:
+            parts.append(f'{stats["requests_per_s"]:.1f} Anfragen/s')
+        parts.append(f'{stats["concurrency"]} laufende Anfrage(n)')
+        if stats['cache_hit_rate'] is not None:
+            parts.append(f'Cache-Trefferquote {stats["cache_hit_rate"]:.0%}')
+        if stats['eta'] is not None and stats['done'] < stats['total']:
+            m, s = divmod(int(stats['eta']), 60)
+            h, m = divmod(m, 60)
+            parts.append(f'Restzeit ca. {h:02d}:{m:02d}:{s:02d}')
+        self.stats_label.setText(' | '.join(parts))
+
+    def export_metrics(self, snapshot: dict):
+        '''
+        write the metrics of the finished run as json and csv into the metrics
+        directory if activated in the config
+
+        Parameters
+        ----------
+        snapshot : dict
+            snapshot of the metrics of the run
+        '''
+        if not config.export_metrics:
+            return
+        started = self.metrics.started.strftime('%Y%m%d_%H%M%S')
+        file_path = os.path.join(METRICS_PATH, f'geokodierung_{started}')
+        try:
+            for ext in ['json', 'csv']:
+                self.metrics.export(f'{file_path}.{ext}', snapshot=snapshot)
+        except OSError as e:
+            self.log(f'Metriken konnten nicht exportiert werden: {e}',
+                     level=Qgis.Warning)
+            return
+        self.log(f'Metriken exportiert nach {file_path}.json/.csv')
+
+    def save_profile(self):
+        '''
+        stop the profiler of the finished run (if profiling) and write the
+        profile into the profiles directory
+        '''
+        if not self.profiler:
+            return
+        profiler = self.profiler
+        self.profiler = None
+        profiler.stop()
+        started = profiler.started.strftime('%Y%m%d_%H%M%S')
+        file_path = os.path.join(PROFILE_PATH, f'geokodierung_{started}')
+        try:
+            written = profiler.save(file_path)
+        except OSError as e:
+            self.log(f'Profil konnte nicht gespeichert werden: {e}',
+                     level=Qgis.Warning)
+            return
+        for phase, timer in profiler.summary().items():
+            self.log(f'Profil {phase}: {timer["count"]}x, '
+                     f'gesamt {timer["total_ms"]:.0f} ms, '
+                     f'max. {timer["max_ms"]:.0f} ms', debug_only=True)
+        self.log(f'Profil gespeichert nach {", ".join(written)}')
+
     def geocoding_done(self, success: bool):
         '''
         update UI when geocoding is done
@@ -1057,6 +1503,8 @@ class MainWidget(QDockWidget):
             whether the geocoding was run successfully without errors or not
         '''
         self.geocoding = None
+        self.export_metrics(self.metrics.publish())
+        self.save_profile()
         if not self.input or not self.output:
             return
         self.input.layer.setReadOnly(False)
@@ -1110,13 +1558,19 @@ class MainWidget(QDockWidget):
         if not self.output:
             return
         if results:
-            results.sort(key=lambda x: x['properties']['score'], reverse=True)
+            # the list is the memoised json of the reply, don't sort in place,
+            # the number of candidates is already limited by the geocoder
+            # (config.bulk_result_count, after the spatial filter)
+            results = sorted(results, key=lambda x: x['properties']['score'],
+                             reverse=True)
             best = results[0]
         else:
             best = None
         self.result_cache[self.output.id, feature.id()] = results
+        self.candidate_index.add(results, self.output.layer.crs().authid())
         self.set_bkg_result(feature, best, i=0, n_results=len(results))
 
+    @profiled('set_bkg_result')
     def set_bkg_result(self, feature: QgsFeature, result: dict, i: int = -1,
                        n_results: int = None, geom_only: bool = False,
                        set_edited: bool = False):  #, apply_adress=False):
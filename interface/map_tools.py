@@ -23,7 +23,7 @@ __date__ = '08/04/2020'
 
 from qgis import utils
 from typing import List
-from qgis.PyQt.QtCore import pyqtSignal, Qt
+from qgis.PyQt.QtCore import pyqtSignal, Qt, QTimer
 from qgis.PyQt.QtGui import QCursor, QColor
 from qgis.PyQt.Qt import QWidget
 from qgis.gui import (QgsMapToolEmitPoint, QgsMapToolIdentify, QgsVertexMarker,
@@ -170,14 +170,22 @@ class FeatureDragger(FeaturePicker):
     feature_dragged : pyqtSignal
         emitted when a feature is dragged or clicked on the map canvas,
         (feature id, release position)
+    drag_paused : pyqtSignal
+        emitted when the mouse rests while dragging a feature,
+        (feature id, current position)
+    drag_resumed : pyqtSignal
+        emitted when the mouse is moved again after the dragging was paused
+        (or the feature is released)
     drag_cursor : QCursor
         the appearance of the cursor while dragging a feature
     '''
     feature_dragged = pyqtSignal(int, QgsPointXY)
+    drag_paused = pyqtSignal(int, QgsPointXY)
+    drag_resumed = pyqtSignal()
     drag_cursor = QCursor(Qt.DragMoveCursor)
 
     def __init__(self, ui_element: QWidget, layers: List[QgsVectorLayer] = [],
-                 canvas: QgsMapCanvas = None):
+                 canvas: QgsMapCanvas = None, pause_delay: int = 300):
         '''
         Parameters
         ----------
@@ -190,11 +198,29 @@ class FeatureDragger(FeaturePicker):
         canvas : QgsMapCanvas, optional
             the map canvas the tool will work on, defaults to the map canvas of
             the QGIS UI
+        pause_delay : int, optional
+            time in milliseconds the mouse has to rest while dragging to emit
+            the drag_paused signal, 0 to never emit it, defaults to 300 ms
         '''
         super().__init__(ui_element, layers=layers, canvas=canvas)
         self._marker = None
         self._picked_feature = None
         self._dragging = False
+        self._paused = False
+        self.pause_delay = pause_delay
+        self._pause_timer = QTimer()
+        self._pause_timer.setSingleShot(True)
+        self._pause_timer.timeout.connect(self._pause)
+
+    def _pause(self):
+        '''
+        emit position of marker when mouse rested while dragging
+        '''
+        if not self._dragging or not self._marker:
+            return
+        self._paused = True
+        point = self.toMapCoordinates(self._marker.pos().toPoint())
+        self.drag_paused.emit(self._picked_feature, point)
 
     def reset(self):
         '''
@@ -249,12 +275,21 @@ class FeatureDragger(FeaturePicker):
         # update position of marker while dragging
         point = self.toMapCoordinates(e.pos())
         self._marker.setCenter(point)
+        if self._paused:
+            self._paused = False
+            self.drag_resumed.emit()
+        if self.pause_delay > 0:
+            self._pause_timer.start(self.pause_delay)
 
     def canvasReleaseEvent(self, mouseEvent):
         '''
         override, emit geometry of position of marker on mouse release
         '''
         self._dragging = False
+        self._pause_timer.stop()
+        if self._paused:
+            self._paused = False
+            self.drag_resumed.emit()
         if self._picked_feature is None:
             return
         self.canvas.setCursor(self.cursor)
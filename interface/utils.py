@@ -21,7 +21,7 @@ utility functions used by the UI
 __author__ = 'Christoph Franke'
 __date__ = '02/04/2020'
 
-from typing import List
+from typing import List, Tuple
 from qgis.core import (QgsVectorLayer, QgsProject, QgsCoordinateTransform,
                        QgsRasterLayer, QgsCoordinateReferenceSystem, QgsFeature,
                        QgsNetworkAccessManager, QgsLayerTreeGroup, QgsGeometry,
@@ -29,9 +29,17 @@ from qgis.core import (QgsVectorLayer, QgsProject, QgsCoordinateTransform,
 from qgis.utils import iface
 from qgis.PyQt.QtWidgets import QLayout
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
-from qgis.PyQt.QtCore import (QUrl, QEventLoop, QTimer, QUrlQuery,
-                              QObject, pyqtSignal, QVariant)
+from qgis.PyQt.QtCore import (QUrl, QEventLoop, QTimer, QUrlQuery, Qt,
+                              QObject, pyqtSignal, QVariant, QMetaObject,
+                              QCoreApplication, QEvent, QThread)
+from collections import deque
+import threading
+import datetime
+import hashlib
+import base64
 import json
+import time
+import os
 
 
 class ResField:
@@ -591,24 +599,41 @@ class TopPlusOpen(TileLayer):
         super().__init__(url, groupname=groupname, prepend=prepend)
 
 
+# marks the parsed json of a reply as not parsed yet
+_UNPARSED = object()
+
+
 class Reply:
     '''
-    wrapper of qnetworkreply to match interface of requests library
+    wrapper of qnetworkreply to match interface of requests library,
+    status, url, headers and payload are copied out of the reply once on
+    creation, the reply itself is not referenced and can be deleted right
+    away
     '''
+    __slots__ = ('_url', '_status_code', '_headers', '_content', '_json')
+
     def __init__(self, reply: QNetworkReply):
         '''
         Parameters
         ----------
         reply : QNetworkReply
-            the reply of a QNetworkRequest to wrap
-        '''
-        self.reply = reply
+            the finished reply of a QNetworkRequest to copy
+        '''
+        self._url = reply.request().url().url()
+        self._status_code = reply.attribute(
+            QNetworkRequest.HttpStatusCodeAttribute)
+        self._headers = {
+            bytes(k).decode('latin-1').lower(): bytes(v).decode('latin-1')
+            for k, v in reply.rawHeaderPairs()
+        }
         # streamed
         if hasattr(reply, 'readAll'):
-            self.raw_data = reply.readAll()
+            raw_data = reply.readAll()
         # reply received with blocking call
         else:
-            self.raw_data = reply.content()
+            raw_data = reply.content()
+        self._content = raw_data.data()
+        self._json = _UNPARSED
 
     @property
     def url(self) -> str:
@@ -618,7 +643,7 @@ class Reply:
         str
             the requested URL
         '''
-        return self.reply.request().url().url()
+        return self._url
 
     @property
     def status_code(self) -> int:
@@ -628,17 +653,28 @@ class Reply:
         int
             the HTML status code returned by the requested server
         '''
-        return self.reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        return self._status_code
 
     @property
-    def content(self) -> str:
+    def content(self) -> bytes:
         '''
         Returns
         ----------
-        str
-            the response of the server
+        bytes
+            the response of the server (not copied on access)
         '''
-        return self.raw_data.data()
+        return self._content
+
+    @property
+    def view(self) -> memoryview:
+        '''
+        Returns
+        ----------
+        memoryview
+            read-only view of the response of the server, slicing it does not
+            copy the payload
+        '''
+        return memoryview(self.content)
 
     def raise_for_status(self):
         '''
@@ -649,14 +685,17 @@ class Reply:
 
     def json(self) -> dict:
         '''
-        parse response into a json object
+        parse response into a json object, the response is parsed only on the
+        first call, all calls return the same object (do not modify it)
 
         Returns
         ----------
         dict
             the response as a json-style dictionary
         '''
-        return json.loads(self.content)
+        if self._json is _UNPARSED:
+            self._json = json.loads(self._content)
+        return self._json
 
     @property
     def headers(self) -> dict:
@@ -664,15 +703,358 @@ class Reply:
         Returns
         ----------
         dict
-            the headers of the response
+            the headers of the response, lower case header names as keys
+        '''
+        return dict(self._headers)
+
+    def raw_header(self, name: str) -> str:
+        '''
+        Parameters
+        ----------
+        name : str
+            name of the header (e.g. "ETag"), case-insensitive
+
+        Returns
+        ----------
+        str
+            the value of the header of the response, empty string if not
+            set
+        '''
+        return self._headers.get(name.lower(), '')
+
+
+class DetachedReply(Reply):
+    '''
+    lightweight reply holding only the url, status code and payload (e.g.
+    restored from a cache), matches the interface of Reply without being
+    created from a QNetworkReply
+    '''
+    __slots__ = ()
+
+    def __init__(self, url: str, status_code: int, content: bytes = None,
+                 headers: dict = None, parsed: dict = None):
+        '''
+        Parameters
+        ----------
+        url : str
+            the originally requested URL
+        status_code : int
+            the HTML status code originally returned by the requested server
+        content : bytes
+            the original response of the server
+        headers : dict, optional
+            the headers of the response, defaults to no headers
+        parsed : dict, optional
+            the response already parsed as a json object, returned by json()
+            as is, the content is only serialized from it if accessed,
+            defaults to parsing the content
+        '''
+        if content is None and parsed is None:
+            raise ValueError('either content or parsed json has to be passed')
+        self._url = url
+        self._status_code = status_code
+        self._content = content
+        self._headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self._json = parsed if parsed is not None else _UNPARSED
+
+    @property
+    def content(self) -> bytes:
+        '''
+        Returns
+        ----------
+        bytes
+            the response of the server resp. the serialized parsed json
+        '''
+        if self._content is None:
+            self._content = json.dumps(self._json).encode('utf-8')
+        return self._content
+
+
+class LatencyHistogram:
+    '''
+    rolling window of the latencies of the most recent requests to an
+    endpoint, thread-safe
+    '''
+    def __init__(self, size: int = 500):
         '''
-        headers = {}
-        for h in ['ContentDispositionHeader', 'ContentTypeHeader',
-                  'LastModifiedHeader', 'ContentLengthHeader',
-                  'CookieHeader', 'LocationHeader',
-                  'UserAgentHeader', 'LocationHeader']:
-            headers[h] = self.reply.header(getattr(QNetworkRequest, h))
-        return headers
+        Parameters
+        ----------
+        size : int, optional
+            number of latencies kept, defaults to the latest 500 requests
+        '''
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        '''
+        add the latency of a request
+
+        Parameters
+        ----------
+        latency : float
+            the time in milliseconds the request took
+        '''
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, q: float) -> float:
+        '''
+        percentile of the recorded latencies
+
+        Parameters
+        ----------
+        q : float
+            the percentile to compute (0-100)
+
+        Returns
+        ----------
+        float
+            the latency in milliseconds, None if nothing was recorded yet
+        '''
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(len(samples) * q / 100))
+        return samples[idx]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+def _split_url(url: str, redact: List[str] = None) -> Tuple[str, dict]:
+    '''
+    url without the query and the query parameters, the given secrets (e.g.
+    api keys) are replaced in both
+    '''
+    qurl = QUrl(url)
+    params = {k: v for k, v in
+              QUrlQuery(qurl).queryItems(QUrl.FullyDecoded)}
+    base = qurl.toString(QUrl.RemoveQuery)
+    for secret in (redact or []):
+        if not secret:
+            continue
+        base = base.replace(secret, '***')
+        params = {k: v.replace(secret, '***') for k, v in params.items()}
+    return base, params
+
+
+class TrafficRecorder:
+    '''
+    appends the requests made by Request and the responses to a JSONL file
+    (one request per line), the file is rotated when exceeding the max. size,
+    thread-safe
+
+    a line contains the method, the url (without query), the query parameters,
+    the SHA-256 hash and size of the posted body, the status code, headers and
+    body of the response (base64 encoded as "body_base64" if not utf-8), the
+    latency in milliseconds and the error if the request failed. If a
+    duplicate of the request was sent (hedging), "hedge" contains its url,
+    parameters, latency and whether its response was taken ("won")
+    '''
+    def __init__(self, file_path: str, max_bytes: int = 50 * 1024 ** 2,
+                 backups: int = 5, redact: List[str] = None):
+        '''
+        Parameters
+        ----------
+        file_path : str
+            path to the JSONL file the traffic is appended to
+        max_bytes : int, optional
+            size of the file in bytes before it is rotated, defaults to 50 MB
+        backups : int, optional
+            number of rotated files kept ("<file_path>.1" being the latest),
+            defaults to 5
+        redact : list, optional
+            secrets (e.g. api keys) not to write into the file, they are
+            replaced with "***" in urls and parameters
+        '''
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.redact = redact or []
+        self._lock = threading.Lock()
+
+    def record(self, method: str, url: str, data: bytes, latency: float,
+               reply: Reply = None, error: str = None, hedge: dict = None):
+        '''
+        append a request and its response
+
+        Parameters
+        ----------
+        method : str
+            the request method ('GET' or 'POST')
+        url : str
+            the requested url including the query
+        data : bytes
+            the posted data
+        latency : float
+            the time in milliseconds the request took
+        reply : Reply, optional
+            the response, None if the request failed
+        error : str, optional
+            the error message if the request failed
+        hedge : dict, optional
+            the duplicate of the request if one was sent, "url" including the
+            query, "latency" in milliseconds and "won" (whether its response
+            was taken)
+        '''
+        base, params = _split_url(url, redact=self.redact)
+        entry = {
+            'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'method': method,
+            'url': base,
+            'params': params,
+            'body_sha256': hashlib.sha256(data).hexdigest() if data else None,
+            'body_size': len(data or b''),
+            'status': reply.status_code if reply else None,
+            'headers': reply.headers if reply else {},
+            'latency': round(latency, 3),
+            'error': error,
+        }
+        if hedge:
+            hedge_base, hedge_params = _split_url(hedge['url'],
+                                                  redact=self.redact)
+            entry['hedge'] = {
+                'url': hedge_base,
+                'params': hedge_params,
+                'latency': round(hedge['latency'], 3),
+                'won': hedge['won'],
+            }
+        if reply:
+            try:
+                entry['body'] = reply.content.decode('utf-8')
+            except UnicodeDecodeError:
+                entry['body_base64'] = base64.b64encode(
+                    reply.content).decode('ascii')
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            if (os.path.exists(self.file_path) and
+                os.path.getsize(self.file_path) + len(line) > self.max_bytes):
+                self._rotate()
+            with open(self.file_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f'{self.file_path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.file_path}.{i + 1}')
+        if self.backups > 0:
+            os.replace(self.file_path, f'{self.file_path}.1')
+        else:
+            os.remove(self.file_path)
+
+
+class ReplayTransport:
+    '''
+    serves requests from the traffic recorded by a TrafficRecorder instead of
+    sending them, thread-safe
+
+    requests are matched by method, url, parameters and the hash of the posted
+    body, identical requests get the recorded responses in the order they
+    were recorded (starting over when all were served), so that replaying is
+    deterministic. Hedged requests are replayed as one request, the recorded
+    duplicate is returned along with the response
+    '''
+    def __init__(self, file_path: str, realtime: bool = False,
+                 redact: List[str] = None):
+        '''
+        Parameters
+        ----------
+        file_path : str
+            path to the recorded JSONL file, the rotated files next to it are
+            replayed as well
+        realtime : bool, optional
+            delay the responses by the recorded latencies, defaults to
+            responding immediately
+        redact : list, optional
+            secrets replaced when recording, requests are matched with
+            these secrets replaced
+        '''
+        self.file_path = file_path
+        self.realtime = realtime
+        self.redact = redact or []
+        self._recordings = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(method: str, url: str, params: dict, body_sha256: str) -> tuple:
+        return (method, url, tuple(sorted(params.items())), body_sha256)
+
+    def load(self):
+        '''
+        (re)load the recordings, oldest files first
+        '''
+        rotated = []
+        for i in range(1, 1000):
+            fp = f'{self.file_path}.{i}'
+            if not os.path.exists(fp):
+                break
+            rotated.insert(0, fp)
+        recordings = {}
+        for fp in rotated + [self.file_path]:
+            if not os.path.exists(fp):
+                continue
+            with open(fp, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    key = self.key(entry['method'], entry['url'],
+                                   entry['params'], entry['body_sha256'])
+                    recordings.setdefault(key, []).append(entry)
+        with self._lock:
+            self._recordings = recordings
+            self._positions = {}
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._recordings.values())
+
+    def reply(self, method: str, url: str,
+              data: bytes = b'') -> Tuple[Reply, float, dict]:
+        '''
+        the recorded response to a request, raises a ConnectionError if
+        the request failed when recorded or was not recorded at all
+
+        Parameters
+        ----------
+        method : str
+            the request method ('GET' or 'POST')
+        url : str
+            the requested url including the query
+        data : bytes, optional
+            the posted data
+
+        Returns
+        ----------
+        tuple
+            the recorded response, the latency in milliseconds and the
+            recorded duplicate of the request (see TrafficRecorder.record,
+            None if the request was not hedged)
+        '''
+        base, params = _split_url(url, redact=self.redact)
+        key = self.key(method, base, params,
+                       hashlib.sha256(data).hexdigest() if data else None)
+        with self._lock:
+            entries = self._recordings.get(key)
+            if not entries:
+                raise ConnectionError(f'Anfrage nicht aufgezeichnet: {url}')
+            pos = self._positions.get(key, 0)
+            self._positions[key] = (pos + 1) % len(entries)
+        entry = entries[pos]
+        if self.realtime:
+            time.sleep(entry['latency'] / 1000)
+        if entry['error'] is not None and entry['status'] is None:
+            raise ConnectionError(entry['error'])
+        if 'body_base64' in entry:
+            content = base64.b64decode(entry['body_base64'])
+        else:
+            content = entry.get('body', '').encode('utf-8')
+        reply = DetachedReply(url, entry['status'], content,
+                              headers=entry['headers'])
+        return reply, entry['latency'], entry.get('hedge')
 
 
 class Request(QObject):
@@ -690,28 +1072,246 @@ class Request(QObject):
         emitted on error, error message
     progress : pyqtSignal
         emitted on progress, percentage of progress
+    latencies : dict
+        rolling latencies of the synchronous requests of all instances,
+        (method, endpoint) as keys and LatencyHistograms as values
+    default_timeout : int
+        timeout of synchronous requests in milliseconds if no timeout is
+        given, upper limit of adaptive timeouts
+    min_timeout : int
+        lower limit of adaptive timeouts in milliseconds
+    timeout_factor : float
+        adaptive timeouts are the 99th percentile of the latencies of the
+        requested endpoint multiplied by this factor
+    min_samples : int
+        number of recorded latencies needed to adapt timeouts of an endpoint
+        or to hedge requests to it
+    max_hedge_ratio : float
+        maximum share of the synchronous requests of an instance that are
+        hedged
+    http2 : bool
+        allow HTTP/2 if supported by Qt and the server
+    pipelining : bool
+        allow HTTP pipelining on persistent connections
+    recorder : TrafficRecorder
+        records the requests of all instances and their responses if set
+    replay : ReplayTransport
+        serves the requests of all instances from recorded traffic instead of
+        sending them if set
     '''
     finished = pyqtSignal(Reply)
     error = pyqtSignal(str)
     progress = pyqtSignal(int)
 
-    def __init__(self, synchronous: bool = True):
+    latencies = {}
+    _latencies_lock = threading.Lock()
+    default_timeout = 20000
+    min_timeout = 1000
+    timeout_factor = 3
+    min_samples = 20
+    max_hedge_ratio = 0.1
+    http2 = True
+    pipelining = True
+    recorder = None
+    replay = None
+
+    def __init__(self, synchronous: bool = True,
+                 adaptive_timeout: bool = False, hedge: bool = False,
+                 alternatives: dict = None, metrics: 'Metrics' = None):
         '''
         Parameters
         ----------
         synchronous : bool, optional
             requests are made either synchronous (True) or asynchronous (False),
             defaults to synchronous calls
+        adaptive_timeout : bool, optional
+            derive the timeouts of synchronous requests from the observed
+            latencies of the requested endpoints if no timeout is given,
+            defaults to a fixed timeout (default_timeout)
+        hedge : bool, optional
+            send a duplicate of a synchronous request if it takes longer than
+            the 95th percentile of the latencies of the endpoint, the reply
+            coming in first is taken, the other request is aborted,
+            defaults to not hedging requests
+        alternatives : dict, optional
+            urls of alternative endpoints duplicate requests are sent to
+            instead of the original endpoint, url prefixes of the original
+            endpoints as keys and the prefixes to replace them with as values,
+            defaults to sending duplicates to the original endpoints
+        metrics : Metrics, optional
+            registry the requests (counts, status codes, sizes, latencies)
+            are reported to, defaults to no reporting
         '''
         super().__init__()
         self.synchronous = synchronous
+        self.adaptive_timeout = adaptive_timeout
+        self.hedge = hedge
+        self.alternatives = alternatives or {}
+        self.metrics = metrics
+        self._n_requests = 0
+        self._n_hedged = 0
+        # event loops of the running synchronous requests
+        self._loops = set()
+        # replies of the running asynchronous requests
+        self._replies = set()
+        # set on abort, synchronous requests are aborted right away until
+        # resumed
+        self._aborted = threading.Event()
+
+    @property
+    def running(self) -> int:
+        '''
+        number of requests currently in flight (hedged duplicates counted
+        separately), thread-safe
+        '''
+        return (sum(len(loop.replies) for loop in list(self._loops)) +
+                len(self._replies))
+
+    def abort(self):
+        '''
+        abort all running requests, aborted synchronous requests raise an
+        InterruptedError, aborted asynchronous requests emit neither the
+        finished nor the error signal, thread-safe. Synchronous requests made
+        after aborting are aborted as well until resume() is called
+        '''
+        self._aborted.set()
+        for loop in list(self._loops):
+            loop.aborted = True
+            # loop is running in the thread the request was made in, quit it
+            # there (queued if called from a different thread)
+            QMetaObject.invokeMethod(loop, 'quit')
+        for reply in list(self._replies):
+            QMetaObject.invokeMethod(reply, 'abort')
+
+    def resume(self):
+        '''
+        allow synchronous requests again after abort(), to be called by the
+        owner of the requests before making new ones
+        '''
+        self._aborted.clear()
 
     @property
     def _manager(self) -> QgsNetworkAccessManager:
         return QgsNetworkAccessManager.instance()
 
+    def _network_request(self, qurl: QUrl,
+                         headers: dict = None) -> QNetworkRequest:
+        '''
+        request to given url with the transport options and given headers
+        set, compression (gzip, deflate) is negotiated and decoded by Qt
+        itself as long as no "Accept-Encoding" header is set manually
+        '''
+        request = QNetworkRequest(qurl)
+        for header, value in (headers or {}).items():
+            request.setRawHeader(header.encode('utf-8'),
+                                 str(value).encode('utf-8'))
+        request.setAttribute(QNetworkRequest.HttpPipeliningAllowedAttribute,
+                             self.pipelining)
+        # Qt 5.8+
+        http2 = getattr(QNetworkRequest, 'Http2AllowedAttribute', None)
+        if http2 is not None:
+            request.setAttribute(http2, self.http2)
+        return request
+
+    def warm_up(self, url: str):
+        '''
+        open a (persistent) connection to the host of given url in advance,
+        so that the first request doesn't have to wait for the TCP and TLS
+        handshakes. The connection is made by the network manager of the
+        calling thread and can only be reused by requests made in this thread
+
+        Parameters
+        ----------
+        url : str
+            url of the host to connect to
+        '''
+        qurl = QUrl(url)
+        host = qurl.host()
+        if not host:
+            return
+        if qurl.scheme() == 'https':
+            self._manager.connectToHostEncrypted(host, qurl.port(443))
+        else:
+            self._manager.connectToHost(host, qurl.port(80))
+
+    @classmethod
+    def latency(cls, method: str, qurl: QUrl) -> LatencyHistogram:
+        '''
+        rolling latencies of requests with given method to the endpoint of
+        given url (created if not existing yet)
+
+        Parameters
+        ----------
+        method : str
+            the request method ('GET' or 'POST')
+        qurl : QUrl
+            the requested url
+
+        Returns
+        ----------
+        LatencyHistogram
+            the latencies of the endpoint
+        '''
+        key = (method, f'{qurl.host()}{qurl.path()}')
+        with cls._latencies_lock:
+            histogram = cls.latencies.get(key)
+            if histogram is None:
+                histogram = cls.latencies[key] = LatencyHistogram()
+        return histogram
+
+    def timeout(self, method: str, qurl: QUrl) -> int:
+        '''
+        timeout of a synchronous request with given method to the given url
+
+        Parameters
+        ----------
+        method : str
+            the request method ('GET' or 'POST')
+        qurl : QUrl
+            the requested url
+
+        Returns
+        ----------
+        int
+            the timeout in milliseconds, adapted to the observed latencies of
+            the endpoint if adaptive timeouts are set
+        '''
+        if not self.adaptive_timeout:
+            return self.default_timeout
+        histogram = self.latency(method, qurl)
+        if len(histogram) < self.min_samples:
+            return self.default_timeout
+        timeout = histogram.percentile(99) * self.timeout_factor
+        return int(min(self.default_timeout, max(self.min_timeout, timeout)))
+
+    def _hedge(self, method: str, qurl: QUrl, send: object) -> tuple:
+        '''
+        delay in milliseconds after which a duplicate of a request is sent
+        and the function sending it, None if the request is not to be hedged
+        '''
+        if not self.hedge:
+            return None
+        self._n_requests += 1
+        histogram = self.latency(method, qurl)
+        if len(histogram) < self.min_samples:
+            return None
+        url = qurl.toString()
+        for prefix, alternative in self.alternatives.items():
+            if url.startswith(prefix):
+                qurl = QUrl(alternative + url[len(prefix):])
+                break
+
+        def send_hedge():
+            # limit the additional load on the service
+            if self._n_hedged >= self.max_hedge_ratio * self._n_requests:
+                return None
+            self._n_hedged += 1
+            return send(qurl)
+
+        return histogram.percentile(95), send_hedge
+
     def get(self, url: str, params: dict = None,
-            timeout: int = 20000, **kwargs) -> Reply:
+            timeout: int = None, headers: dict = None, **kwargs) -> Reply:
         '''
         queries given url (GET)
 
@@ -724,7 +1324,11 @@ class Request(QObject):
             values, defaults to no query parameters
         timeout : int, optional
             the timeout of synchronous requests in milliseconds, will be ignored
-            when making asynchronous requests, defaults to 20000 ms
+            when making asynchronous requests, defaults to the default timeout
+            or the adaptive timeout of the endpoint
+        headers : dict, optional
+            additional headers of the request, header names as keys and
+            values as values, defaults to no additional headers
         **kwargs :
             additional parameters matching the requests interface will
             be ignored (e.g. verify is not supported)
@@ -744,18 +1348,20 @@ class Request(QObject):
                 query.addQueryItem(param, str(value))
             qurl.setQuery(query.query())
 
+        if self.replay is not None:
+            return self._replay('GET', qurl)
+
         if self.synchronous:
-            return self._get_sync(qurl, timeout=timeout)
+            timeout = timeout or self.timeout('GET', qurl)
+            return self._get_sync(qurl, timeout=timeout, headers=headers)
 
-        return self._get_async(qurl)
+        return self._get_async(qurl, headers=headers)
 
     def post(self, url, params: dict = None, data: bytes = b'',
-             timeout: int = 20000, content_type: str = None, **kwargs) -> Reply:
+             timeout: int = None, content_type: str = None, **kwargs) -> Reply:
         '''
         posts data to given url (POST)
 
-        asynchronous posts are not implemented yet
-
         Parameters
         ----------
         url : str
@@ -767,7 +1373,8 @@ class Request(QObject):
             the data to post as a byte-string, defaults to no data posted
         timeout : int, optional
             the timeout of synchronous requests in milliseconds, will be ignored
-            when making asynchronous requests, defaults to 20000 ms
+            when making asynchronous requests, defaults to the default timeout
+            or the adaptive timeout of the endpoint
         content_type : str, optional
             the content type of the data, puts content type into header of
             request
@@ -790,110 +1397,298 @@ class Request(QObject):
                 query.addQueryItem(param, str(value))
             qurl.setQuery(query.query())
 
+        if self.replay is not None:
+            return self._replay('POST', qurl, data=data)
+
         if self.synchronous:
+            timeout = timeout or self.timeout('POST', qurl)
             return self._post_sync(qurl, timeout=timeout, data=data,
                                    content_type=content_type)
 
-        return self._post_async(qurl, content_type=content_type)
+        return self._post_async(qurl, data=data, content_type=content_type)
 
+    def _replay(self, method: str, qurl: QUrl, data: bytes = b'') -> Reply:
+        '''
+        serve a request from the recorded traffic, the reply of asynchronous
+        requests is emitted on the next run of the event loop
+        '''
+        try:
+            res, latency, hedge = self.replay.reply(method, qurl.toString(),
+                                                    data)
+        except ConnectionError as e:
+            if self.synchronous:
+                raise e
+            QTimer.singleShot(0, lambda: self.error.emit(str(e)))
+            return None
+        if hedge:
+            # the traffic of the recorded duplicate counts as well
+            won = hedge['won']
+            self._measure(qurl, data, latency, reply=None if won else res,
+                          aborted=won)
+            self._measure(qurl, data, hedge['latency'],
+                          reply=res if won else None, aborted=not won)
+        else:
+            self._measure(qurl, data, latency, reply=res)
+        if not self.synchronous:
+            QTimer.singleShot(0, lambda: self.finished.emit(res))
+            return None
+        self.latency(method, qurl).add(latency)
+        self.finished.emit(res)
+        return res
 
-    def _get_sync(self, qurl: QUrl, timeout: int = 20000) -> Reply:
+    def _measure(self, qurl: QUrl, data: bytes, latency: float,
+                 reply: Reply = None, aborted: bool = False):
         '''
-        synchronous GET-request
+        report a finished request to the metrics, requests which lost the
+        race against their duplicate are counted as aborted
         '''
-        request = QNetworkRequest(qurl)
-        ## newer versions of QGIS (3.6+) support synchronous requests
-        #if hasattr(self._manager, 'blockingGet'):
-            #reply = self._manager.blockingGet(request, forceRefresh=True)
-        ## use blocking event loop for older versions
-        #else:
+        if self.metrics is None:
+            return
+        status = reply.status_code if reply is not None else None
+        if aborted:
+            status = 'aborted'
+        self.metrics.count('requests')
+        self.metrics.count(f'status_{status or "error"}')
+        self.metrics.count('bytes_out', len(qurl.toEncoded()) + len(data))
+        if reply is not None:
+            self.metrics.count('bytes_in', len(reply.content))
+        self.metrics.observe('network', latency)
+
+    def _record(self, method: str, qurl: QUrl, data: bytes, start: float,
+                reply: Reply = None, error: str = None, hedge: dict = None):
+        '''
+        pass a finished request (started at given time) to the metrics and
+        the recorder, hedge is the duplicate of the request if one was sent
+        (as filled by _wait_for)
+        '''
+        latency = (time.perf_counter() - start) * 1000
+        if hedge:
+            won = hedge['won']
+            self._measure(qurl, data, latency, aborted=won,
+                          reply=None if won else reply)
+            self._measure(QUrl(hedge['url']), data, hedge['latency'],
+                          reply=reply if won else None, aborted=not won)
+        else:
+            self._measure(qurl, data, latency, reply=reply)
+        if self.recorder is None:
+            return
+        self.recorder.record(method, qurl.toString(), data, latency,
+                             reply=reply, error=error, hedge=hedge)
+
+    def _wait_for(self, reply: QNetworkReply, timeout: int = 20000,
+                  latency: LatencyHistogram = None,
+                  hedge: tuple = None, hedged: dict = None) -> QNetworkReply:
+        '''
+        block until the reply is finished, the timeout is exceeded or the
+        request is aborted, raises ConnectionError on timeout and
+        InterruptedError on abortion, the time it took is added to given
+        latencies (timeouts with the timeout as the latency)
+
+        hedge is a tuple of a delay in milliseconds and a function sending a
+        duplicate request if the reply isn't finished after this delay,
+        the reply finished first is returned, the other one is aborted. If a
+        duplicate was sent, its "url", "latency" (in milliseconds) and whether
+        it "won" are put into the given hedged dict
+        '''
+        start = time.perf_counter()
         loop = QEventLoop()
+        loop.aborted = False
+        replies = [reply]
+        # replies in flight, including a hedged duplicate
+        loop.replies = replies
         timer = QTimer()
         timer.setSingleShot(True)
-        # reply or timeout break event loop, whoever comes first
+        # reply, timeout or abortion break event loop, whoever comes first
         timer.timeout.connect(loop.quit)
-        reply = self._manager.get(request)
         reply.finished.connect(loop.quit)
 
+        hedge_timer = QTimer()
+        hedge_timer.setSingleShot(True)
+        hedge_start = []
+        if hedge is not None:
+            delay, send_hedge = hedge
+            def send():
+                duplicate = send_hedge()
+                if duplicate is not None:
+                    duplicate.finished.connect(loop.quit)
+                    replies.append(duplicate)
+                    hedge_start.append(time.perf_counter())
+            hedge_timer.timeout.connect(send)
+            hedge_timer.start(int(delay))
+
         timer.start(timeout)
 
-        # start blocking loop
-        loop.exec()
+        # start blocking loop, the abortion may already be requested before
+        # the loop is registered
+        self._loops.add(loop)
+        if self._aborted.is_set():
+            loop.aborted = True
+        elif not reply.isFinished():
+            loop.exec()
+        self._loops.discard(loop)
         loop.deleteLater()
-        if not timer.isActive():
-            reply.deleteLater()
+        hedge_timer.stop()
+        finished = [r for r in replies if r.isFinished()]
+        if hedge_start and hedged is not None:
+            hedged.update({
+                'url': replies[1].url().toString(),
+                'latency': (time.perf_counter() - hedge_start[0]) * 1000,
+                'won': bool(finished) and finished[0] is replies[1],
+            })
+        if not finished:
+            for r in replies:
+                r.abort()
+            self._dispose(*replies)
+            if loop.aborted:
+                timer.stop()
+                raise InterruptedError('Anfrage abgebrochen')
+            if latency is not None:
+                latency.add(timeout)
             raise ConnectionError('Timeout')
-
         timer.stop()
+        if latency is not None:
+            latency.add((time.perf_counter() - start) * 1000)
+        # cancel the request that lost the race
+        reply = finished[0]
+        losers = [r for r in replies if r is not reply]
+        for r in losers:
+            r.abort()
+        self._dispose(*losers)
+        return reply
+
+    @staticmethod
+    def _dispose(*replies: QNetworkReply):
+        '''
+        delete the given replies (the payload has to be copied out before)
+        '''
+        for reply in replies:
+            reply.deleteLater()
+        # threads without a running event loop (workers) would only process
+        # the deletion when they are finished, process it right away instead
+        app = QCoreApplication.instance()
+        if app and QThread.currentThread() is not app.thread():
+            QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+    def _get_sync(self, qurl: QUrl, timeout: int = 20000,
+                  headers: dict = None) -> Reply:
+        '''
+        synchronous GET-request
+        '''
+        request = self._network_request(qurl, headers=headers)
+        # blocking calls of the manager (QGIS 3.6+) can't be aborted,
+        # use blocking event loop instead
+        start = time.perf_counter()
+        reply = self._manager.get(request)
+        hedge = self._hedge('GET', qurl, lambda q: self._manager.get(
+            self._network_request(q, headers=headers)))
+        hedged = {}
+        try:
+            reply = self._wait_for(reply, timeout=timeout, hedge=hedge,
+                                   latency=self.latency('GET', qurl),
+                                   hedged=hedged)
+        except ConnectionError as e:
+            self._record('GET', qurl, b'', start, error=str(e),
+                         hedge=hedged)
+            raise e
         #if reply.error():
             #self.error.emit(reply.errorString())
             #raise ConnectionError(reply.errorString())
         res = Reply(reply)
+        self._dispose(reply)
+        self._record('GET', qurl, b'', start, reply=res, hedge=hedged)
         self.finished.emit(res)
         return res
 
-    def _get_async(self, qurl: QUrl):
+    def _get_async(self, qurl: QUrl, headers: dict = None) -> QNetworkReply:
         '''
         asynchronous GET-request
         '''
-        request = QNetworkRequest(qurl)
+        request = self._network_request(qurl, headers=headers)
+        reply = self._manager.get(request)
+        self._track(reply, 'GET', qurl)
+        return reply
+
+    def _track(self, reply: QNetworkReply, method: str, qurl: QUrl,
+               data: bytes = b''):
+        '''
+        relay the signals of an asynchronous request, the reply can be
+        aborted with abort() until it is finished
+        '''
+        start = time.perf_counter()
+        self.reply = reply
+        self._replies.add(reply)
 
         def progress(b, total):
             if total > 0:
                 self.progress.emit(int(100*b/total))
 
-        self.reply = self._manager.get(request)
-        self.reply.error.connect(
-            lambda: self.error.emit(self.reply.errorString()))
-        self.reply.downloadProgress.connect(progress)
-        self.reply.finished.connect(
-            lambda: self.finished.emit(Reply(self.reply)))
-        #self.reply.readyRead.connect(ready_read)
-        #return 0
+        def error():
+            if reply.error() != QNetworkReply.OperationCanceledError:
+                self.error.emit(reply.errorString())
+
+        def finished():
+            self._replies.discard(reply)
+            if reply.error() != QNetworkReply.OperationCanceledError:
+                res = Reply(reply)
+                self._record(method, qurl, data, start, reply=res,
+                             error=reply.errorString() if reply.error()
+                             else None)
+                self.finished.emit(res)
+            reply.deleteLater()
+
+        reply.error.connect(error)
+        reply.downloadProgress.connect(progress)
+        reply.finished.connect(finished)
 
     def _post_sync(self, qurl: QUrl, timeout: int = 20000, data: bytes = b'',
                    content_type=None):
         '''
         synchronous POST-request
         '''
-        request = QNetworkRequest(qurl)
+        request = self._network_request(qurl)
         if content_type:
             request.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
-        # newer versions of QGIS (3.6+) support synchronous requests
-        if hasattr(self._manager, 'blockingPost'):
-            reply = self._manager.blockingPost(request, data, forceRefresh=True)
-        # use blocking event loop for older versions
-        else:
-            loop = QEventLoop()
-            timer = QTimer()
-            timer.setSingleShot(True)
-            # reply or timeout break event loop, whoever comes first
-            timer.timeout.connect(loop.quit)
-            reply = self._manager.post(request, data)
-            reply.finished.connect(loop.quit)
-
-            timer.start(timeout)
-
-            # start blocking loop
-            loop.exec()
-            loop.deleteLater()
-            if not timer.isActive():
-                reply.deleteLater()
-                raise ConnectionError('Timeout')
-
-            timer.stop()
+        # blocking calls of the manager (QGIS 3.6+) can't be aborted,
+        # use blocking event loop instead
+        start = time.perf_counter()
+        reply = self._manager.post(request, data)
+
+        def send_hedge(q):
+            hedged_request = QNetworkRequest(request)
+            hedged_request.setUrl(q)
+            return self._manager.post(hedged_request, data)
+
+        hedge = self._hedge('POST', qurl, send_hedge)
+        hedged = {}
+        try:
+            reply = self._wait_for(reply, timeout=timeout, hedge=hedge,
+                                   latency=self.latency('POST', qurl),
+                                   hedged=hedged)
+        except ConnectionError as e:
+            self._record('POST', qurl, data, start, error=str(e),
+                         hedge=hedged)
+            raise e
         if reply.error():
-            self.error.emit(reply.errorString())
-            raise ConnectionError(reply.errorString())
+            error = reply.errorString()
+            self._dispose(reply)
+            self._record('POST', qurl, data, start, error=error,
+                         hedge=hedged)
+            self.error.emit(error)
+            raise ConnectionError(error)
         res = Reply(reply)
+        self._dispose(reply)
+        self._record('POST', qurl, data, start, reply=res, hedge=hedged)
         self.finished.emit(res)
         return res
 
-    def _post_async(self, qurl: QUrl, content_type=None):
+    def _post_async(self, qurl: QUrl, data: bytes = b'',
+                    content_type=None) -> QNetworkReply:
         '''
         asynchronous POST-request
-
-        not implemented yet
         '''
-        raise NotImplementedError
-
+        request = self._network_request(qurl)
+        if content_type:
+            request.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
+        reply = self._manager.post(request, data)
+        self._track(reply, 'POST', qurl, data=data)
+        return reply
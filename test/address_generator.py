@@ -0,0 +1,469 @@
+# coding=utf-8
+"""
+Generator of synthetic German addresses for scale testing.
+
+Generates address layers of arbitrary size (CSV or GeoPackage) with cities
+drawn by population, post codes of the cities, street names drawn by their
+frequency in Germany and skewed house numbers. Duplicates of former rows and
+typos in street and city names are added with the given rates.
+
+The columns follow the keyword variants recognised by BKGGeocoder.keywords
+(separate columns, "zusatz" with the addition to the house number in an own
+column, "strasse_haus" with street and house number in one column and
+"plz_ort" with post code and city in one column), so that they are mapped
+automatically by the FieldMap.
+
+Next to the layer the matching replies of the geocoding service are written
+as "<file>.results.json" (candidates at the true location of the address,
+lower scores for addresses with typos), the stand-in service replays them
+when started with the directory of the file as fixtures:
+
+    python address_generator.py 100000 /tmp/data/adressen.csv \
+        --variants zusatz plz_ort --duplicates 0.1 --typos 0.05
+    python stand_in_server.py --fixtures /tmp/data
+
+Usage as a module:
+
+    generator = AddressGenerator(duplicate_rate=0.1, typo_rate=0.05, seed=1)
+    generator.write('/tmp/data/adressen.gpkg', 100000, variants=['plz_ort'])
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+import os
+import re
+import csv
+import json
+import math
+import random
+import argparse
+
+from stand_in_server import StandInService
+
+# city, population in thousands, latitude and longitude of the center and
+# post codes
+CITIES = [
+    ('Berlin', 3645, 52.520, 13.405,
+     ['10115', '10178', '10243', '10405', '10557', '10707', '10963', '12043',
+      '12163', '13347', '13585', '14193']),
+    ('Hamburg', 1841, 53.551, 9.993,
+     ['20095', '20249', '20354', '21073', '22041', '22301', '22763']),
+    ('München', 1472, 48.137, 11.575,
+     ['80331', '80538', '80798', '81369', '81667', '81925']),
+    ('Köln', 1086, 50.938, 6.960, ['50667', '50733', '50823', '50937', '51063']),
+    ('Frankfurt am Main', 753, 50.110, 8.682,
+     ['60311', '60385', '60486', '60594', '65929']),
+    ('Stuttgart', 635, 48.776, 9.183,
+     ['70173', '70182', '70372', '70469', '70597']),
+    ('Düsseldorf', 619, 51.227, 6.773, ['40210', '40477', '40545', '40625']),
+    ('Dortmund', 588, 51.514, 7.468, ['44135', '44137', '44263', '44339']),
+    ('Leipzig', 587, 51.340, 12.375,
+     ['04103', '04109', '04155', '04277', '04315']),
+    ('Essen', 582, 51.456, 7.012, ['45127', '45130', '45279']),
+    ('Bremen', 567, 53.079, 8.802, ['28195', '28203', '28209', '28359']),
+    ('Dresden', 556, 51.050, 13.738,
+     ['01067', '01069', '01097', '01187', '01309']),
+    ('Hannover', 536, 52.376, 9.732, ['30159', '30161', '30449', '30655']),
+    ('Nürnberg', 518, 49.452, 11.077, ['90402', '90403', '90429', '90478']),
+    ('Wiesbaden', 278, 50.082, 8.240, ['65183', '65185', '65189']),
+    ('Kiel', 246, 54.323, 10.123, ['24103', '24105', '24143']),
+    ('Halle (Saale)', 238, 51.483, 11.970, ['06108', '06110', '06112']),
+    ('Magdeburg', 236, 52.120, 11.627, ['39104', '39108', '39112']),
+    ('Freiburg im Breisgau', 231, 47.999, 7.842, ['79098', '79100', '79104']),
+    ('Mainz', 218, 49.993, 8.247, ['55116', '55118', '55122']),
+    ('Erfurt', 213, 50.978, 11.029, ['99084', '99089', '99096']),
+    ('Potsdam', 180, 52.390, 13.065, ['14467', '14469', '14473', '14482']),
+    ('Saarbrücken', 180, 49.234, 6.997, ['66111', '66113', '66119']),
+    ('Cottbus', 99, 51.756, 14.333, ['03042', '03044', '03046']),
+    ('Schwerin', 96, 53.635, 11.401, ['19053', '19055', '19061']),
+    ('Gera', 93, 50.880, 12.080, ['07545', '07546', '07548']),
+    ('Flensburg', 90, 54.783, 9.437, ['24937', '24939', '24941']),
+    ('Zwickau', 88, 50.718, 12.496, ['08056', '08058', '08060']),
+    ('Görlitz', 56, 51.153, 14.987, ['02826', '02827', '02828']),
+    ('Passau', 52, 48.573, 13.461, ['94032', '94034', '94036']),
+    ('Wolfenbüttel', 52, 52.162, 10.535, ['38300', '38302', '38304']),
+    ('Ilmenau', 38, 50.684, 10.919, ['98693']),
+    ('St. Ingbert', 35, 49.277, 7.112, ['66386']),
+    ('Neuruppin', 31, 52.925, 12.803, ['16816']),
+    ('Kleinmachnow', 20, 52.407, 13.222, ['14532']),
+    ('Bad Tölz', 19, 47.761, 11.557, ['83646']),
+]
+
+# most frequent street names in Germany, ranked by frequency
+STREETS = [
+    'Hauptstraße', 'Schulstraße', 'Gartenstraße', 'Bahnhofstraße',
+    'Dorfstraße', 'Bergstraße', 'Birkenweg', 'Lindenstraße', 'Kirchstraße',
+    'Waldstraße', 'Ringstraße', 'Schillerstraße', 'Goethestraße',
+    'Am Sportplatz', 'Wiesenweg', 'Jahnstraße', 'Friedhofstraße',
+    'Buchenweg', 'Mühlenweg', 'Ahornweg', 'Rosenstraße', 'Feldstraße',
+    'Am Bahnhof', 'Eichendorffstraße', 'Lessingstraße', 'Uhlandstraße',
+    'Mozartstraße', 'Beethovenstraße', 'Kiefernweg', 'Tannenweg',
+    'Industriestraße', 'Poststraße', 'Marktplatz', 'Brunnenstraße',
+    'Friedrich-Ebert-Straße', 'Kastanienallee', 'Lindenallee',
+    'Rathausplatz', 'Am Mühlbach', 'Gutenbergstraße', 'An der Kirche',
+    'Breslauer Straße', 'Königsberger Straße', 'Danziger Straße',
+    'Karl-Marx-Straße', 'Heinrich-Heine-Straße', 'Robert-Koch-Straße',
+    'Alter Markt', 'Im Winkel', 'Auf dem Berg',
+]
+# weights of the streets following Zipf's law
+STREET_WEIGHTS = [1 / (rank + 1) for rank in range(len(STREETS))]
+# weights of the cities with a minimal weight of small places
+CITY_WEIGHTS = [max(pop, 50) for _, pop, _, _, _ in CITIES]
+
+ZUSATZ = ['a', 'b', 'c', 'd']
+# probability of a house number having an addition
+ZUSATZ_RATE = 0.06
+
+VARIANTS = ['zusatz', 'strasse_haus', 'plz_ort']
+
+# the cities as extracted by BKGGeocoder.split_code_city from "plz ort"
+re_city = re.compile('([a-zA-ZäöüßÄÖÜ\-]+)')
+
+
+def project(lon: float, lat: float, crs: str) -> tuple:
+    '''
+    project WGS84 coordinates into the given crs (EPSG:4326, EPSG:3857,
+    EPSG:25832 or EPSG:25833)
+    '''
+    if crs == 'EPSG:4326':
+        return lon, lat
+    if crs == 'EPSG:3857':
+        r = 6378137.0
+        return (r * math.radians(lon),
+                r * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)))
+    zones = {'EPSG:25832': 32, 'EPSG:25833': 33}
+    if crs not in zones:
+        raise ValueError(f'projection {crs} not supported')
+    # transverse mercator (UTM) on the GRS80 ellipsoid
+    a = 6378137.0
+    f = 1 / 298.257222101
+    k0 = 0.9996
+    e2 = f * (2 - f)
+    ep2 = e2 / (1 - e2)
+    phi = math.radians(lat)
+    lam0 = math.radians(zones[crs] * 6 - 183)
+    n = a / math.sqrt(1 - e2 * math.sin(phi) ** 2)
+    t = math.tan(phi) ** 2
+    c = ep2 * math.cos(phi) ** 2
+    A = math.cos(phi) * (math.radians(lon) - lam0)
+    m = a * ((1 - e2 / 4 - 3 * e2 ** 2 / 64 - 5 * e2 ** 3 / 256) * phi
+             - (3 * e2 / 8 + 3 * e2 ** 2 / 32 + 45 * e2 ** 3 / 1024)
+             * math.sin(2 * phi)
+             + (15 * e2 ** 2 / 256 + 45 * e2 ** 3 / 1024) * math.sin(4 * phi)
+             - (35 * e2 ** 3 / 3072) * math.sin(6 * phi))
+    x = k0 * n * (A + (1 - t + c) * A ** 3 / 6
+                  + (5 - 18 * t + t ** 2 + 72 * c - 58 * ep2) * A ** 5 / 120)
+    y = k0 * (m + n * math.tan(phi) * (
+        A ** 2 / 2 + (5 - t + 9 * c + 4 * c ** 2) * A ** 4 / 24
+        + (61 - 58 * t + t ** 2 + 600 * c - 330 * ep2) * A ** 6 / 720))
+    return x + 500000, y
+
+
+class AddressGenerator:
+    '''
+    generator of synthetic German addresses
+
+    Attributes
+    ----------
+    duplicate_rate : float
+        probability of a row repeating a former row
+    typo_rate : float
+        probability of a typo in the street or city name of a row
+    '''
+    def __init__(self, duplicate_rate: float = 0, typo_rate: float = 0,
+                 seed: int = None):
+        '''
+        Parameters
+        ----------
+        duplicate_rate : float, optional
+            probability of a row repeating a former row, defaults to no
+            duplicates
+        typo_rate : float, optional
+            probability of a typo in the street or city name of a row,
+            defaults to no typos
+        seed : int, optional
+            seed of the random generator
+        '''
+        self.duplicate_rate = duplicate_rate
+        self.typo_rate = typo_rate
+        self._random = random.Random(seed)
+
+    def _address(self) -> dict:
+        rnd = self._random
+        city, pop, lat, lon, codes = rnd.choices(CITIES,
+                                                 weights=CITY_WEIGHTS)[0]
+        street = rnd.choices(STREETS, weights=STREET_WEIGHTS)[0]
+        # low house numbers are more frequent
+        haus = str(min(int(rnd.expovariate(1 / 25)) + 1, 350))
+        zusatz = rnd.choice(ZUSATZ) if rnd.random() < ZUSATZ_RATE else ''
+        # addresses are scattered around the center depending on the size
+        # of the city
+        km = 1 + math.sqrt(pop) / 10
+        lat += rnd.gauss(0, km / 111)
+        lon += rnd.gauss(0, km / (111 * math.cos(math.radians(lat))))
+        return {
+            'strasse': street,
+            'haus': haus,
+            'zusatz': zusatz,
+            'plz': rnd.choice(codes),
+            'ort': city,
+            'lon': lon,
+            'lat': lat,
+            'typo': False,
+            'duplicate': False,
+        }
+
+    def _typo(self, text: str) -> str:
+        '''typical typo or spelling variation of the text'''
+        rnd = self._random
+        variations = []
+        if 'straße' in text:
+            variations += [lambda t: t.replace('straße', 'str.'),
+                           lambda t: t.replace('straße', 'strasse')]
+        if len(text) > 3:
+            i = rnd.randrange(1, len(text) - 2)
+            # swapped, missing and doubled letter
+            variations += [
+                lambda t: t[:i] + t[i + 1] + t[i] + t[i + 2:],
+                lambda t: t[:i] + t[i + 1:],
+                lambda t: t[:i] + t[i] + t[i:],
+            ]
+        if not variations:
+            return text
+        return rnd.choice(variations)(text)
+
+    def addresses(self, n: int):
+        '''
+        generate n addresses
+
+        Yields
+        ----------
+        dict
+            address with the keys "strasse", "haus", "zusatz", "plz", "ort"
+            (as written, including typos), "lon" and "lat" (true location),
+            "true" (the correct address if there is a typo) and flags
+            "typo" and "duplicate"
+        '''
+        rnd = self._random
+        former = []
+        for i in range(n):
+            if former and rnd.random() < self.duplicate_rate:
+                address = dict(rnd.choice(former), duplicate=True)
+                yield address
+                continue
+            address = self._address()
+            address['true'] = {k: address[k] for k in
+                               ['strasse', 'haus', 'zusatz', 'plz', 'ort']}
+            if rnd.random() < self.typo_rate:
+                key = rnd.choice(['strasse', 'ort'])
+                typo = self._typo(address[key])
+                if typo != address[key]:
+                    address[key] = typo
+                    address['typo'] = True
+            # keep a limited pool of rows to repeat
+            if len(former) < 10000:
+                former.append(address)
+            else:
+                former[rnd.randrange(len(former))] = address
+            yield address
+
+    @staticmethod
+    def columns(variants: list = []) -> list:
+        '''
+        names of the columns of the given variants
+        '''
+        variants = set(variants)
+        unknown = variants - set(VARIANTS)
+        if unknown:
+            raise ValueError(f'unknown variants {unknown}')
+        if {'zusatz', 'strasse_haus'} <= variants:
+            raise ValueError('"zusatz" can\'t be combined with "strasse_haus"')
+        columns = ['ID']
+        if 'strasse_haus' in variants:
+            columns.append('Strasse_Hausnummer')
+        else:
+            columns += ['Straße', 'Hausnummer']
+            if 'zusatz' in variants:
+                columns.append('Hausnummer_Zusatz')
+        if 'plz_ort' in variants:
+            columns.append('PLZ_Ort')
+        else:
+            columns += ['Postleitzahl', 'Ort']
+        return columns
+
+    @staticmethod
+    def row(i: int, address: dict, variants: list = []) -> list:
+        '''
+        values of the columns of the given variants for an address
+        '''
+        haus = address['haus']
+        if 'zusatz' not in variants:
+            haus += address['zusatz']
+        values = {
+            'ID': i,
+            'Strasse_Hausnummer': f'{address["strasse"]} {haus}',
+            'Straße': address['strasse'],
+            'Hausnummer': haus,
+            'Hausnummer_Zusatz': address['zusatz'],
+            'PLZ_Ort': f'{address["plz"]} {address["ort"]}',
+            'Postleitzahl': address['plz'],
+            'Ort': address['ort'],
+        }
+        return [values[c] for c in AddressGenerator.columns(variants)]
+
+    @staticmethod
+    def query(address: dict, variants: list = []) -> str:
+        '''
+        query the BKGGeocoder builds for the row of the address (without
+        fuzzy operators)
+        '''
+        haus = address['haus'] + address['zusatz']
+        terms = []
+        if 'strasse_haus' in variants:
+            terms.append(('strasse_haus', f'{address["strasse"]} {haus}'))
+        else:
+            terms += [('strasse', address['strasse']), ('haus', haus)]
+        if 'plz_ort' in variants:
+            # post code and city are split like BKGGeocoder.split_code_city
+            terms.append(('ort', ' '.join(re_city.findall(address['ort']))))
+        else:
+            terms.append(('ort', address['ort']))
+        terms.append(('plz', address['plz']))
+        return ' AND '.join(f'{k}:({v})' for k, v in terms)
+
+    @staticmethod
+    def candidates(address: dict, crs: str = 'EPSG:25832',
+                   n_candidates: int = 1) -> list:
+        '''
+        replies of the geocoding service for the address, the best candidate
+        is the true address, the others are neighbouring house numbers
+        '''
+        true = address.get('true', address)
+        x, y = project(address['lon'], address['lat'], crs)
+        step = 0.0002 if crs == 'EPSG:4326' else 20
+        score = 0.85 if address['typo'] else 0.98
+        candidates = []
+        for i in range(n_candidates):
+            haus = str(int(true['haus']) + 2 * i)
+            candidates.append(StandInService.candidate(
+                x + i * step, y, score / (i + 1), {
+                    'strasse': true['strasse'],
+                    'haus': haus + (true['zusatz'] if not i else ''),
+                    'plz': true['plz'],
+                    'ort': true['ort'],
+                }))
+        return candidates
+
+    def write(self, file_path: str, n: int, variants: list = [],
+              crs: str = 'EPSG:25832', n_candidates: int = 1) -> str:
+        '''
+        write n addresses into a CSV file (semicolon separated, utf-8) or a
+        GeoPackage (by file extension) and the matching replies of the
+        service into "<file_path>.results.json"
+
+        Returns
+        ----------
+        str
+            path to the replies
+        '''
+        columns = self.columns(variants)
+        results_path = f'{file_path}.results.json'
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in ['.csv', '.gpkg']:
+            raise ValueError(f'format "{ext}" not supported')
+        rows = ((i, a) for i, a in enumerate(self.addresses(n), start=1))
+        written = set()
+
+        with open(results_path, 'w', encoding='utf-8') as results:
+            results.write('{\n')
+
+            def write_result(address):
+                query = self.query(address, variants=variants)
+                if query in written:
+                    return
+                separator = ',\n' if written else ''
+                written.add(query)
+                candidates = self.candidates(address, crs=crs,
+                                             n_candidates=n_candidates)
+                results.write(f'{separator}{json.dumps(query)}: '
+                              f'{json.dumps(candidates)}')
+
+            if ext == '.csv':
+                with open(file_path, 'w', encoding='utf-8',
+                          newline='') as f:
+                    writer = csv.writer(f, delimiter=';')
+                    writer.writerow(columns)
+                    for i, address in rows:
+                        writer.writerow(self.row(i, address, variants))
+                        write_result(address)
+            else:
+                _write_gpkg(file_path, columns, variants, rows, write_result)
+            results.write('\n}\n')
+        return results_path
+
+
+def _write_gpkg(file_path: str, columns: list, variants: list, rows,
+                callback: callable, batch: int = 10000):
+    '''
+    write the rows into a table without geometry of a new GeoPackage,
+    callback is called with every address
+    '''
+    from qgis.core import (QgsVectorLayer, QgsVectorFileWriter, QgsFeature,
+                           QgsFields, QgsField, QgsWkbTypes,
+                           QgsCoordinateReferenceSystem,
+                           QgsCoordinateTransformContext)
+    from qgis.PyQt.QtCore import QVariant
+
+    fields = QgsFields()
+    for column in columns:
+        fields.append(QgsField(column, QVariant.Int if column == 'ID'
+                               else QVariant.String))
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = os.path.splitext(os.path.basename(file_path))[0]
+    writer = QgsVectorFileWriter.create(
+        file_path, fields, QgsWkbTypes.NoGeometry,
+        QgsCoordinateReferenceSystem(), QgsCoordinateTransformContext(),
+        options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise RuntimeError(writer.errorMessage())
+    features = []
+    for i, address in rows:
+        feature = QgsFeature(fields)
+        feature.setAttributes(AddressGenerator.row(i, address, variants))
+        features.append(feature)
+        callback(address)
+        if len(features) >= batch:
+            writer.addFeatures(features)
+            features = []
+    writer.addFeatures(features)
+    # flushes and closes the file
+    del writer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('n', type=int, help='number of addresses')
+    parser.add_argument('file', help='output file (.csv or .gpkg)')
+    parser.add_argument('--variants', nargs='*', default=[], choices=VARIANTS,
+                        help='variants of the address columns')
+    parser.add_argument('--duplicates', type=float, default=0,
+                        help='rate of duplicate rows')
+    parser.add_argument('--typos', type=float, default=0,
+                        help='rate of rows with typos')
+    parser.add_argument('--crs', default='EPSG:25832',
+                        help='projection of the replies')
+    parser.add_argument('--candidates', type=int, default=1,
+                        help='number of candidates per reply')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    generator = AddressGenerator(duplicate_rate=args.duplicates,
+                                 typo_rate=args.typos, seed=args.seed)
+    if args.file.lower().endswith('.gpkg'):
+        from utilities import get_qgis_app
+        get_qgis_app()
+    results = generator.write(args.file, args.n, variants=args.variants,
+                              crs=args.crs, n_candidates=args.candidates)
+    print(f'{args.n} Adressen -> {args.file}, Antworten -> {results}')
@@ -0,0 +1,113 @@
+# coding=utf-8
+"""
+Benchmark of applying results to the output layer with different layer
+providers, either updating the input layer or writing into a clone of it (as
+selectable in the UI with "Ausgangslayer aktualisieren").
+
+Synthetic results are applied through the write path of the plugin
+(MainWidget.store_bkg_results -> MainWidget.set_bkg_result ->
+ResField.set_value), time and memory are reported per run, e.g.
+
+    python apply_results.py --sizes 10000 100000 1000000 \
+        --providers memory gpkg shp --modes update clone --out write.json
+
+Runs taking longer than --max-seconds are stopped early, the rates are then
+measured on the features applied up to that point.
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+import gc
+import time
+import argparse
+import tempfile
+import itertools
+
+from common import (load_csv, scale_layer, to_provider, ResultWriter,
+                    peak_rss, current_rss, write_results, remove_dir,
+                    REVERSE_FILE, CRS, PROVIDERS)
+from stand_in_server import StandInService
+
+from bkggeocoder.interface.utils import clone_layer
+
+
+def run(size: int, provider: str, mode: str, directory: str,
+        max_seconds: float = None) -> dict:
+    '''
+    apply a synthetic result to every feature of a layer with given size
+    stored with given provider
+    '''
+    source = scale_layer(load_csv(REVERSE_FILE, coordinates=True), size)
+    layer = to_provider(source, provider, tempfile.mkdtemp(dir=directory))
+    del source
+    gc.collect()
+    rss_before = current_rss()
+
+    start = time.perf_counter()
+    if mode == 'clone':
+        layer = clone_layer(layer, crs=CRS, name=f'{layer.name()}_ergebnisse')
+    clone_seconds = time.perf_counter() - start
+    writer = ResultWriter(layer)
+    features = list(layer.getFeatures())
+
+    applied = 0
+    apply_start = time.perf_counter()
+    for feature in features:
+        point = feature.geometry().asPoint()
+        result = StandInService.candidate(
+            point.x(), point.y(), 0.95,
+            {'strasse': 'Synthetische Straße', 'haus': str(feature.id())})
+        writer.store_bkg_results(feature, [result])
+        applied += 1
+        if max_seconds and time.perf_counter() - apply_start > max_seconds:
+            break
+    apply_seconds = time.perf_counter() - apply_start
+
+    return {
+        'size': size,
+        'provider': provider,
+        'mode': mode,
+        'applied': applied,
+        'complete': applied == len(features),
+        'clone_seconds': clone_seconds,
+        'apply_seconds': apply_seconds,
+        'features_per_second': applied / apply_seconds
+        if apply_seconds else None,
+        'rss_before_mb': rss_before,
+        'rss_after_mb': current_rss(),
+        'peak_rss_mb': peak_rss(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--providers', nargs='+',
+                        default=list(PROVIDERS.keys()),
+                        choices=list(PROVIDERS.keys()))
+    parser.add_argument('--modes', nargs='+', default=['update', 'clone'],
+                        choices=['update', 'clone'])
+    parser.add_argument('--max-seconds', type=float, default=600,
+                        help='maximum duration of applying the results per '
+                        'run, 0 for no limit')
+    parser.add_argument('--out', help='json file to write the results to, '
+                        'printed if not given')
+    args = parser.parse_args()
+
+    runs = []
+    directory = tempfile.mkdtemp()
+    try:
+        for size, provider, mode in itertools.product(
+                args.sizes, args.providers, args.modes):
+            runs.append(run(size, provider, mode, directory,
+                            max_seconds=args.max_seconds))
+            gc.collect()
+    finally:
+        remove_dir(directory)
+    write_results('apply_results', runs, out=args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+# coding=utf-8
+"""
+Common functionality of the benchmarks.
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+import os
+import sys
+import json
+import math
+import shutil
+import platform
+import datetime
+import subprocess
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+TEST_PATH = os.path.dirname(BENCHMARK_PATH)
+TEST_DATA = os.path.join(TEST_PATH, 'test_data')
+sys.path.append(TEST_PATH)
+sys.path.append(os.path.join(TEST_PATH, '..', '..'))
+
+from utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from qgis.core import QgsVectorLayer, QgsVectorFileWriter, QgsFeature, Qgis
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.PyQt.QtWidgets import QTextEdit
+
+from bkggeocoder.geocoder.geocoder import FieldMap
+from bkggeocoder.geocoder.bkg_geocoder import BKG_RESULT_FIELDS
+from bkggeocoder.interface.utils import ResField, LayerWrapper, clone_layer
+from bkggeocoder.interface.main_widget import MainWidget
+
+GEOCODE_FILE = os.path.join(TEST_DATA, 'A2-T1_adressen_mit-header_utf8.csv')
+GEOCODE_FIELDS = {
+    'Straße': 'strasse',
+    'Hausnummer': 'haus',
+    'Postleitzahl': 'plz',
+    'Ort': 'ort',
+}
+REVERSE_FILE = os.path.join(TEST_DATA, 'mit_koordinaten.csv')
+CRS = 'EPSG:25832'
+
+PROVIDERS = {
+    'memory': None,
+    'gpkg': ('GPKG', 'gpkg'),
+    'shp': ('ESRI Shapefile', 'shp'),
+}
+
+
+def load_csv(file_path: str, coordinates: bool = False) -> QgsVectorLayer:
+    '''
+    load a semicolon separated csv file (with "x" and "y" columns in
+    EPSG:25832 if coordinates is True)
+    '''
+    uri = f'file:/{file_path}?delimiter=";"'
+    if coordinates:
+        uri = f'file:/{file_path}?crs={CRS}&xField=x&yField=y&delimiter=";"'
+    layer = QgsVectorLayer(uri, os.path.basename(file_path), 'delimitedtext')
+    if not layer.isValid():
+        raise ValueError(f'{file_path} could not be loaded')
+    return layer
+
+
+def scale_layer(layer: QgsVectorLayer, n: int,
+                vary_field: str = None) -> QgsVectorLayer:
+    '''
+    memory layer with n features cycling through the features of given
+    layer. The values of vary_field get the number of the repetition appended
+    (starting with the second repetition), so that repeated rows don't
+    produce identical requests
+    '''
+    source = list(layer.getFeatures())
+    crs = layer.crs().authid() or CRS
+    scaled = QgsVectorLayer(f'Point?crs={crs}', f'{layer.name()}_{n}',
+                            'memory')
+    scaled.dataProvider().addAttributes(layer.fields().toList())
+    scaled.updateFields()
+    fields = scaled.fields()
+    idx = fields.indexFromName(vary_field) if vary_field else -1
+    features = []
+    for i in range(n):
+        src = source[i % len(source)]
+        feature = QgsFeature(fields)
+        feature.setAttributes(src.attributes())
+        if src.hasGeometry():
+            feature.setGeometry(src.geometry())
+        repetition = i // len(source)
+        if idx >= 0 and repetition:
+            feature.setAttribute(idx, f'{src.attribute(idx)}{repetition}')
+        features.append(feature)
+    scaled.dataProvider().addFeatures(features)
+    return scaled
+
+
+def to_provider(layer: QgsVectorLayer, provider: str,
+                directory: str) -> QgsVectorLayer:
+    '''
+    copy of the layer stored with given provider ("memory", "gpkg" or "shp")
+    '''
+    if provider == 'memory':
+        return clone_layer(layer, crs=layer.crs().authid(),
+                           name=f'{layer.name()}_memory')
+    driver, ext = PROVIDERS[provider]
+    file_path = os.path.join(directory, f'{layer.name()}.{ext}')
+    error = QgsVectorFileWriter.writeAsVectorFormat(
+        layer, file_path, 'utf-8', layer.crs(), driver)
+    if isinstance(error, tuple):
+        error = error[0]
+    if error != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f'{file_path} could not be written')
+    copy = QgsVectorLayer(file_path, layer.name(), 'ogr')
+    if not copy.isValid():
+        raise RuntimeError(f'{file_path} could not be loaded')
+    return copy
+
+
+def field_map(layer: QgsVectorLayer, fields: dict = GEOCODE_FIELDS
+              ) -> FieldMap:
+    '''
+    field map of the layer with given fields (field names as keys and
+    keywords as values) set active
+    '''
+    field_map = FieldMap(layer)
+    for field_name, keyword in fields.items():
+        field_map.set_field(field_name, keyword=keyword, active=True)
+    return field_map
+
+
+class ResultWriter:
+    '''
+    applies results to an output layer through the write path of the plugin
+    (MainWidget.store_bkg_results and MainWidget.set_bkg_result) without
+    setting up the UI
+    '''
+    def __init__(self, layer: QgsVectorLayer, log: bool = False):
+        self.output = LayerWrapper(layer)
+        # log panel of the UI, messages are dropped if not logging
+        self.log_edit = QTextEdit() if log else None
+        add_fields = [
+            ResField('n_results', 'int2', alias='Anzahl der Ergebnisse',
+                     prefix='gc'),
+            ResField('i', 'int2', alias='Ergebnisindex', prefix='gc'),
+            ResField('manuell_bearbeitet', 'bool', alias='Manuell bearbeitet')
+        ]
+        add_fields += BKG_RESULT_FIELDS
+        self.result_fields = {f.name: (f, not f.optional) for f in add_fields}
+        self.result_cache = {}
+        self.candidate_index = _NoIndex()
+        layer.dataProvider().addAttributes(
+            [f.to_qgs_field() for f, active in self.result_fields.values()
+             if active and f.idx(layer) < 0])
+        layer.updateFields()
+
+    def store_bkg_results(self, feature: QgsFeature, results: list):
+        MainWidget.store_bkg_results(self, feature, results)
+
+    def set_bkg_result(self, *args, **kwargs):
+        MainWidget.set_bkg_result(self, *args, **kwargs)
+
+    def log(self, *args, **kwargs):
+        if self.log_edit is not None:
+            MainWidget.log(self, *args, **kwargs)
+
+
+class _NoIndex:
+    '''stand-in for the candidate index of the UI'''
+    def add(self, candidates: list, crs: str):
+        pass
+
+
+def process_events_until(condition: callable):
+    '''
+    process the events of the main thread (e.g. queued signals of workers)
+    until the condition is met
+    '''
+    while not condition():
+        QCoreApplication.processEvents()
+    QCoreApplication.processEvents()
+
+
+def percentile(values: list, q: float) -> float:
+    '''
+    q-th percentile of the values (nearest rank), None if empty
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, math.ceil(len(values) * q / 100) - 1))
+    return values[idx]
+
+
+def _psutil_memory():
+    '''
+    memory info of the process by psutil, None if psutil is not installed
+    '''
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info()
+
+
+def peak_rss() -> float:
+    '''
+    peak resident memory of the process in MB, None if not available
+    (resource module on Unix, psutil elsewhere e.g. on Windows)
+    '''
+    try:
+        import resource
+    except ImportError:
+        info = _psutil_memory()
+        peak = getattr(info, 'peak_wset', None)
+        return peak / 1024 ** 2 if peak is not None else None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss() -> float:
+    '''
+    current resident memory of the process in MB, None if not available
+    (Linux or psutil installed)
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        info = _psutil_memory()
+        return info.rss / 1024 ** 2 if info is not None else None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+def environment() -> dict:
+    '''
+    description of the environment the benchmark runs in
+    '''
+    try:
+        revision = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_PATH,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'qgis': Qgis.QGIS_VERSION,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_results(benchmark: str, runs: list, out: str = None):
+    '''
+    write the results of the runs of a benchmark as json to the given file
+    (or to stdout)
+    '''
+    results = {'benchmark': benchmark, 'environment': environment(),
+               'runs': runs}
+    text = json.dumps(results, indent=2)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+def remove_dir(directory: str):
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,329 @@
+# coding=utf-8
+"""
+Memory profiling of geocoding runs with tracemalloc.
+
+The memory allocated by Python is attributed to the subsystems of the plugin
+that allocated it (see SUBSYSTEMS) by walking the traceback of every traced
+allocation. Memory allocated by QGIS/Qt itself (e.g. the features of memory
+layers or the content of the log panel) is not visible to tracemalloc, the
+resident memory of the process and the sizes of the containers are reported
+for those.
+
+The large-run scenario geocodes a synthetic layer against the stand-in
+service the way the UI does (clone of the input layer as output, results
+stored in the result cache, every result logged), e.g.
+
+    python memory.py --size 100000 --interval 2 --out memory.json
+
+MemoryProfile can be used to profile any other code as well:
+
+    with MemoryProfile() as profile:
+        ...
+        profile.sample()
+    print(profile.report())
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+import os
+import gc
+import ast
+import time
+import argparse
+import linecache
+import tracemalloc
+from collections import defaultdict
+
+from common import (load_csv, scale_layer, field_map, ResultWriter,
+                    process_events_until, peak_rss, current_rss,
+                    write_results, GEOCODE_FILE, CRS)
+from stand_in_server import StandInServer
+
+from qgis.core import Qgis
+
+from bkggeocoder.geocoder.bkg_geocoder import BKGGeocoder
+from bkggeocoder.geocoder.geocoder import Geocoding
+from bkggeocoder.interface.utils import Reply, clone_layer
+
+# subsystems as names and tuples of the file (relative to the plugin) and
+# prefixes of the qualified names of the functions allocating memory for
+# them, the first matching frame of an allocation (starting with the most
+# recent one) determines its subsystem
+SUBSYSTEMS = [
+    ('replies', os.path.join('interface', 'utils.py'),
+     ('Reply.', 'DetachedReply.', 'Request.')),
+    ('clone_layer', os.path.join('interface', 'utils.py'), ('clone_layer', )),
+    ('geocoding_features', os.path.join('geocoder', 'geocoder.py'),
+     ('Geocoding.__init__', 'ReverseGeocoding.__init__')),
+    ('result_cache', os.path.join('interface', 'main_widget.py'),
+     ('MainWidget.store_bkg_results', )),
+    ('log', os.path.join('interface', 'main_widget.py'), ('MainWidget.log', )),
+    ('geocoder', os.path.join('geocoder', 'bkg_geocoder.py'), ('', )),
+    ('caches', os.path.join('geocoder', 'cache.py'), ('', )),
+]
+OTHER = 'other'
+MB = 1024 ** 2
+
+
+class _FunctionIndex:
+    '''
+    qualified names of the functions the lines of python files are in
+    '''
+    def __init__(self):
+        self._files = {}
+
+    def _index(self, filename: str) -> list:
+        ranges = []
+        source = ''.join(linecache.getlines(filename))
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return ranges
+
+        def visit(node, prefix):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                      ast.ClassDef)):
+                    name = f'{prefix}{child.name}'
+                    if not isinstance(child, ast.ClassDef):
+                        ranges.append((child.lineno, child.end_lineno, name))
+                    visit(child, f'{name}.')
+                else:
+                    visit(child, prefix)
+        visit(tree, '')
+        # innermost functions first
+        ranges.sort(key=lambda r: r[1] - r[0])
+        return ranges
+
+    def function(self, filename: str, lineno: int) -> str:
+        ranges = self._files.get(filename)
+        if ranges is None:
+            ranges = self._files[filename] = self._index(filename)
+        for start, end, name in ranges:
+            if start <= lineno <= end:
+                return name
+        return ''
+
+
+class MemoryProfile:
+    '''
+    traces the memory allocated by Python and attributes it to the subsystems
+    of the plugin
+
+    Attributes
+    ----------
+    peaks : dict
+        subsystems as keys and the maximum of the memory (in bytes) held by them
+        over all samples as values
+    '''
+    def __init__(self, frames: int = 25):
+        '''
+        Parameters
+        ----------
+        frames : int, optional
+            number of frames stored per allocation, the subsystems can only be
+            determined if one of their functions is within the frames,
+            defaults to 25
+        '''
+        self.frames = frames
+        self.peaks = defaultdict(int)
+        self._functions = _FunctionIndex()
+        self._subsystems = {}
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _subsystem(self, frame: tracemalloc.Frame) -> str:
+        key = (frame.filename, frame.lineno)
+        subsystem = self._subsystems.get(key, False)
+        if subsystem is not False:
+            return subsystem
+        subsystem = None
+        for name, file_path, prefixes in SUBSYSTEMS:
+            if not frame.filename.endswith(file_path):
+                continue
+            function = self._functions.function(frame.filename, frame.lineno)
+            if any(function.startswith(p) for p in prefixes):
+                subsystem = name
+                break
+        self._subsystems[key] = subsystem
+        return subsystem
+
+    def attribute(self, snapshot: tracemalloc.Snapshot) -> dict:
+        '''
+        memory held by the subsystems at the time the snapshot was taken
+
+        Returns
+        ----------
+        dict
+            subsystems as keys and tuples of size in bytes and number of
+            memory blocks as values
+        '''
+        usage = defaultdict(lambda: [0, 0])
+        for trace in snapshot.traces:
+            subsystem = OTHER
+            for frame in reversed(trace.traceback):
+                found = self._subsystem(frame)
+                if found:
+                    subsystem = found
+                    break
+            usage[subsystem][0] += trace.size
+            usage[subsystem][1] += 1
+        return {k: tuple(v) for k, v in usage.items()}
+
+    def sample(self) -> dict:
+        '''
+        take a snapshot and update the peaks of the subsystems
+
+        Returns
+        ----------
+        dict
+            current memory usage per subsystem
+        '''
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        usage = self.attribute(snapshot)
+        for subsystem, (size, blocks) in usage.items():
+            self.peaks[subsystem] = max(self.peaks[subsystem], size)
+        return usage
+
+    def report(self, usage: dict = None) -> dict:
+        '''
+        peak and current (retained) memory per subsystem in MB
+
+        Parameters
+        ----------
+        usage : dict, optional
+            memory usage per subsystem as returned by sample(), a new sample
+            is taken if not given
+        '''
+        usage = usage if usage is not None else self.sample()
+        current, peak = tracemalloc.get_traced_memory()
+        subsystems = set(self.peaks) | set(usage)
+        return {
+            'traced_peak_mb': peak / MB,
+            'traced_current_mb': current / MB,
+            'subsystems': {
+                subsystem: {
+                    'peak_mb': self.peaks.get(subsystem, 0) / MB,
+                    'retained_mb': usage.get(subsystem, (0, 0))[0] / MB,
+                    'retained_blocks': usage.get(subsystem, (0, 0))[1],
+                } for subsystem in sorted(subsystems)
+            }
+        }
+
+
+def count_instances(cls: type) -> int:
+    '''number of live objects of given class'''
+    return sum(1 for o in gc.get_objects() if isinstance(o, cls))
+
+
+def large_run(server: StandInServer, size: int, interval: float = 1,
+              log: bool = True) -> dict:
+    '''
+    geocode a synthetic layer of given size like the UI does and report the
+    memory per subsystem sampled every interval seconds, retained memory is
+    reported while the run is still referenced (as the UI does until the
+    next run) and after releasing it
+    '''
+    rss_start = current_rss()
+    profile = MemoryProfile()
+    profile.start()
+    try:
+        layer = scale_layer(load_csv(GEOCODE_FILE), size,
+                            vary_field='Hausnummer')
+        output = clone_layer(layer, crs=CRS, name=f'{layer.name()}_ergebnisse')
+        writer = ResultWriter(output, log=log)
+        geocoder = BKGGeocoder(url=server.url, crs=CRS)
+        worker = Geocoding(geocoder, field_map(output),
+                           features=list(output.getFeatures()))
+
+        def feature_done(f, r):
+            results = r.json()['features']
+            writer.log(f'Feature {f.id()} -> <b>{len(results)} </b> '
+                       'Ergebnis(se)',
+                       level=Qgis.Info if results else Qgis.Warning)
+            writer.store_bkg_results(f, results)
+
+        done = []
+        worker.feature_done.connect(feature_done)
+        worker.finished.connect(done.append)
+        start = time.perf_counter()
+        last_sample = start
+        worker.start()
+
+        def finished_or_sample():
+            nonlocal last_sample
+            if time.perf_counter() - last_sample > interval:
+                profile.sample()
+                last_sample = time.perf_counter()
+            return bool(done)
+
+        process_events_until(finished_or_sample)
+        worker.wait()
+        seconds = time.perf_counter() - start
+
+        retained = profile.report()
+        retained.update({
+            'rss_mb': current_rss(),
+            'replies_alive': count_instances(Reply),
+            'result_cache_entries': len(writer.result_cache),
+            'log_characters': writer.log_edit.document().characterCount()
+            if writer.log_edit else 0,
+        })
+        del worker, writer, output, layer, feature_done
+        released = profile.report()
+        released.update({
+            'rss_mb': current_rss(),
+            'replies_alive': count_instances(Reply),
+        })
+    finally:
+        profile.stop()
+
+    return {
+        'scenario': 'large_run',
+        'size': size,
+        'success': all(done),
+        'seconds': seconds,
+        'rss_start_mb': rss_start,
+        'peak_rss_mb': peak_rss(),
+        'retained': retained,
+        'released': released,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=10000,
+                        help='number of features of the synthetic layer')
+    parser.add_argument('--interval', type=float, default=1,
+                        help='seconds between samples of the memory')
+    parser.add_argument('--no-log', action='store_true',
+                        help='don\'t write the results into a log panel')
+    parser.add_argument('--out', help='json file to write the results to, '
+                        'printed if not given')
+    args = parser.parse_args()
+
+    with StandInServer() as server:
+        run = large_run(server, args.size, interval=args.interval,
+                        log=not args.no_log)
+    write_results('memory', [run], out=args.out)
+
+
+if __name__ == '__main__':
+    main()
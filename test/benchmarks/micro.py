@@ -0,0 +1,214 @@
+# coding=utf-8
+"""
+Micro-benchmarks of the stages every feature passes while geocoding.
+
+Every stage is timed in isolation on generated address rows and reported in
+nanoseconds per operation (best of the repetitions). The memory allocated per
+operation is traced in a separate pass, because tracing slows the stages
+down, e.g.
+
+    python micro.py --rows 10000 --stages to_args build_params --out micro.json
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+import gc
+import time
+import json
+import random
+import argparse
+import statistics
+import tracemalloc
+
+from common import (load_csv, field_map, ResultWriter, write_results,
+                    GEOCODE_FILE, GEOCODE_FIELDS, CRS)
+from stand_in_server import StandInService
+
+from qgis.core import QgsVectorLayer, QgsFeature
+
+from bkggeocoder.geocoder.bkg_geocoder import BKGGeocoder
+from bkggeocoder.interface.utils import DetachedReply
+
+# additions to house numbers
+ZUSATZ = ['', '', '', 'a', 'b', 'c']
+# characters the BKG service interprets as control characters
+SPECIAL = ['', '', '', '', '(Hinterhaus)', '"Alt"', 'Nr. 1/2', '+', '!']
+
+
+def generate_rows(n: int, seed: int = 0) -> list:
+    '''
+    n address rows (dicts with the keys strasse, haus, zusatz, plz, ort and
+    plz_ort) recombined from the values of the address fixture
+    '''
+    layer = load_csv(GEOCODE_FILE)
+    streets, codes, cities = [], [], []
+    for feature in layer.getFeatures():
+        streets.append(feature.attribute('Straße'))
+        codes.append(str(feature.attribute('Postleitzahl')))
+        cities.append(feature.attribute('Ort'))
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        j = rnd.randrange(len(codes))
+        strasse = f'{rnd.choice(streets)} {rnd.choice(SPECIAL)}'.strip()
+        rows.append({
+            'strasse': strasse,
+            'haus': str(rnd.randint(1, 250)),
+            'zusatz': rnd.choice(ZUSATZ),
+            # drop leading zeros like numeric columns do
+            'plz': codes[j].lstrip('0') if rnd.random() < 0.1 else codes[j],
+            'ort': cities[j],
+            'plz_ort': f'{codes[j]} {cities[j]}',
+        })
+    return rows
+
+
+def rows_to_layer(rows: list) -> QgsVectorLayer:
+    '''
+    memory layer with the rows as features, the columns are named like the
+    ones of the address fixture
+    '''
+    fields = {v: k for k, v in GEOCODE_FIELDS.items()}
+    layer = QgsVectorLayer(
+        f'Point?crs={CRS}' + ''.join(
+            f'&field={name}:string' for name in fields.values()),
+        'generated', 'memory')
+    features = []
+    for row in rows:
+        feature = QgsFeature(layer.fields())
+        feature.setAttributes([row[k] for k in fields])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def bench(name: str, func: callable, setup: callable,
+          repeat: int = 5) -> dict:
+    '''
+    time func applied to every input returned by setup (called anew for every
+    repetition and not timed) and trace the memory it allocates
+    '''
+    timings = []
+    for r in range(repeat):
+        inputs = setup()
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter_ns()
+        for x in inputs:
+            func(x)
+        timings.append((time.perf_counter_ns() - start) / len(inputs))
+        gc.enable()
+
+    inputs = setup()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    peaks = 0
+    for x in inputs:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func(x)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    return {
+        'stage': name,
+        'ops': len(inputs),
+        'ns_per_op': min(timings),
+        'ns_per_op_median': statistics.median(timings),
+        # peak of memory allocated while running a single operation
+        'bytes_allocated_per_op': peaks / len(inputs),
+        # memory still allocated after all operations
+        'bytes_retained_per_op': retained / len(inputs),
+    }
+
+
+def stages(rows: list, n_candidates: int) -> dict:
+    '''
+    the benchmarked stages as names and (func, setup) tuples
+    '''
+    layer = rows_to_layer(rows)
+    features = list(layer.getFeatures())
+    fmap = field_map(layer)
+    geocoder = BKGGeocoder(url='http://localhost', crs=CRS)
+    fuzzy_geocoder = BKGGeocoder(url='http://localhost', crs=CRS, fuzzy=True)
+    service = StandInService(fixtures=None, n_candidates=n_candidates)
+    arguments = [fmap.to_args(f) for f in features]
+    queries = [geocoder._build_params(*a, **dict(k)) for a, k in arguments]
+    replies = [
+        json.dumps({'type': 'FeatureCollection',
+                    'features': service.geocode(q, CRS)}).encode('utf-8')
+        for q in queries
+    ]
+    candidates = [json.loads(r)['features'] for r in replies]
+    special = {k: v.__func__ for k, v in BKGGeocoder.special_keywords.items()}
+
+    writer = ResultWriter(layer)
+    # store the results without writing them to the layer
+    sorter = ResultWriter(layer)
+    sorter.set_bkg_result = lambda *args, **kwargs: None
+
+    return {
+        'to_args': (fmap.to_args, lambda: features),
+        'build_params': (
+            lambda a: geocoder._build_params(*a[0], **a[1]),
+            lambda: [(a, dict(k)) for a, k in arguments]),
+        'escape_special_chars': (
+            geocoder._escape_special_chars,
+            lambda: [r['strasse'] for r in rows]),
+        'add_fuzzy': (
+            fuzzy_geocoder._add_fuzzy,
+            lambda: [r['strasse'] for r in rows]),
+        'split_code_city': (
+            lambda v: special['plz_ort'](v, {}),
+            lambda: [r['plz_ort'] for r in rows]),
+        'join_number': (
+            lambda a: special['zusatz'](*a),
+            lambda: [(r['zusatz'], {'haus': r['haus']}) for r in rows]),
+        'fill_post_code': (
+            lambda v: special['plz'](v, {}),
+            lambda: [r['plz'] for r in rows]),
+        'reply_json': (
+            lambda r: r.json(),
+            lambda: [DetachedReply('http://localhost', 200, r)
+                     for r in replies]),
+        'store_bkg_results': (
+            lambda a: sorter.store_bkg_results(*a),
+            lambda: [(f, list(c)) for f, c in zip(features, candidates)]),
+        'set_bkg_result': (
+            lambda a: writer.set_bkg_result(a[0], a[1], i=0,
+                                            n_results=n_candidates),
+            lambda: [(f, c[0] if c else None)
+                     for f, c in zip(features, candidates)]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='number of generated address rows')
+    parser.add_argument('--candidates', type=int, default=5,
+                        help='number of candidates per reply')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stages', nargs='+',
+                        help='stages to run, defaults to all')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='json file to write the results to, '
+                        'printed if not given')
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows, seed=args.seed)
+    runs = []
+    for name, (func, setup) in stages(rows, args.candidates).items():
+        if args.stages and name not in args.stages:
+            continue
+        result = bench(name, func, setup, repeat=args.repeat)
+        result.update({'rows': args.rows, 'candidates': args.candidates})
+        runs.append(result)
+    write_results('micro', runs, out=args.out)
+
+
+if __name__ == '__main__':
+    main()
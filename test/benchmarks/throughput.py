@@ -0,0 +1,156 @@
+# coding=utf-8
+"""
+End-to-end throughput benchmark of the (reverse) geocoding against the local
+stand-in of the BKG service.
+
+Measures features per second, p50/p99 latency per feature and the peak
+memory of the process for every combination of the swept parameters, e.g.
+
+    python throughput.py --sizes 1000 10000 --parallel 1 4 \
+        --providers memory gpkg --latency lognormal:50:0.5 --out results.json
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+import time
+import argparse
+import tempfile
+import itertools
+
+from common import (load_csv, scale_layer, to_provider, field_map,
+                    ResultWriter, process_events_until, percentile, peak_rss,
+                    write_results, remove_dir, GEOCODE_FILE, REVERSE_FILE,
+                    CRS, PROVIDERS)
+from stand_in_server import StandInServer, LatencyModel
+
+from bkggeocoder.geocoder.bkg_geocoder import BKGGeocoder
+from bkggeocoder.geocoder.geocoder import Geocoding, ReverseGeocoding
+from bkggeocoder.geocoder.cache import ReverseCache
+
+
+class _Timed:
+    '''
+    mixin for geocoding workers to record the latency of every processed
+    feature (request and the emission of the result)
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def process(self, feature):
+        start = time.perf_counter()
+        super().process(feature)
+        self.latencies.append(time.perf_counter() - start)
+
+
+class TimedGeocoding(_Timed, Geocoding):
+    pass
+
+
+class TimedReverseGeocoding(_Timed, ReverseGeocoding):
+    pass
+
+
+def run(server: StandInServer, mode: str, size: int, parallel: int,
+        cache: bool, provider: str, directory: str) -> dict:
+    '''
+    geocode (mode "geocode") or reverse geocode (mode "reverse") a layer
+    with given number of features split among the given number of workers
+    and apply the results to the layer stored with given provider
+    '''
+    if mode == 'geocode':
+        source = scale_layer(load_csv(GEOCODE_FILE), size,
+                             vary_field='Hausnummer')
+    else:
+        source = scale_layer(load_csv(REVERSE_FILE, coordinates=True), size)
+    # own directory per run, file layers of former runs may still be open
+    layer = to_provider(source, provider, tempfile.mkdtemp(dir=directory))
+    writer = ResultWriter(layer)
+    features = list(layer.getFeatures())
+    # shared by all workers like in the UI
+    reverse_cache = ReverseCache() if cache else None
+
+    workers = []
+    for i in range(parallel):
+        chunk = features[i::parallel]
+        if not chunk:
+            continue
+        geocoder = BKGGeocoder(url=server.url, crs=CRS,
+                               reverse_cache=reverse_cache)
+        if mode == 'geocode':
+            worker = TimedGeocoding(geocoder, field_map(layer),
+                                    features=chunk)
+        else:
+            worker = TimedReverseGeocoding(geocoder, chunk)
+        worker.feature_done.connect(
+            lambda f, r: writer.store_bkg_results(f, r.json()['features']))
+        workers.append(worker)
+
+    done = []
+    errors = []
+    for worker in workers:
+        worker.finished.connect(done.append)
+        worker.error.connect(errors.append)
+    requests_before = server.service.stats['requests']
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    process_events_until(lambda: len(done) == len(workers))
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.wait()
+
+    latencies = list(itertools.chain(*[w.latencies for w in workers]))
+    return {
+        'mode': mode,
+        'size': size,
+        'parallel': parallel,
+        'cache': cache,
+        'provider': provider,
+        'success': all(done) and not errors,
+        'errors': errors,
+        'seconds': elapsed,
+        'features_per_second': len(latencies) / elapsed if elapsed else None,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+        'requests': server.service.stats['requests'] - requests_before,
+        'peak_rss_mb': peak_rss(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', default=['geocode', 'reverse'],
+                        choices=['geocode', 'reverse'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000])
+    parser.add_argument('--parallel', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--providers', nargs='+', default=['memory'],
+                        choices=list(PROVIDERS.keys()))
+    parser.add_argument('--latency', default='constant:0',
+                        help='latency of the stand-in, "kind:mean[:sigma]" '
+                        'in milliseconds')
+    parser.add_argument('--out', help='json file to write the results to, '
+                        'printed if not given')
+    args = parser.parse_args()
+
+    runs = []
+    directory = tempfile.mkdtemp()
+    server = StandInServer(latency=LatencyModel.from_string(args.latency))
+    try:
+        server.start()
+        for mode, size, parallel, provider in itertools.product(
+                args.modes, args.sizes, args.parallel, args.providers):
+            # the reverse cache only takes effect when reverse geocoding
+            caches = [False, True] if mode == 'reverse' else [False]
+            for cache in caches:
+                runs.append(run(server, mode, size, parallel, cache,
+                                provider, directory))
+    finally:
+        server.stop()
+        remove_dir(directory)
+    write_results('throughput', runs, out=args.out)
+
+
+if __name__ == '__main__':
+    main()
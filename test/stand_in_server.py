@@ -0,0 +1,546 @@
+# coding=utf-8
+"""
+Local stand-in for the BKG geocoding service.
+
+Mimics the geocoding ("geosearch" with "query", optionally restricted to the
+polygon passed as "geometry"), reverse geocoding ("geosearch" with "lat" and
+"lon") and capability ("index.xml") endpoints.
+Replies are replayed from the recorded fixtures in test_data/*.results.json
+or synthesised. Latency, error rates (400/500/timeouts) and rate limiting are
+configurable, so the geocoding stack can be tested and loaded without network.
+
+Usage as a module:
+
+    with StandInServer(latency=LatencyModel('lognormal', 50, 0.5),
+                       error_rates={500: 0.01}) as server:
+        geocoder = BKGGeocoder(url=server.url)
+
+Usage from the command line:
+
+    python stand_in_server.py --port 8080 --latency lognormal:50:0.5 \
+        --error 500:0.01 --error timeout:0.001 --rate 100
+"""
+
+__author__ = 'Christoph Franke'
+__date__ = '2026-10-19'
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+from collections import Counter
+import threading
+import argparse
+import hashlib
+import random
+import glob
+import json
+import math
+import time
+import re
+import os
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'test_data')
+
+CAPABILITIES = '''<?xml version="1.0" encoding="UTF-8"?>
+<OpenSearchDescription xmlns="http://a9.com/-/spec/opensearch/1.1/"
+    xmlns:bkg="http://www.bkg.bund.de/">
+  <ShortName>BKG Geokodierung (Stand-in)</ShortName>
+  <Query role="example" bkg:srsname="EPSG:25832" title="ETRS89 / UTM zone 32N"/>
+  <Query role="example" bkg:srsname="EPSG:25833" title="ETRS89 / UTM zone 33N"/>
+  <Query role="example" bkg:srsname="EPSG:4326" title="WGS 84"/>
+  <Query role="example" bkg:srsname="EPSG:3857" title="WGS 84 / Pseudo-Mercator"/>
+</OpenSearchDescription>
+'''
+CAPABILITIES_ETAG = '"{}"'.format(
+    hashlib.md5(CAPABILITIES.encode('utf-8')).hexdigest())
+
+# extent of Germany in the synthesised coordinates
+EXTENTS = {
+    'EPSG:4326': (5.9, 47.3, 15.0, 55.0),
+    'EPSG:3857': (656000, 5990000, 1670000, 7370000),
+    'EPSG:25833': (-90000, 5240000, 680000, 6110000),
+}
+DEFAULT_EXTENT = (280000, 5230000, 920000, 6100000)
+
+re_operator = re.compile(r'\s+(?:AND|OR)\s+')
+re_term = re.compile(r'(?:(\w+):)?\(?"?(.*?)"?\)?$')
+
+
+def normalize_query(query: str) -> tuple:
+    '''
+    canonical form of a query of the geocoder, independent of quoting,
+    brackets, escaping and fuzzy operators, unkeyed (free text) terms are
+    kept with an empty key
+    '''
+    terms = []
+    for term in re_operator.split(query.strip()):
+        key, value = re_term.match(term.strip()).groups()
+        value = re.sub(r'~[0-9.]*', '', value).replace('\\', '')
+        value = value.strip().lower()
+        if value:
+            terms.append(((key or '').lower(), value))
+    return tuple(sorted(terms))
+
+
+def parse_rings(wkt: str) -> list:
+    '''
+    rings of a (multi-)polygon in WKT as lists of x, y tuples
+    '''
+    return [[tuple(map(float, point.split()[:2]))
+             for point in ring.split(',')]
+            for ring in re.findall(r'\(([^()]+)\)', wkt)]
+
+
+def in_rings(x: float, y: float, rings: list) -> bool:
+    '''
+    point in polygon test (even-odd rule, holes are rings as well)
+    '''
+    inside = False
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            if (y1 > y) != (y2 > y) and \
+                    x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return inside
+
+
+class LatencyModel:
+    '''
+    distribution of the response times of the stand-in
+
+    Attributes
+    ----------
+    kind : str
+        "constant", "uniform" (between 0 and twice the mean) or "lognormal"
+    mean : float
+        mean latency in milliseconds
+    sigma : float
+        shape of the lognormal distribution
+    '''
+    def __init__(self, kind: str = 'constant', mean: float = 0,
+                 sigma: float = 0.5, seed: int = None):
+        if kind not in ('constant', 'uniform', 'lognormal'):
+            raise ValueError(f'unknown latency distribution "{kind}"')
+        self.kind = kind
+        self.mean = mean
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_string(cls, text: str) -> 'LatencyModel':
+        '''
+        parse "kind:mean[:sigma]", e.g. "lognormal:50:0.5"
+        '''
+        parts = text.split(':')
+        kind = parts[0]
+        mean = float(parts[1]) if len(parts) > 1 else 0
+        sigma = float(parts[2]) if len(parts) > 2 else 0.5
+        return cls(kind, mean, sigma)
+
+    def sample(self) -> float:
+        '''
+        latency of a single response in seconds
+        '''
+        if self.mean <= 0:
+            return 0
+        with self._lock:
+            if self.kind == 'constant':
+                ms = self.mean
+            elif self.kind == 'uniform':
+                ms = self._random.uniform(0, 2 * self.mean)
+            else:
+                # mean of the lognormal distribution is exp(mu + sigma^2 / 2)
+                mu = math.log(self.mean) - self.sigma ** 2 / 2
+                ms = self._random.lognormvariate(mu, self.sigma)
+        return ms / 1000
+
+
+class RateLimiter:
+    '''
+    token bucket limiting the requests per second, requests exceeding the
+    limit are answered with 429
+    '''
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class StandInService:
+    '''
+    request handling of the stand-in independent of HTTP
+
+    Attributes
+    ----------
+    geocode_fixtures : dict
+        recorded geocoding results, normalized queries as keys
+    reverse_fixtures : list
+        recorded reverse geocoding results as tuples of x, y and results
+    stats : Counter
+        number of requests, replayed and synthesised replies and errors
+    '''
+    def __init__(self, fixtures: str = TEST_DATA,
+                 latency: LatencyModel = None, error_rates: dict = None,
+                 rate: float = None, synthesize: bool = True,
+                 n_candidates: int = 5, hang: float = 30, seed: int = None,
+                 default_count: int = None):
+        '''
+        Parameters
+        ----------
+        fixtures : str, optional
+            directory with recorded results (*.results.json), defaults to
+            the test data, None to synthesise all replies
+        latency : LatencyModel, optional
+            response times, defaults to responding immediately
+        error_rates : dict, optional
+            probabilities of errors, 400, 500 and "timeout" as keys,
+            defaults to no errors
+        rate : float, optional
+            maximum number of requests per second, defaults to no limit
+        synthesize : bool, optional
+            synthesise candidates for requests not found in the fixtures,
+            otherwise empty results are returned, defaults to synthesising
+        n_candidates : int, optional
+            number of synthesised candidates per request (limited by the
+            "count" parameter), defaults to 5
+        hang : float, optional
+            seconds a request simulating a timeout is held open before the
+            connection is closed without response, defaults to 30 seconds
+        seed : int, optional
+            seed of the random errors and latencies
+        default_count : int, optional
+            number of results returned if no "count" is requested, defaults
+            to returning all results
+        '''
+        self.latency = latency or LatencyModel()
+        self.error_rates = error_rates or {}
+        self.rate_limiter = RateLimiter(rate) if rate else None
+        self.synthesize = synthesize
+        self.n_candidates = n_candidates
+        self.hang = hang
+        self.default_count = default_count
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.geocode_fixtures = {}
+        self.reverse_fixtures = []
+        if fixtures:
+            self.load_fixtures(fixtures)
+
+    def load_fixtures(self, directory: str):
+        '''
+        load the recorded results in given directory
+        '''
+        for fp in glob.glob(os.path.join(directory, '*.results.json')):
+            with open(fp, encoding='utf-8') as f:
+                recorded = json.load(f)
+            for key, results in recorded.items():
+                if key.lower().startswith('point'):
+                    x, y = map(float, re.findall(r'[-\d.]+', key)[:2])
+                    self.reverse_fixtures.append((x, y, results))
+                else:
+                    self.geocode_fixtures[normalize_query(key)] = results
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def draw_error(self):
+        '''
+        randomly drawn error to simulate, None if the request succeeds
+        '''
+        with self._lock:
+            for error, rate in self.error_rates.items():
+                if self._random.random() < rate:
+                    return error
+        return None
+
+    def handle(self, path: str, params: dict, headers: dict) -> tuple:
+        '''
+        process a request
+
+        Returns
+        ----------
+        tuple
+            status code, content type, body (bytes) and additional headers,
+            None if the request should time out
+        '''
+        self.count('requests')
+        if self.rate_limiter and not self.rate_limiter.allow():
+            self.count('rate_limited')
+            return 429, 'text/plain', b'Too Many Requests', {'Retry-After': '1'}
+        time.sleep(self.latency.sample())
+        if path.endswith('index.xml'):
+            self.count('capabilities')
+            if headers.get('if-none-match') == CAPABILITIES_ETAG:
+                return 304, 'application/xml', b'', {}
+            return (200, 'application/xml', CAPABILITIES.encode('utf-8'),
+                    {'ETag': CAPABILITIES_ETAG})
+        if not path.rstrip('/').endswith('geosearch'):
+            self.count('not_found')
+            return 404, 'text/plain', b'Not Found', {}
+        error = self.draw_error()
+        if error == 'timeout':
+            self.count('timeouts')
+            return None
+        if error == 400:
+            self.count('errors_400')
+            body = {'exceptionCode': 'InvalidParameterValue'}
+            return 400, 'application/json', json.dumps(body).encode(), {}
+        if error == 500:
+            self.count('errors_500')
+            return 500, 'text/plain', b'Internal Server Error', {}
+        crs = params.get('srsname', 'EPSG:25832')
+        count = int(params.get('count', 0)) or self.default_count
+        if 'lat' in params and 'lon' in params:
+            features = self.reverse(float(params['lon']), float(params['lat']),
+                                    crs)
+        elif params.get('query'):
+            features = self.geocode(params['query'], crs)
+            # spatial filter, applied before limiting the results
+            if params.get('geometry'):
+                rings = parse_rings(params['geometry'])
+                features = [f for f in features if in_rings(
+                    *f['geometry']['coordinates'][:2], rings)]
+        else:
+            self.count('errors_400')
+            body = {'exceptionCode': 'MissingParameterValue'}
+            return 400, 'application/json', json.dumps(body).encode(), {}
+        body = {'type': 'FeatureCollection', 'features': features[:count]}
+        return (200, 'application/json',
+                json.dumps(body, ensure_ascii=False).encode('utf-8'), {})
+
+    def geocode(self, query: str, crs: str) -> list:
+        '''
+        recorded or synthesised candidates for the query
+        '''
+        terms = normalize_query(query)
+        recorded = self.geocode_fixtures.get(terms)
+        if recorded is not None:
+            self.count('replayed')
+            return recorded
+        if not self.synthesize:
+            return []
+        self.count('synthesised')
+        rnd = random.Random(hashlib.md5(query.encode('utf-8')).hexdigest())
+        xmin, ymin, xmax, ymax = EXTENTS.get(crs, DEFAULT_EXTENT)
+        x, y = rnd.uniform(xmin, xmax), rnd.uniform(ymin, ymax)
+        values = dict(terms)
+        haus = values.get('haus', '1')
+        step = (xmax - xmin) / 10000
+        # the best candidate matches the house number, the others are
+        # additions to it (1a, 1b, ...)
+        return [self.candidate(
+            x + i * step, y + i * step, rnd.uniform(0.5, 1) / (i + 1),
+            dict(values, haus=haus + (chr(96 + i) if i else '')))
+                for i in range(self.n_candidates)]
+
+    def reverse(self, x: float, y: float, crs: str) -> list:
+        '''
+        recorded or synthesised candidates near the point
+        '''
+        for fx, fy, results in self.reverse_fixtures:
+            if abs(fx - x) < 1 and abs(fy - y) < 1:
+                self.count('replayed')
+                return results
+        if not self.synthesize:
+            return []
+        self.count('synthesised')
+        step = 0.0001 if crs == 'EPSG:4326' else 10
+        return [self.candidate(x + i * step, y, 1, {
+            'strasse': 'Synthetische Straße', 'haus': str(i + 1)})
+                for i in range(self.n_candidates)]
+
+    @staticmethod
+    def candidate(x: float, y: float, score: float, values: dict) -> dict:
+        '''
+        synthesised geojson feature matching the replies of the service
+        '''
+        strasse = values.get('strasse', 'Musterstraße').title()
+        haus = values.get('haus', '1')
+        plz = values.get('plz', '12345')
+        ort = values.get('ort', 'Musterstadt').title()
+        return {
+            'type': 'Feature',
+            'bbox': [x - 5, y - 5, x + 5, y + 5],
+            'geometry': {'type': 'Point', 'coordinates': [x, y]},
+            'properties': {
+                'text': f'{strasse} {haus}, {plz} {ort}',
+                'typ': 'Haus',
+                'score': round(score, 4),
+                'treffer': 'T' if score > 0.9 else 'F',
+                'strasse': strasse,
+                'haus': haus,
+                'plz': plz,
+                'ort': ort,
+                'gemeinde': ort,
+            }
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''
+    HTTP interface of the stand-in service
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self._respond(url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        params = parse_qs(url.query)
+        params.update(parse_qs(body))
+        self._respond(url.path, params)
+
+    def _respond(self, path: str, params: dict):
+        params = {k: v[0] for k, v in params.items()}
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        service = self.server.service
+        result = service.handle(path, params, headers)
+        if result is None:
+            # hold the connection open without answering
+            time.sleep(service.hang)
+            self.close_connection = True
+            return
+        status, content_type, body, extra_headers = result
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in extra_headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    '''
+    threaded HTTP server running the stand-in service, can be used as a
+    context manager serving in a background thread
+
+    Attributes
+    ----------
+    service : StandInService
+        the request handling, holds the statistics of the requests
+    url : str
+        service-url to pass to the BKGGeocoder
+    '''
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 verbose: bool = False, **kwargs):
+        '''
+        Parameters
+        ----------
+        host : str, optional
+            host to serve on, defaults to localhost
+        port : int, optional
+            port to serve on, defaults to a free port
+        verbose : bool, optional
+            log every request, defaults to not logging
+        **kwargs
+            parameters of the StandInService
+        '''
+        super().__init__((host, port), _Handler)
+        self.service = StandInService(**kwargs)
+        self.verbose = verbose
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/gdz_geokodierung__standin'
+
+    def start(self):
+        '''
+        serve in a background thread
+        '''
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''
+        stop serving
+        '''
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def parse_error(text: str) -> tuple:
+    '''parse "code:rate", e.g. "500:0.01" or "timeout:0.001"'''
+    error, rate = text.split(':')
+    return (error if error == 'timeout' else int(error)), float(rate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='local stand-in for the BKG geocoding service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fixtures', default=TEST_DATA,
+                        help='directory with recorded *.results.json')
+    parser.add_argument('--latency', default='constant:0',
+                        help='kind:mean_ms[:sigma], kind is constant, '
+                        'uniform or lognormal')
+    parser.add_argument('--error', action='append', default=[],
+                        help='code:rate with code 400, 500 or timeout, '
+                        'can be given multiple times')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='max. requests per second')
+    parser.add_argument('--candidates', type=int, default=5,
+                        help='number of synthesised candidates')
+    parser.add_argument('--no-synthesis', action='store_true',
+                        help='reply with empty results if not recorded')
+    parser.add_argument('--default-count', type=int, default=None,
+                        help='number of results if no count is requested')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = StandInServer(
+        host=args.host, port=args.port, verbose=args.verbose,
+        fixtures=args.fixtures,
+        latency=LatencyModel.from_string(args.latency),
+        error_rates=dict(parse_error(e) for e in args.error),
+        rate=args.rate, synthesize=not args.no_synthesis,
+        n_candidates=args.candidates, default_count=args.default_count)
+    print(f'serving BKG stand-in at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(dict(server.service.stats))
+        server.server_close()
@@ -7,9 +7,13 @@ __author__ = 'Christoph Franke'
 __date__ = '2020-03-24'
 
 import unittest
+import threading
+import time
+import tempfile
 import os
 import sys
-from qgis.core import QgsVectorLayer, QgsPoint
+from qgis.core import (QgsVectorLayer, QgsPoint, QgsPointXY, QgsGeometry,
+                       QgsFeature)
 from unittest.mock import patch
 import json
 
@@ -19,8 +23,23 @@ sys.path.append(os.path.join(os.path.dirname(
 from utilities import get_qgis_app
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
-from bkggeocoder.geocoder.bkg_geocoder import BKGGeocoder
-from bkggeocoder.geocoder.geocoder import Geocoding, FieldMap, ReverseGeocoding
+from bkggeocoder.geocoder.bkg_geocoder import (BKGGeocoder, Endpoint,
+                                               EndpointPool)
+from bkggeocoder.geocoder.geocoder import (Geocoding, FieldMap,
+                                           ReverseGeocoding, GeometryUnion,
+                                           LiveReverseGeocoding)
+from bkggeocoder.geocoder.cache import (ReverseCache, CandidateIndex,
+                                        CapabilityCache)
+from bkggeocoder.geocoder.metrics import Metrics
+from bkggeocoder.geocoder.profiling import Profiler
+from bkggeocoder.interface.utils import (DetachedReply, Request,
+                                        TrafficRecorder, ReplayTransport)
+from bkggeocoder.interface.map_tools import FeatureDragger
+from qgis.PyQt.QtCore import (QUrl, QCoreApplication, QEvent, QPoint, Qt)
+from qgis.PyQt.QtWidgets import QPushButton
+from qgis.gui import QgsMapMouseEvent
+from stand_in_server import StandInServer, StandInService, LatencyModel
+from address_generator import AddressGenerator
 
 # bkg key from environment variable (security reasons)
 UUID = os.environ.get('BKG_UUID')
@@ -43,6 +62,19 @@ def mocked_reverse_get(*args, **kwargs):
     pnt = QgsPoint(params['lon'], params['lat'])
     return MockedResponse(pnt.asWkt())
 
+def process_events_until(condition, timeout=5):
+    '''process the events of the main thread until the condition is met'''
+    start = time.perf_counter()
+    while not condition() and time.perf_counter() - start < timeout:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+def point_feature(fid, x, y):
+    feature = QgsFeature(fid)
+    feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+    return feature
+
 
 class BKGGeocodingTest(unittest.TestCase):
     """Test dialog works."""
@@ -96,6 +128,708 @@ class BKGGeocodingTest(unittest.TestCase):
         # not threaded
         geocoding.work()
 
+    def test_reverse_cache(self):
+        self.geocoder.crs = 'EPSG:25832'
+        self.geocoder.reverse_cache = ReverseCache(grid=1, max_size=2)
+        reply = DetachedReply('https://reverse', 200, b'{"features": []}')
+        with patch.object(self.geocoder.requests, 'get',
+                          return_value=reply) as mock_get:
+            self.geocoder.reverse(500000.1, 5700000.1)
+            # same grid cell -> answered from cache
+            res = self.geocoder.reverse(500000.3, 5699999.8)
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertEqual(res.json(), {'features': []})
+            # different cells, first one is discarded (least recently used)
+            self.geocoder.reverse(500010, 5700000)
+            self.geocoder.reverse(500020, 5700000)
+            self.geocoder.reverse(500000, 5700000)
+            self.assertEqual(mock_get.call_count, 4)
+
+    def test_abort_retry(self):
+        self.geocoder.retry_delay = 10
+        with patch.object(self.geocoder.requests, 'get',
+                          side_effect=ConnectionError('Timeout')):
+            threading.Timer(0.1, self.geocoder.abort).start()
+            start = time.time()
+            with self.assertRaises(InterruptedError):
+                self.geocoder.query('Berlin')
+            # waiting for the retry was interrupted
+            self.assertLess(time.time() - start, 5)
+
+    def test_reverse_connection_error(self):
+        with patch.object(self.geocoder.requests, 'get',
+                          side_effect=ConnectionError('Timeout')):
+            with self.assertRaises(ConnectionError):
+                self.geocoder.reverse(500000, 5700000)
+
+    def test_sticky_abort(self):
+        with StandInServer(latency=LatencyModel('constant', 2000)) as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832')
+            # an abortion requested before the request is made isn't lost
+            geocoder.abort()
+            start = time.perf_counter()
+            with self.assertRaises(InterruptedError):
+                geocoder.query(strasse='Teststraße', ort='Testort')
+            with self.assertRaises(InterruptedError):
+                geocoder.reverse(692697.4, 5335287.4)
+            self.assertLess(time.perf_counter() - start, 0.5)
+            request = Request()
+            request.abort()
+            with self.assertRaises(InterruptedError):
+                request.get(f'{server.url}/geosearch', params={'query': 'a'})
+            self.assertLess(time.perf_counter() - start, 1)
+            geocoder.resume()
+            server.service.latency = LatencyModel('constant', 0)
+            res = geocoder.query(strasse='Teststraße', ort='Testort')
+            self.assertEqual(res.status_code, 200)
+
+    def test_adaptive_timeout(self):
+        request = Request(adaptive_timeout=True)
+        qurl = QUrl('https://localhost/adaptive/geosearch')
+        # too few samples
+        self.assertEqual(request.timeout('GET', qurl), Request.default_timeout)
+        latency = Request.latency('GET', qurl)
+        for i in range(100):
+            latency.add(1000 if i == 99 else 100)
+        self.assertEqual(request.timeout('GET', qurl),
+                         1000 * Request.timeout_factor)
+        # latencies are recorded per method
+        self.assertEqual(request.timeout('POST', qurl),
+                         Request.default_timeout)
+
+    def test_hedge(self):
+        request = Request(hedge=True, alternatives={
+            'https://localhost/hedge': 'https://mirror/hedge'})
+        qurl = QUrl('https://localhost/hedge/geosearch?query=a')
+        latency = Request.latency('GET', qurl)
+        for i in range(100):
+            latency.add(i)
+        delay, send_hedge = request._hedge('GET', qurl, lambda q: q)
+        self.assertEqual(delay, 95)
+        self.assertEqual(send_hedge().toString(),
+                         'https://mirror/hedge/geosearch?query=a')
+        # hedge volume is capped
+        delay, send_hedge = request._hedge('GET', qurl, lambda q: q)
+        self.assertIsNone(send_hedge())
+
+    def test_hedge_traffic(self):
+        fp = os.path.join(tempfile.mkdtemp(), 'traffic.jsonl')
+        Request.recorder = TrafficRecorder(fp)
+        metrics = Metrics()
+        try:
+            with StandInServer(latency=LatencyModel('constant', 200)) as server:
+                url = f'{server.url}/geosearch'
+                # the service usually replies within 1 ms -> hedged right away
+                latency = Request.latency('GET', QUrl(f'{url}?query=a'))
+                for i in range(100):
+                    latency.add(1)
+                request = Request(hedge=True, metrics=metrics)
+                res = request.get(url, params={'query': 'a'})
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(server.service.stats['requests'], 2)
+        finally:
+            Request.recorder = None
+        # the duplicate is part of the metrics and of the recording
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['requests'], 2)
+        self.assertEqual(counters['status_200'], 1)
+        self.assertEqual(counters['status_aborted'], 1)
+        with open(fp, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 1)
+        self.assertIn('won', entries[0]['hedge'])
+        # and is replayed
+        Request.replay = ReplayTransport(fp)
+        metrics.reset()
+        try:
+            res = Request(metrics=metrics).get(url, params={'query': 'a'})
+        finally:
+            Request.replay = None
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(metrics.snapshot()['counters']['requests'], 2)
+
+    def test_endpoint_pool(self):
+        pool = EndpointPool([Endpoint(url='https://down'),
+                             Endpoint(url='https://up', max_concurrent=2)],
+                            probe_interval=None)
+        self.geocoder.pool = pool
+        reply = DetachedReply('https://up', 200, b'{"features": []}')
+        def get(url, params=None):
+            if url.startswith('https://down'):
+                raise ConnectionError('Timeout')
+            return reply
+        with patch.object(self.geocoder.requests, 'get', side_effect=get):
+            # failing member is retried on the others, it is taken out of
+            # rotation only after failing max_failures times in a row
+            for i in range(2):
+                self.geocoder.query('Berlin')
+            down, up = pool.endpoints
+            self.assertTrue(down.healthy)
+            self.assertEqual(down.failures, 2)
+            for i in range(2):
+                self.geocoder.query('Berlin')
+        self.assertFalse(down.healthy)
+        self.assertEqual(down.n_requests, EndpointPool.max_failures)
+        self.assertEqual(up.n_requests, 4)
+        self.assertEqual(up.failures, 0)
+        self.assertEqual(up.active, 0)
+        # concurrency budget of the healthy member
+        pool.acquire()
+        pool.acquire()
+        aborted = threading.Event()
+        aborted.set()
+        with self.assertRaises(InterruptedError):
+            pool.acquire(aborted=aborted)
+
+    def test_endpoint_pool_status(self):
+        pool = EndpointPool([Endpoint(url='https://busy'),
+                             Endpoint(url='https://denied'),
+                             Endpoint(url='https://up')],
+                            probe_interval=None)
+        self.geocoder.pool = pool
+        self.geocoder.retry_delay = 0
+        replies = {
+            'https://busy': DetachedReply('https://busy', 503, b''),
+            'https://denied': DetachedReply('https://denied', 401, b''),
+            'https://up': DetachedReply('https://up', 200,
+                                        b'{"features": []}'),
+        }
+        def get(url, params=None):
+            return replies[url.split('/geosearch')[0]]
+        with patch.object(self.geocoder.requests, 'get', side_effect=get):
+            # members not usable are skipped, the others take over
+            res = self.geocoder.query('Berlin')
+            self.assertEqual(res.status_code, 200)
+            busy, denied, up = pool.endpoints
+            # overloaded member gets another chance, invalid credentials not
+            self.assertTrue(busy.healthy)
+            self.assertEqual(busy.failures, 1)
+            self.assertFalse(denied.healthy)
+            # nothing usable left, the last reply is handed to the caller
+            up.healthy = False
+            replies['https://up'] = DetachedReply('https://up', 503, b'')
+            with self.assertRaises(ValueError):
+                self.geocoder.query('Berlin')
+        self.assertTrue(all(e.active == 0 for e in pool.endpoints))
+
+    def test_endpoint_pool_probe(self):
+        pool = EndpointPool([Endpoint(url='https://a'),
+                             Endpoint(url='https://b')], probe_interval=60)
+        probing = threading.Event()
+        def get_crs(url=None):
+            probing.wait(5)
+            return False, 'nicht erreichbar', []
+        with patch.object(BKGGeocoder, 'get_crs', side_effect=get_crs):
+            # probes run in the background, current health is used meanwhile
+            start = time.time()
+            endpoint = pool.acquire()
+            self.assertLess(time.time() - start, 1)
+            self.assertTrue(endpoint.healthy)
+            pool.release(endpoint)
+            # members being probed are not probed again
+            prober = pool._prober
+            pool.acquire()
+            self.assertIs(pool._prober, prober)
+            probing.set()
+            prober.join(5)
+        self.assertEqual(pool.n_healthy, 0)
+        self.assertTrue(all(e.last_probe for e in pool.endpoints))
+
+    def test_simplified_area(self):
+        # circle with lots of vertices
+        circle = QgsGeometry.fromPointXY(QgsPointXY(0, 0)).buffer(100, 500)
+        geocoder = BKGGeocoder(UUID, area_wkt=circle.asWkt(),
+                               simplify_area=True, area_max_vertices=50)
+        def point(text, x, y):
+            return {'type': 'Feature', 'properties': {'text': text},
+                    'geometry': {'type': 'Point', 'coordinates': [x, y]}}
+        content = json.dumps({'features': [point('inside', 10, 10),
+                                           point('outside', 99, 99)]})
+        reply = DetachedReply('https://post', 200, content.encode('utf-8'))
+        with patch.object(geocoder.requests, 'post',
+                          return_value=reply) as mock_post:
+            res = geocoder.query('Berlin')
+        sent = QgsGeometry.fromWkt(geocoder.params['geometry'])
+        self.assertLessEqual(sent.constGet().nCoordinates(), 50)
+        self.assertTrue(sent.contains(circle))
+        self.assertEqual([f['properties']['text']
+                          for f in res.json()['features']], ['inside'])
+        # filtered json is handed over as is, serialized only on demand
+        self.assertEqual(json.loads(res.content), res.json())
+
+    def test_simplified_area_count(self):
+        circle = QgsGeometry.fromPointXY(QgsPointXY(0, 0)).buffer(100, 500)
+        geocoder = BKGGeocoder(UUID, area_wkt=circle.asWkt(),
+                               simplify_area=True, area_max_vertices=4,
+                               count=2)
+        def point(text, x, y):
+            return {'type': 'Feature', 'properties': {'text': text},
+                    'geometry': {'type': 'Point', 'coordinates': [x, y]}}
+        # best match in the simplified area but outside of the exact one
+        content = json.dumps({'features': [point('envelope', 99, 99),
+                                           point('inside1', 10, 10),
+                                           point('inside2', 20, 20),
+                                           point('inside3', 30, 30)]})
+        reply = DetachedReply('https://post', 200, content.encode('utf-8'))
+        with patch.object(geocoder.requests, 'post',
+                          return_value=reply) as mock_post:
+            res = geocoder.query('Berlin')
+        sent = QgsGeometry.fromWkt(geocoder.params['geometry'])
+        self.assertTrue(sent.contains(QgsGeometry.fromPointXY(
+            QgsPointXY(99, 99))))
+        # over-fetched, the count is applied after filtering by the exact area
+        self.assertEqual(geocoder.params['count'],
+                         2 * BKGGeocoder.area_overfetch)
+        self.assertEqual([f['properties']['text']
+                          for f in res.json()['features']],
+                         ['inside1', 'inside2'])
+
+    def test_simplified_area_results(self):
+        circle = QgsGeometry.fromPointXY(QgsPointXY(0, 0)).buffer(100, 500)
+        directory = tempfile.mkdtemp()
+        # candidates in the corners of the bounding box of the circle rank
+        # above the ones in the circle
+        corners = [StandInService.candidate(x, y, 1, {'haus': str(i)})
+                   for i, (x, y) in enumerate([(95, 95), (-95, 95),
+                                               (95, -95), (-95, -95)])]
+        inside = [StandInService.candidate(i, i, 0.9 - i / 100,
+                                           {'haus': str(10 + i)})
+                  for i in range(15)]
+        with open(os.path.join(directory, 'area.results.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump({'ort:Testort': corners + inside}, f)
+        with StandInServer(fixtures=directory, synthesize=False,
+                           default_count=BKGGeocoder.default_count) as server:
+            for count in [None, 3]:
+                results = []
+                for simplify in [False, True]:
+                    geocoder = BKGGeocoder(
+                        url=server.url, area_wkt=circle.asWkt(),
+                        simplify_area=simplify, area_max_vertices=4,
+                        count=count)
+                    res = geocoder.query(ort='Testort')
+                    results.append([f['properties']['text']
+                                    for f in res.json()['features']])
+                # same results as with the exact area
+                self.assertEqual(results[0], results[1])
+                self.assertEqual(len(results[0]),
+                                 count or BKGGeocoder.default_count)
+
+    def test_geometry_union(self):
+        squares = [QgsGeometry.fromWkt(
+            f'POLYGON(({i} 0, {i + 2} 0, {i + 2} 2, {i} 2, {i} 0))')
+            for i in range(10)]
+        union = GeometryUnion(squares)
+        # not threaded
+        self.assertTrue(union.work())
+        self.assertAlmostEqual(union.union.area(), 22)
+        with self.assertRaises(ValueError):
+            GeometryUnion([]).work()
+
+    def test_capability_cache(self):
+        url = BKGGeocoder.capabilities_url(key='abc')
+        self.assertTrue(url.endswith('gdz_geokodierung__abc/index.xml'))
+        with tempfile.TemporaryDirectory() as tmp:
+            file_path = os.path.join(tmp, 'capabilities.json')
+            cache = CapabilityCache(file_path=file_path)
+            self.assertIsNone(cache.get(url))
+            self.assertEqual(cache.validation_headers(url), {})
+            cache.put(url, True, '', [('EPSG:4326', 'WGS 84')], etag='"1"')
+            # restored from file
+            cache = CapabilityCache(file_path=file_path)
+            cache.load()
+            self.assertEqual(cache.get(url)['codes'], [('EPSG:4326', 'WGS 84')])
+            self.assertEqual(cache.validation_headers(url),
+                             {'If-None-Match': '"1"'})
+        reply = DetachedReply(url, None, b'')
+        success, msg, codes = BKGGeocoder.parse_crs(reply)
+        self.assertFalse(success)
+
+    def test_detached_reply(self):
+        reply = DetachedReply('https://localhost', 200, b'{"features": []}',
+                              headers={'ETag': '"1"'})
+        self.assertEqual(reply.raw_header('etag'), '"1"')
+        self.assertEqual(reply.raw_header('Last-Modified'), '')
+        self.assertEqual(reply.json(), {'features': []})
+        # parsed only once
+        self.assertIs(reply.json(), reply.json())
+        self.assertEqual(bytes(reply.view[:2]), b'{"')
+        # no references to Qt objects, no per-instance dict
+        self.assertFalse(hasattr(reply, '__dict__'))
+
+    def test_result_count(self):
+        self.geocoder.count = 3
+        reply = DetachedReply('https://count', 200, b'{"features": []}')
+        with patch.object(self.geocoder.requests, 'get',
+                          return_value=reply) as mock_get:
+            self.geocoder.query('Berlin')
+            self.assertEqual(mock_get.call_args[1]['params']['count'], 3)
+            self.geocoder.reverse(500000, 5700000)
+            self.assertEqual(mock_get.call_args[1]['params']['count'], 3)
+
+    def test_stand_in_service(self):
+        with StandInServer() as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832')
+            # replayed from the recorded fixtures
+            res = geocoder.query(strasse='Alexandrastraße', haus='4',
+                                 plz='80538', ort='München')
+            features = res.json()['features']
+            self.assertEqual(features[0]['properties']['text'],
+                             'Alexandrastraße 4, 80538 München - Altstadt-Lehel')
+            # synthesised
+            geocoder.count = 2
+            res = geocoder.query(strasse='Teststraße', ort='Testort')
+            self.assertEqual(len(res.json()['features']), 2)
+            res = geocoder.reverse(692697.39684, 5335287.45367)
+            self.assertGreater(len(res.json()['features']), 0)
+            success, msg, codes = BKGGeocoder.get_crs(url=server.url)
+            self.assertTrue(success)
+            self.assertIn('EPSG:25832', [c[0] for c in codes])
+            self.assertEqual(server.service.stats['replayed'], 2)
+        with StandInServer(error_rates={500: 1}) as server:
+            geocoder = BKGGeocoder(url=server.url)
+            with self.assertRaises(ValueError):
+                geocoder.query('Berlin')
+
+    def test_stand_in_free_text(self):
+        directory = tempfile.mkdtemp()
+        berlin = StandInService.candidate(0, 0, 1, {'ort': 'Berlin'})
+        with open(os.path.join(directory, 'text.results.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump({'"Berlin"': [berlin]}, f)
+        service = StandInService(fixtures=directory, synthesize=False)
+        # free text terms are part of the key of the recorded results
+        self.assertEqual(service.geocode('Berlin~', 'EPSG:25832'), [berlin])
+        self.assertEqual(service.geocode('"München"', 'EPSG:25832'), [])
+        self.assertEqual(service.geocode('"Berlin" AND plz:(10707)',
+                                         'EPSG:25832'), [])
+
+    def test_async_post(self):
+        data = b'query=Berlin&count=2'
+        content_type = 'application/x-www-form-urlencoded'
+        requests = Request(synchronous=False)
+        finished = []
+        errors = []
+        requests.finished.connect(finished.append)
+        requests.error.connect(errors.append)
+        with StandInServer() as server:
+            requests.post(f'{server.url}/geosearch', data=data,
+                          content_type=content_type)
+            self.assertTrue(process_events_until(lambda: finished))
+            self.assertEqual(finished[0].status_code, 200)
+            self.assertEqual(len(finished[0].json()['features']), 2)
+            self.assertEqual(errors, [])
+        # error is emitted, the reply is finished nonetheless
+        finished.clear()
+        with StandInServer(error_rates={500: 1}) as server:
+            requests.post(f'{server.url}/geosearch', data=data,
+                          content_type=content_type)
+            self.assertTrue(process_events_until(lambda: finished))
+            self.assertEqual(finished[0].status_code, 500)
+            self.assertEqual(len(errors), 1)
+        # aborted requests emit neither signal
+        finished.clear()
+        errors.clear()
+        with StandInServer(latency=LatencyModel('constant', 500)) as server:
+            requests.post(f'{server.url}/geosearch', data=data,
+                          content_type=content_type)
+            self.assertEqual(requests.running, 1)
+            process_events_until(lambda: False, timeout=0.1)
+            requests.abort()
+            self.assertTrue(process_events_until(
+                lambda: requests.running == 0, timeout=1))
+            process_events_until(lambda: False, timeout=1)
+            self.assertEqual(finished, [])
+            self.assertEqual(errors, [])
+            self.assertEqual(server.service.stats['requests'], 1)
+
+    def test_address_generator(self):
+        directory = tempfile.mkdtemp()
+        fp = os.path.join(directory, 'adressen.csv')
+        generator = AddressGenerator(duplicate_rate=0.2, typo_rate=0.2,
+                                     seed=1)
+        generator.write(fp, 50, variants=['zusatz', 'plz_ort'])
+        layer = QgsVectorLayer(f'file:/{fp}?delimiter=";"', 'test',
+                               'delimitedtext')
+        self.assertEqual(layer.featureCount(), 50)
+        # the columns are assigned to the keywords automatically
+        field_map = FieldMap(layer, keywords=BKGGeocoder.keywords)
+        self.assertEqual(field_map.keyword('Hausnummer_Zusatz'), 'zusatz')
+        self.assertEqual(field_map.keyword('PLZ_Ort'), 'plz_ort')
+        self.assertEqual(field_map.count_active(), 4)
+        with StandInServer(fixtures=directory, synthesize=False) as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832')
+            for feature in layer.getFeatures():
+                args, kwargs = field_map.to_args(feature)
+                features = geocoder.query(*args, **kwargs).json()['features']
+                self.assertEqual(len(features), 1)
+            self.assertEqual(server.service.stats['replayed'], 50)
+
+    def test_record_replay(self):
+        fp = os.path.join(tempfile.mkdtemp(), 'traffic.jsonl')
+        Request.recorder = TrafficRecorder(fp, redact=['standin'])
+        try:
+            with StandInServer(latency=LatencyModel('constant', 20)) as server:
+                geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832')
+                recorded = geocoder.query(strasse='Teststraße',
+                                          ort='Testort').json()
+        finally:
+            Request.recorder = None
+        with open(fp, encoding='utf-8') as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(entry['params']['srsname'], 'EPSG:25832')
+        self.assertNotIn('standin', entry['url'])
+        self.assertGreaterEqual(entry['latency'], 20)
+        Request.replay = ReplayTransport(fp, redact=['standin'])
+        try:
+            # the server is down, the reply is served from the recording
+            res = geocoder.query(strasse='Teststraße', ort='Testort')
+            self.assertEqual(res.json(), recorded)
+            with self.assertRaises(ConnectionError):
+                Request.replay.reply('GET', f'{server.url}/geosearch?query=a')
+        finally:
+            Request.replay = None
+
+        # rotation
+        fp = os.path.join(tempfile.mkdtemp(), 'traffic.jsonl')
+        recorder = TrafficRecorder(fp, max_bytes=1, backups=2)
+        for i in range(4):
+            reply = DetachedReply('https://localhost', 200, str(i).encode())
+            recorder.record('GET', f'https://localhost?i={i}', b'', 1,
+                            reply=reply)
+        self.assertTrue(os.path.exists(f'{fp}.2'))
+        self.assertFalse(os.path.exists(f'{fp}.3'))
+        replay = ReplayTransport(fp)
+        self.assertEqual(len(replay), 3)
+        res, latency, hedge = replay.reply('GET', 'https://localhost?i=3')
+        self.assertEqual(res.content, b'3')
+        self.assertIsNone(hedge)
+
+    def test_metrics(self):
+        metrics = Metrics()
+        with StandInServer() as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832',
+                                   metrics=metrics)
+            for i in range(2):
+                geocoder.query(strasse='Teststraße', ort='Testort')
+        snapshot = metrics.snapshot()
+        counters = snapshot['counters']
+        self.assertEqual(counters['requests'], 2)
+        self.assertEqual(counters['status_200'], 2)
+        self.assertEqual(counters['duplicate_queries'], 1)
+        self.assertGreater(counters['bytes_in'], 0)
+        self.assertEqual(snapshot['histograms']['network']['count'], 2)
+        directory = tempfile.mkdtemp()
+        metrics.export(os.path.join(directory, 'metriken.json'))
+        metrics.export(os.path.join(directory, 'metriken.csv'))
+        with open(os.path.join(directory, 'metriken.json')) as f:
+            self.assertEqual(json.load(f)['counters'], counters)
+        with open(os.path.join(directory, 'metriken.csv')) as f:
+            self.assertIn('requests;count;2', f.read())
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()['counters'], {})
+        # only the most recent keys are remembered
+        metrics = Metrics(seen_window=2)
+        self.assertFalse(metrics.seen('a'))
+        self.assertFalse(metrics.seen('b'))
+        self.assertTrue(metrics.seen('a'))
+        self.assertFalse(metrics.seen('c'))
+        self.assertFalse(metrics.seen('b'))
+        self.assertTrue(metrics.seen('c'))
+
+    def test_geocoding_stats(self):
+        layer = QgsVectorLayer('Point?crs=epsg:25832', 'test', 'memory')
+        features = []
+        for x, y in [(692697.4, 5335287.4), (692697.6, 5335287.5),
+                     (692800, 5335300)]:
+            feature = QgsFeature(layer.fields())
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            features.append(feature)
+        metrics = Metrics()
+        with StandInServer() as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832',
+                                   reverse_cache=ReverseCache(grid=1),
+                                   metrics=metrics)
+            geocoding = ReverseGeocoding(geocoder, features, metrics=metrics,
+                                         stats_interval=0)
+            geocoding.start()
+            geocoding.wait()
+        stats = geocoding.collect_stats()
+        self.assertEqual(stats['done'], 3)
+        self.assertEqual(stats['total'], 3)
+        self.assertGreater(stats['features_per_s'], 0)
+        self.assertGreater(stats['requests_per_s'], 0)
+        self.assertEqual(stats['concurrency'], 0)
+        # the second point is in the same cell of the cache as the first one
+        self.assertAlmostEqual(stats['cache_hit_rate'], 1 / 3)
+        self.assertEqual(stats['eta'], 0)
+
+    def test_profiling(self):
+        directory = tempfile.mkdtemp()
+        with StandInServer() as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832')
+            for mode in ['timers', 'sampling', 'cprofile']:
+                with Profiler(mode=mode, interval=1) as profiler:
+                    geocoding = ReverseGeocoding(geocoder, [],
+                                                 stats_interval=0)
+                    for i in range(3):
+                        geocoder.query(strasse='Teststraße', ort='Testort')
+                    geocoding.work()
+                summary = profiler.summary()
+                self.assertEqual(summary['query']['count'], 3)
+                self.assertEqual(summary['work']['count'], 1)
+                if mode == 'cprofile':
+                    # one profile per thread, reused by all of its phases
+                    self.assertEqual(len(profiler._profiles), 1)
+                written = profiler.save(os.path.join(directory, mode))
+                with open(os.path.join(directory, f'{mode}_phasen.folded'),
+                          encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+                # collapsed stacks: frames separated by ";" and a count
+                self.assertIn('MainThread;query', [l.rsplit(' ', 1)[0]
+                                                   for l in lines])
+                self.assertTrue(all(l.rsplit(' ', 1)[1].isdigit()
+                                    for l in lines))
+            self.assertIn(os.path.join(directory, 'cprofile.prof'), written)
+        self.assertIsNone(Profiler.active)
+        with self.assertRaises(ValueError):
+            Profiler(mode='unbekannt')
+
+    def test_reverse_cache_save_error(self):
+        directory = tempfile.mkdtemp()
+        # a directory can't be opened as a file for writing
+        cache = ReverseCache(file_path=directory)
+        reply = DetachedReply('https://reverse', 200, b'{"features": []}')
+        cache.put(500000, 5700000, 'EPSG:25832', reply)
+        cache.save()
+        self.assertEqual(len(cache), 1)
+
+    def test_reverse_cache_load_error(self):
+        directory = tempfile.mkdtemp()
+        file_path = os.path.join(directory, 'reverse_cache.json')
+        # malformed rows resp. no list at the top level
+        for stored in [[['EPSG:25832', 1, 2]], {'a': 1}, [1, 2], 'kaputt']:
+            with open(file_path, 'w') as f:
+                json.dump(stored, f)
+            cache = ReverseCache(file_path=file_path)
+            cache.load()
+            self.assertEqual(len(cache), 0)
+
+    def test_live_reverse(self):
+        with StandInServer(latency=LatencyModel('constant', 1000)) as server:
+            geocoder = BKGGeocoder(url=server.url, crs='EPSG:25832')
+            worker = LiveReverseGeocoding(geocoder)
+            done = []
+            finished = []
+            worker.feature_done.connect(lambda f, r: done.append(f.id()))
+            worker.finished.connect(finished.append)
+            worker.start()
+            worker.request(point_feature(1, 692697.4, 5335287.4))
+            time.sleep(0.2)
+            # supersedes and aborts the request of the first feature
+            start = time.perf_counter()
+            worker.request(point_feature(2, 692800, 5335300))
+            self.assertTrue(process_events_until(lambda: done))
+            self.assertLess(time.perf_counter() - start, 1.8)
+            process_events_until(lambda: False, timeout=0.5)
+            self.assertEqual(done, [2])
+            # killing stops the worker without waiting for the request
+            worker.request(point_feature(3, 692900, 5335300))
+            time.sleep(0.2)
+            start = time.perf_counter()
+            worker.kill()
+            self.assertTrue(worker.wait(5000))
+            self.assertLess(time.perf_counter() - start, 0.8)
+            self.assertTrue(process_events_until(lambda: finished))
+            self.assertEqual(finished, [True])
+            self.assertEqual(done, [2])
+
+    def test_live_reverse_error(self):
+        geocoder = BKGGeocoder(UUID, crs='EPSG:25832')
+        reply = DetachedReply('https://reverse', 200, b'{"features": []}')
+        worker = LiveReverseGeocoding(geocoder)
+        done = []
+        warnings = []
+        worker.feature_done.connect(lambda f, r: done.append(f.id()))
+        worker.warning.connect(warnings.append)
+        with patch.object(geocoder.requests, 'get',
+                          side_effect=[ConnectionError('Timeout'), reply]):
+            worker.start()
+            worker.request(point_feature(1, 692697.4, 5335287.4))
+            self.assertTrue(process_events_until(lambda: warnings))
+            # the failed request doesn't end the worker
+            self.assertTrue(worker.isRunning())
+            worker.request(point_feature(2, 692800, 5335300))
+            self.assertTrue(process_events_until(lambda: done))
+        self.assertEqual(done, [2])
+        worker.kill()
+        self.assertTrue(worker.wait(5000))
+
+    def test_feature_dragger(self):
+        dragger = FeatureDragger(QPushButton(), canvas=CANVAS, pause_delay=100)
+        paused = []
+        resumed = []
+        dragger.drag_paused.connect(lambda fid, p: paused.append(fid))
+        dragger.drag_resumed.connect(lambda: resumed.append(True))
+
+        def event(kind, x, y):
+            return QgsMapMouseEvent(CANVAS, kind, QPoint(x, y), Qt.LeftButton,
+                                    Qt.LeftButton, Qt.NoModifier)
+
+        # feature already picked, no need to identify it on the canvas
+        dragger._picked_feature = 1
+        dragger.canvasPressEvent(event(QEvent.MouseButtonPress, 10, 10))
+        dragger.canvasMoveEvent(event(QEvent.MouseMove, 20, 20))
+        # not paused before the mouse rested for the set delay
+        process_events_until(lambda: False, timeout=0.03)
+        self.assertEqual(paused, [])
+        self.assertTrue(process_events_until(lambda: paused, timeout=1))
+        self.assertEqual(paused, [1])
+        self.assertEqual(resumed, [])
+        dragger.canvasMoveEvent(event(QEvent.MouseMove, 30, 30))
+        self.assertEqual(resumed, [True])
+        self.assertTrue(process_events_until(lambda: len(paused) == 2,
+                                             timeout=1))
+        # releasing resumes the paused dragging
+        dragger.canvasReleaseEvent(event(QEvent.MouseButtonRelease, 30, 30))
+        self.assertEqual(resumed, [True, True])
+        process_events_until(lambda: False, timeout=0.2)
+        self.assertEqual(len(paused), 2)
+        dragger.reset()
+
+    def test_candidate_index(self):
+        def candidate(text, x, y):
+            return {'geometry': {'type': 'Point', 'coordinates': [x, y]},
+                    'properties': {'text': text}}
+        index = CandidateIndex(max_distance=100)
+        index.add([candidate('a', 10, 0), candidate('b', 50, 0),
+                   candidate('c', 500, 0)], 'EPSG:25832')
+        # duplicates are not indexed twice
+        index.add([candidate('a', 10, 0)], 'EPSG:25832')
+        self.assertEqual(len(index), 3)
+        point = QgsPointXY(0, 0)
+        nearest = index.nearest(point, 'EPSG:25832', n=5)
+        self.assertEqual([c['properties']['text'] for c in nearest],
+                         ['a', 'b'])
+        self.assertEqual(index.nearest(point, 'EPSG:4326'), [])
+        merged = CandidateIndex.merge(
+            point, [candidate('d', 30, 0), candidate('a', 10, 0)], nearest)
+        self.assertEqual([c['properties']['text'] for c in merged],
+                         ['a', 'd', 'b'])
+        # modifying added or returned candidates doesn't change the index
+        added = candidate('e', 20, 0)
+        index.add([added], 'EPSG:25832')
+        added['properties']['score'] = 1
+        added['geometry']['coordinates'][0] = 1000
+        nearest = index.nearest(point, 'EPSG:25832', n=5)
+        nearest[0]['properties']['text'] = 'x'
+        nearest = index.nearest(point, 'EPSG:25832', n=5)
+        self.assertEqual([c['properties']['text'] for c in nearest],
+                         ['a', 'e', 'b'])
+        self.assertNotIn('score', nearest[1]['properties'])
+        self.assertEqual(nearest[1]['geometry']['coordinates'], [20, 0])
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(BKGGeocodingTest)
     runner = unittest.TextTestRunner(verbosity=2)